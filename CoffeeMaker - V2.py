@@ -1,15 +1,26 @@
 import os
 import sys
 import time
-import json
+import socket
 import imaplib
-import smtplib
-import email
 from email.message import EmailMessage
-import traceback
-import RPi.GPIO as GPIO
 
 from drinks import drink_list
+from catalog import RecipeCatalog, load_catalog
+from pour_scheduler import PourScheduler
+from flow_model import pour_jobs
+from pump_driver import make_driver
+from pump_index import PumpIndex
+from config_store import ConfigStore
+from inventory import Inventory
+from mailbox_listener import MailboxListener, fetch_text_bodies
+from confirmations import ConfirmationSender
+from order_queue import OrderQueue
+from order_pipeline import OrderPipeline
+from pour_planner import PourPlanner, plan_queue
+from fleet import Coordinator, StationClient
+from maintenance import Maintenance
+import metrics
 from keys import gmail_key, main_email, receive_email
 
 # -----------------------------------------------------------------------------
@@ -26,29 +37,46 @@ IMAP_SERVER = "imap.gmail.com"
 SMTP_SERVER = "smtp.gmail.com"
 SUBJECT_FILTER = "Coffee Decision"
 SMS_GATEWAY_ADDRESS = receive_email()  # recipient and reply-from for SMS
-POLL_INTERVAL = 15  # seconds between mailbox checks
+POLL_INTERVAL = 15  # seconds between NOOP checks if the server lacks IDLE
+ORDER_DB = "orders.db"  # persistent order queue; survives restarts
+CATALOG_FILE = None     # optional JSON/CSV recipe file used instead of drinks.py
+INVENTORY_LOG = "inventory.log"  # reservoir levels; see `python inventory.py`
 
-FLOW_RATE = 60.0 / 100.0   # seconds per mL (adjust as needed)
+FLOW_RATE = 60.0 / 100.0   # seconds per mL for pumps without a calibrated flow_rate
+MAX_CONCURRENT_PUMPS = 6   # pumps allowed on at once (limited by the pump supply)
+TIMING_TOLERANCE = 0.005   # seconds of on-time error before a pour is flagged
+PLAN_POSITIONS = 2         # glass positions the queue is planned for in pour_plan_saved_seconds
+PLAN_LOOKAHEAD = 3
+PUMP_DRIVER = os.environ.get("PUMP_DRIVER", "gpio")  # "simulated" / "recording" run without a Pi
+METRICS_PORT = 9108        # Prometheus-style /metrics; None disables it
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")  # 0.0.0.0 to be scraped from the LAN
+IDLE_MAINTENANCE = os.environ.get("IDLE_MAINTENANCE") == "1"  # prime changed bottles while idle; pours unattended, so off by default
 
-with open('pump_config.json', 'r') as f:
-    pump_configuration = json.load(f)
+# Several machines on one inbox: one runs FLEET_ROLE=coordinator (reads mail,
+# routes orders), the others FLEET_ROLE=station (pour what they are sent).
+FLEET_ROLE = os.environ.get("FLEET_ROLE")      # None runs standalone
+FLEET_ADDRESS = (os.environ.get("FLEET_HOST", "127.0.0.1"), 9200)  # coordinator: interface to listen on
+STATION_NAME = socket.gethostname()
+station = None
+
+# re-read whenever the console bartender (or anyone) reassigns a pump
+config_store = ConfigStore("pump_config.json")
+pump_configuration = config_store.load()
+catalog = load_catalog(CATALOG_FILE) if CATALOG_FILE else RecipeCatalog(drink_list)
+pump_index = PumpIndex(pump_configuration, catalog)
 
 # -----------------------------------------------------------------------------
-# ───────────────────────────── GPIO INITIALISATION ────────────────────────────
+# ───────────────────────────── PUMP INITIALISATION ────────────────────────────
 # -----------------------------------------------------------------------------
-GPIO.setmode(GPIO.BCM)
-GPIO.setwarnings(False)
-for pump in pump_configuration.values():
-    GPIO.setup(pump["pin"], GPIO.OUT, initial=GPIO.HIGH)
+pumps = make_driver(PUMP_DRIVER)   # pump_driver.ACTIVE_LOW polarity, shared with pump_test.py
+pumps.setup(pump["pin"] for pump in pump_configuration.values())
 
 # -----------------------------------------------------------------------------
 # ────────────────────────────── HELPER FUNCTIONS ──────────────────────────────
 # -----------------------------------------------------------------------------
 
-def pour(pin: int, wait_time: float):
-    GPIO.output(pin, GPIO.LOW)
-    time.sleep(wait_time)
-    GPIO.output(pin, GPIO.HIGH)
+scheduler = PourScheduler(pumps.on, pumps.off, MAX_CONCURRENT_PUMPS,
+                          clock=pumps.clock.now, sleep=pumps.clock.sleep)
 
 
 def safe_print(*args, **kwargs):
@@ -57,6 +85,12 @@ def safe_print(*args, **kwargs):
     except Exception:
         pass
 
+
+# where an order's time goes; `python metrics.py` summarises a running daemon
+ORDERS = metrics.counter("orders_total", "SMS orders by outcome")
+STAGES = metrics.histogram("order_stage_seconds",
+                           "Seconds per order stage: poll, fetch, queue, pour, sms, end_to_end")
+
 # -----------------------------------------------------------------------------
 # ──────────────────────────── EMAIL I/O FUNCTIONS ─────────────────────────────
 # -----------------------------------------------------------------------------
@@ -64,92 +98,235 @@ def safe_print(*args, **kwargs):
 def get_unread_commands(mail: imaplib.IMAP4_SSL):
     mail.select("inbox")
     # only process unread SMS replies from the phone
-    typ, data = mail.search(None, f'(UNSEEN SUBJECT "{SUBJECT_FILTER}" FROM "{SMS_GATEWAY_ADDRESS}")')
+    typ, data = mail.uid("SEARCH", None, f'(UNSEEN SUBJECT "{SUBJECT_FILTER}" FROM "{SMS_GATEWAY_ADDRESS}")')
     if typ != "OK":
         return []
 
-    commands = []
-    for uid in data[0].split():
-        typ, msg_data = mail.fetch(uid, "(RFC822)")
-        if typ != "OK":
-            continue
-        raw_msg = msg_data[0][1]
-        msg = email.message_from_bytes(raw_msg)
-        payload = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition")):
-                    payload = part.get_payload(decode=True).decode()
-                    break
-        else:
-            payload = msg.get_payload(decode=True).decode()
-
-        drink_name = payload.strip().lower()
-        commands.append((uid, drink_name))
-    return commands
-
-
-def send_confirmation(drink_name: str):
+    # one UID FETCH for the whole burst; PEEK keeps the messages unread until
+    # their orders have been queued
+    arrivals = {}
+    with STAGES.time(stage="fetch"):
+        bodies = fetch_text_bodies(mail, data[0].split(), arrivals)
+    # INTERNALDATE has whole seconds, so this over-reports by up to 1 s
+    now = time.time()
+    for arrived in arrivals.values():
+        STAGES.observe(max(0.0, now - arrived), stage="poll")
+    return [(uid, text.strip().lower()) for uid, text in bodies.items()]
+
+
+confirmations = ConfirmationSender(SMTP_SERVER, EMAIL_ADDRESS, EMAIL_PASSWORD, log=safe_print)
+orders = OrderQueue(ORDER_DB, log=safe_print)
+inventory = Inventory(pump_index, INVENTORY_LOG, log=safe_print)
+reserved = {}   # drink name -> the recipe last reserved for it, in case it leaves the menu
+
+
+def reserve(drink):
+    if not inventory.reserve_for(drink):
+        return False
+    reserved[drink["name"].lower()] = drink
+    return True
+
+
+def release_order(order):
+    """Returns the reservation of an order that fails before it pours."""
+    drink = reserved.get(order.drink.lower())
+    if drink is not None:
+        inventory.release(drink)
+
+
+# orders queued before a restart still get their share of the bottles
+for _order in orders.pending():
+    _drink = catalog.find(_order.drink)
+    if _drink is not None and not reserve(_drink):
+        safe_print(f"Not enough left for queued {_order.drink}; it will pour short.")
+# cleaning and priming share the scheduler; a pour stops them at once
+maintenance = Maintenance(scheduler, pump_configuration, queue=orders, consume=inventory.consume_jobs,
+                          flow_rate=FLOW_RATE, log=safe_print)
+
+
+def send_sms(subject: str, body: str, on_sent=None):
     msg = EmailMessage()
-    msg["Subject"] = f"{drink_name.title()} ready – {SUBJECT_FILTER}"
+    msg["Subject"] = subject
     msg["From"] = EMAIL_ADDRESS
     msg["To"] = SMS_GATEWAY_ADDRESS
-    msg.set_content(f"Your {drink_name.title()} has been prepared. Enjoy! 😊")
+    msg.set_content(body)
+    queued = time.monotonic()
+
+    def sent():
+        STAGES.observe(time.monotonic() - queued, stage="sms")
+        if on_sent:
+            on_sent()
+
+    # queued for the background sender; the next pour does not wait on SMTP
+    confirmations.send(msg, sent)
+
+
+def send_confirmation(drink_name: str, on_sent=None):
+    send_sms(f"{drink_name.title()} ready – {SUBJECT_FILTER}",
+             f"Your {drink_name.title()} has been prepared. Enjoy! 😊", on_sent)
+
+
+def send_acknowledgement(drink_name: str, ahead: int):
+    send_sms(f"{drink_name.title()} received – {SUBJECT_FILTER}",
+             f"Got your {drink_name.title()} order, {ahead} drink(s) ahead of you.")
 
-    with smtplib.SMTP_SSL(SMTP_SERVER, 465) as smtp:
-        smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        smtp.send_message(msg)
+
+def send_rejection(drink_name: str, missing):
+    reason = f" (not enough {', '.join(missing)})" if missing else ""
+    send_sms(f"{drink_name.title()} unavailable – {SUBJECT_FILTER}",
+             f"Sorry, we can't make a {drink_name.title()} right now{reason}.")
+
+
+def send_failure(drink_name: str):
+    send_sms(f"{drink_name.title()} failed – {SUBJECT_FILTER}",
+             f"Sorry, your {drink_name.title()} could not be made. Please order again.")
 
 # -----------------------------------------------------------------------------
 # ────────────────────────────── DRINK LOGIC ───────────────────────────────────
 # -----------------------------------------------------------------------------
 
 def find_drink_by_name(name: str):
-    for drink in drink_list:
-        if drink["name"].lower() == name:
-            return drink
-    return None
+    return catalog.find(name)
+
+
+def reload_pumps(configuration):
+    """Swaps in a pump configuration changed on disk; the next pour uses it."""
+    global pump_configuration, pump_index
+    new_pins = {p["pin"] for p in configuration.values()} - {p["pin"] for p in pump_configuration.values()}
+    pumps.setup(new_pins)
+    # one assignment, so a pour starting now sees either the old or the new index
+    pump_index = PumpIndex(configuration, catalog)
+    pump_configuration = configuration
+    inventory.rebind(pump_index)
+    maintenance.update(configuration)
+    if station is not None:
+        station.update(configuration)
+    safe_print("Pump configuration reloaded: " +
+               ", ".join(f"{p['name']}={p['value']}" for _, p in sorted(configuration.items())))
 
 
 def pour_drink(drink):
     safe_print(f"Pouring {drink['name']}…")
-    for ingredient, amount in drink['ingredients'].items():
-        for pump in pump_configuration.values():
-            if ingredient.lower() == pump['value'].lower():
-                wait_time = amount * FLOW_RATE
-                pour(pump['pin'], wait_time)
-                safe_print(f"  → {amount} mL of {ingredient}")
+    index = pump_index
+    # per-pump calibrated on-times; pumps sharing an ingredient split its dose
+    jobs = pour_jobs(drink, index.pump_configuration, index, FLOW_RATE)
+    # all matching pumps run together, so the drink takes max(t) instead of sum(t)
+    try:
+        with STAGES.time(stage="pour"), maintenance.pouring(jobs):
+            scheduler.run(jobs, on_finish=lambda job: safe_print(f"  → {job.label}"))
+    finally:
+        # whatever actually ran came out of the bottles, even if the pour failed
+        inventory.consume_jobs(job for job in jobs if job.actual is not None)
+        inventory.release(drink)
+    worst = max((abs(job.actual - job.duration) for job in jobs), default=0.0)
+    if worst > TIMING_TOLERANCE:
+        safe_print(f"  ! pump timing off by up to {worst * 1000:.1f} ms ({scheduler.stats.summary()})")
     safe_print(f"{drink['name']} is ready!\n")
 
+
+def report_plan():
+    """Records in pour_plan_saved_seconds what overlapping the queued orders would save over FIFO."""
+    index = pump_index
+    planner = PourPlanner(index.pump_configuration, index, FLOW_RATE, MAX_CONCURRENT_PUMPS,
+                          positions=PLAN_POSITIONS, lookahead=PLAN_LOOKAHEAD)
+    plan_queue(planner, orders.pending(), find_drink_by_name)
+
 # -----------------------------------------------------------------------------
 # ──────────────────────────────── MAIN LOOP ───────────────────────────────────
 # -----------------------------------------------------------------------------
 
+def notify(kind: str, order):
+    if kind == "pouring":
+        STAGES.observe(time.time() - order.received, stage="queue")
+        return
+    ORDERS.inc(outcome=kind)
+    if kind == "accepted":
+        send_acknowledgement(order.drink, orders.position(order))
+        report_plan()
+    elif kind == "rejected":
+        drink = catalog.find(order.drink)
+        shortages = coordinator.missing if coordinator else inventory.shortages
+        send_rejection(order.drink, shortages(drink) if drink else [order.drink])
+    elif kind == "ready":
+        # from queueing the order until the "ready" SMS has left
+        send_confirmation(order.drink, lambda: STAGES.observe(time.time() - order.received, stage="end_to_end"))
+    elif kind == "failed":
+        send_failure(order.drink)
+
+
+def run_station():
+    """Pours what the fleet coordinator sends instead of reading mail."""
+    global station
+    safe_print(f"—— Bartender station {STATION_NAME} ——")
+    # each drink is reserved from this machine's bottles as it arrives; pour_drink releases it
+    station = StationClient(STATION_NAME, pump_configuration, pour_drink, *FLEET_ADDRESS,
+                            max_concurrent=MAX_CONCURRENT_PUMPS, log=safe_print,
+                            admit=inventory.reserve_for, release=inventory.release)
+    config_store.watch(reload_pumps)
+    if IDLE_MAINTENANCE:
+        maintenance.start()
+    try:
+        station.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        station.stop()
+        maintenance.stop()
+        config_store.close()
+        inventory.close()
+    pumps.cleanup()
+    safe_print(f"Pump timing: {scheduler.stats.summary()}")
+
+
+coordinator = None
+
+
 def main():
+    global coordinator
+    if FLEET_ROLE == "station":
+        return run_station()
     safe_print("—— SMS-Controlled Bartender Ready ——")
     safe_print(f"Waiting for SMS commands at {SMS_GATEWAY_ADDRESS}…")
 
-    while True:
-        try:
-            with imaplib.IMAP4_SSL(IMAP_SERVER) as mail:
-                mail.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-                for uid, drink_name in get_unread_commands(mail):
-                    drink = find_drink_by_name(drink_name)
-                    if drink:
-                        pour_drink(drink)
-                        send_confirmation(drink["name"])
-                    else:
-                        safe_print(f"Unknown drink requested: '{drink_name}'. Ignored.")
-                    mail.store(uid, '+FLAGS', '\\Seen')
-                mail.logout()
-        except KeyboardInterrupt:
-            break
-        except Exception:
-            traceback.print_exc()
-        time.sleep(POLL_INTERVAL)
-
-    GPIO.cleanup()
-    safe_print("GPIO cleaned up. Exiting.")
+    # one logged-in session for the whole run; new orders are pushed via IDLE
+    listener = MailboxListener(IMAP_SERVER, EMAIL_ADDRESS, EMAIL_PASSWORD,
+                               noop_interval=POLL_INTERVAL, log=safe_print)
+    if FLEET_ROLE == "coordinator":
+        # orders go to the stations; this machine's own pumps stay idle
+        coordinator = Coordinator(orders, find_drink_by_name, notify, *FLEET_ADDRESS,
+                                  flow_rate=FLOW_RATE, log=safe_print)
+    pipeline = OrderPipeline(listener, orders, get_unread_commands, find_drink_by_name,
+                             pour_drink, notify, log=safe_print,
+                             admit=coordinator.can_make if coordinator else reserve, release=release_order)
+    exporter = metrics.serve(METRICS_PORT, METRICS_HOST) if METRICS_PORT else None
+    confirmations.start()
+    config_store.watch(reload_pumps)
+    if coordinator:
+        coordinator.start()
+    else:
+        pipeline.start()
+        if IDLE_MAINTENANCE:
+            maintenance.start()
+    try:
+        pipeline.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if coordinator:
+            coordinator.stop()
+        maintenance.stop()
+        pipeline.stop()
+        confirmations.stop()
+        config_store.close()
+        inventory.close()
+        if exporter:
+            exporter.shutdown()
+
+    pumps.cleanup()
+    safe_print(f"Pump timing: {scheduler.stats.summary()}")
+    for line in metrics.summary(metrics.parse(metrics.REGISTRY.exposition())):
+        safe_print(line)
+    safe_print("Pumps cleaned up. Exiting.")
 
 
 if __name__ == "__main__":
@@ -1,37 +1,50 @@
 #!/usr/bin/env python
+import os
 import time
 import sys
-import json
-import threading
-import traceback
+import asyncio
+import logging
+import collections
 
 # Simulated display and LED strip for command-line debug mode
-from menu import MenuItem, Menu, Back, MenuContext, MenuDelegate
+from menu import MenuItem, Menu, Back, MenuContext, MenuDelegate, attributeRecord
 from drinks import drink_list, drink_options
+from pump_index import PumpIndex
+from pump_driver import make_driver, SystemClock
+from pump_timing import DeadlineTimer, TimingStats
+from flow_model import split_dose
+from pour_scheduler import PourJob, plan_pours, makespan
+from config_store import ConfigStore
+from inventory import Inventory
+from frame_buffer import FrameBuffer
+import log_setup
+import metrics
+
+log = logging.getLogger("bartender")
 
 class ConsoleDisplay:
     """Dummy display: prints to console with debug info."""
     def __init__(self, width=128, height=64):
-        print(f"[DEBUG] ConsoleDisplay::__init__({width}x{height})")
+        log.debug("ConsoleDisplay::__init__(%dx%d)", width, height)
         self.width = width
         self.height = height
-    def begin(self): print("[DEBUG] ConsoleDisplay.begin() called")
-    def clear_display(self): print("[DEBUG] ConsoleDisplay.clear_display() called\n" + "-"*self.width)
-    def display(self): print("[DEBUG] ConsoleDisplay.display() called")
-    def invert_display(self): print("[DEBUG] ConsoleDisplay.invert_display() called")
-    def normal_display(self): print("[DEBUG] ConsoleDisplay.normal_display() called")
+    def begin(self): log.debug("ConsoleDisplay.begin() called")
+    def clear_display(self): log.debug("ConsoleDisplay.clear_display() called\n%s", "-"*self.width)
+    def display(self): log.debug("ConsoleDisplay.display() called")
+    def invert_display(self): log.debug("ConsoleDisplay.invert_display() called")
+    def normal_display(self): log.debug("ConsoleDisplay.normal_display() called")
     def draw_text2(self, x, y, text, size): print(f"[DISPLAY] {text}")
     def draw_pixel(self, x, y): pass
 
 class DummyStrip:
     """Dummy LED strip: prints debug actions."""
     def __init__(self, numpixels, datapin, clockpin):
-        print(f"[DEBUG] DummyStrip::__init__(numpixels={numpixels})")
+        log.debug("DummyStrip::__init__(numpixels=%d)", numpixels)
         self.numpixels = numpixels
-    def begin(self): print("[DEBUG] DummyStrip.begin() called")
-    def setBrightness(self, brightness): print(f"[DEBUG] DummyStrip.setBrightness({brightness})")
+    def begin(self): log.debug("DummyStrip.begin() called")
+    def setBrightness(self, brightness): log.debug("DummyStrip.setBrightness(%s)", brightness)
     def setPixelColor(self, i, color): pass
-    def show(self): print("[DEBUG] DummyStrip.show() called")
+    def show(self): log.debug("DummyStrip.show() called")
 
 # Constants
 SCREEN_WIDTH = 128
@@ -40,164 +53,305 @@ NUMBER_NEOPIXELS = 45
 NEOPIXEL_DATA_PIN = 26
 NEOPIXEL_CLOCK_PIN = 6
 NEOPIXEL_BRIGHTNESS = 64
-FLOW_RATE = 60.0/100.0
+DISPLAY_FPS = 10          # OLED frames per second at most
+LIGHTS_FPS = 20           # LED strip frames per second at most
+PROGRESS_FPS = 20         # console progress bar updates per second at most
+PROGRESS_WIDTH = 30       # characters in the progress bar; it is redrawn only when one fills
+LIGHTS_STEP = 0.1         # seconds per step of the pouring animation
+COMET_COLOR = 0xFF8000; COMET_TAIL = 4; GREEN = 0x00FF00
+FLOW_RATE = 60.0/100.0   # seconds per mL for pumps without a calibrated flow_rate
+MAX_CONCURRENT_PUMPS = 6 # pumps allowed on at once (limited by the pump supply)
+CONFIG_FILE = 'pump_config.json'
+INVENTORY_LOG = 'inventory.log'
+INVENTORY_SYNC = 2.0      # seconds between reads of other processes' inventory.log lines
+
+# Render and pour timings; set BARTENDER_METRICS_PORT to serve them for `python metrics.py`
+KEYPRESS = metrics.histogram('bartender_keypress_seconds', 'Seconds to handle a keypress and redraw the menu')
+POURS = metrics.histogram('bartender_pour_seconds', 'Seconds from starting the pumps to the last one stopping')
+
+# Atomic, debounced pump_config.json writes off the UI thread
+configStore = ConfigStore(CONFIG_FILE)
+
+# Immutable attribute records; one SelectionAttributes per drink option is shared by every pump submenu
+DrinkAttributes = attributeRecord('DrinkAttributes', 'ingredients requires')
+PumpAttributes = attributeRecord('PumpAttributes', 'key')
+SelectionAttributes = attributeRecord('SelectionAttributes', 'value name')
 
 class Bartender(MenuDelegate):
-    def __init__(self):
-        print("[DEBUG] Bartender::__init__() start")
+    def __init__(self, pumps=None):
+        log.debug("Bartender::__init__() start")
         self.running = False
+        self.task = None
         # Setup display
         self.led = ConsoleDisplay(SCREEN_WIDTH, SCREEN_HEIGHT)
         self.led.begin(); self.led.clear_display(); self.led.display()
         self.led.invert_display(); time.sleep(0.2); self.led.normal_display(); time.sleep(0.2)
+        # draw calls are collected into frames; only changed regions reach the bus, at a capped rate
+        self.screen = FrameBuffer(lambda at,v: self.led.draw_text2(at[0],at[1],*v), self.led.display, self.led.clear_display, DISPLAY_FPS)
+        self.console = FrameBuffer(lambda r,v: v and sys.stdout.write(v), lambda: sys.stdout.flush(), fps=PROGRESS_FPS)
         # Load pumps
-        print("[DEBUG] Loading pump configuration...")
+        log.debug("Loading pump configuration...")
         self.pump_configuration = Bartender.readPumpConfiguration()
-        print(f"[DEBUG] Pump config: {self.pump_configuration}")
+        self.pumpIndex = PumpIndex(self.pump_configuration)
+        log.debug("Pump config: %s", self.pump_configuration)
+        # reservoir levels, shared with the SMS daemon through the log
+        self.inventory = Inventory(self.pumpIndex, INVENTORY_LOG)
+        # Pumps are simulated in real time unless PUMP_DRIVER says otherwise
+        self.pumps = pumps or make_driver(os.environ.get("PUMP_DRIVER", "simulated"), clock=SystemClock())
+        self.pumps.setup(p['pin'] for p in self.pump_configuration.values())
+        # commanded vs measured on-time of every pour; the timer learns how late switch-offs land
+        self.timer = DeadlineTimer(); self.timing = TimingStats()
         # Setup strip
         self.strip = DummyStrip(NUMBER_NEOPIXELS, NEOPIXEL_DATA_PIN, NEOPIXEL_CLOCK_PIN)
         self.strip.begin(); self.strip.setBrightness(NEOPIXEL_BRIGHTNESS)
-        for i in range(self.strip.numpixels): self.strip.setPixelColor(i, 0)
-        self.strip.show()
-        print("[DEBUG] Bartender initialization complete")
+        self.lights = FrameBuffer(lambda i,c: self.strip.setPixelColor(i, c or 0), self.strip.show, fps=LIGHTS_FPS)
+        self.fillLights(0)
+        log.debug("Bartender initialization complete")
 
     @staticmethod
     def readPumpConfiguration():
-        print("[DEBUG] readPumpConfiguration() called")
-        config = json.load(open('pump_config.json'))
-        print(f"[DEBUG] readPumpConfiguration loaded: {config}")
+        log.debug("readPumpConfiguration() called")
+        config = configStore.load()
+        log.debug("readPumpConfiguration loaded: %s", config)
         return config
 
     @staticmethod
     def writePumpConfiguration(configuration):
-        print(f"[DEBUG] writePumpConfiguration() called with {configuration}")
-        with open("pump_config.json","w") as f: json.dump(configuration, f)
-        print("[DEBUG] Pump configuration saved to file")
+        log.debug("writePumpConfiguration() called with %s", configuration)
+        configStore.save(configuration)
+        log.debug("Pump configuration queued for saving")
 
     def buildMenu(self, drink_list, drink_options):
-        print("[DEBUG] buildMenu() start")
+        log.debug("buildMenu() start")
         m = Menu("Main Menu")
         # Drink options
-        for d in drink_list:
-            m.addOption(MenuItem('drink', d['name'], {'ingredients': d['ingredients']}))
+        m.addOptions([MenuItem('drink', d['name'], DrinkAttributes(d['ingredients'], self.pumpIndex.requirement(d['ingredients']))) for d in drink_list])
+        self.drinkMenu = m
         # Config menu
         config_menu = Menu("Configure")
+        selections = [SelectionAttributes(opt['value'], opt['name']) for opt in drink_options]
         for p in sorted(self.pump_configuration):
-            submenu = Menu(self.pump_configuration[p]['name'])
-            for opt in drink_options:
-                sel = '*' if opt['value']==self.pump_configuration[p]['value'] else ''
-                submenu.addOption(MenuItem('pump_selection', f"{opt['name']} {sel}".strip(), {'key':p,'value':opt['value'],'name':opt['name']}))
+            submenu = Menu(self.pump_configuration[p]['name'], PumpAttributes(p))
+            submenu.addOptions([MenuItem('pump_selection', sel.name+'*' if sel.value==self.pump_configuration[p]['value'] else sel.name, sel) for sel in selections])
             submenu.addOption(Back('Back')); submenu.setParent(config_menu)
             config_menu.addOption(submenu)
         config_menu.addOption(Back('Back')); config_menu.addOption(MenuItem('clean','Clean')); config_menu.setParent(m)
         m.addOption(config_menu)
         self.menuContext = MenuContext(m, self)
-        print("[DEBUG] buildMenu() complete")
+        log.debug("buildMenu() complete")
 
-    def filterDrinks(self, menu):
-        print(f"[DEBUG] filterDrinks(menu={menu.name})")
-        for opt in menu.options:
+    def filterDrinks(self, menu, options):
+        log.debug("filterDrinks(menu=%s, %d options)", menu.name, len(options))
+        for opt in options:
             if opt.type=='drink':
-                ingredients = opt.attributes['ingredients']; ok = all(
-                    any(ing==self.pump_configuration[p]['value'] for p in self.pump_configuration)
-                    for ing in ingredients)
-                opt.visible = ok
-            elif opt.type=='menu': self.filterDrinks(opt)
-
-    def selectConfigurations(self, menu):
-        print(f"[DEBUG] selectConfigurations(menu={menu.name})")
-        for opt in menu.options:
+                r=opt.attributes['requires']; opt.visible = self.pumpIndex.can_make(r) and self.inventory.can_make(r)
+
+    def invalidateDrinks(self, changed):
+        if not changed: return
+        for d in self.drinkMenu.options:
+            if d.type=='drink' and d.attributes.requires & changed: self.drinkMenu.invalidate(d)
+
+    def selectConfigurations(self, menu, options):
+        log.debug("selectConfigurations(menu=%s, %d options)", menu.name, len(options))
+        for opt in options:
             if opt.type=='pump_selection':
-                key=opt.attributes['key']; val=opt.attributes['value']
+                key=opt.container.attributes['key']; val=opt.attributes['value']
                 opt.name = f"{opt.attributes['name']}*" if self.pump_configuration[key]['value']==val else opt.attributes['name']
-            elif opt.type=='menu': self.selectConfigurations(opt)
 
     def prepareForRender(self, menu):
-        print(f"[DEBUG] prepareForRender(menu={menu.name})")
-        self.filterDrinks(menu); self.selectConfigurations(menu); return True
+        # only invalidated options are recomputed; clean submenus are skipped
+        log.debug("prepareForRender(menu=%s)", menu.name)
+        options = menu.takeDirty()
+        self.filterDrinks(menu, options); self.selectConfigurations(menu, options)
+        for opt in options:
+            if opt.type=='menu': self.prepareForRender(opt)
+        return True
 
     def menuItemClicked(self, item):
-        print(f"[DEBUG] menuItemClicked(item={item.name}, type={item.type})")
+        log.debug("menuItemClicked(item=%s, type=%s)", item.name, item.type)
         if item.type=='drink': return self.makeDrink(item.name,item.attributes['ingredients'])
         if item.type=='pump_selection':
-            k,v=item.attributes['key'],item.attributes['value']; self.pump_configuration[k]['value']=v
+            k,v=item.container.attributes['key'],item.attributes['value']; old=self.pump_configuration[k]['value']
+            self.pumpIndex.assign(k,v); self.inventory.refresh((old,v))
+            # only drinks using the old or new ingredient and this pump's markers can change
+            self.invalidateDrinks(self.pumpIndex.requirement(i for i in (old,v) if i is not None))
+            item.container.invalidate()
             Bartender.writePumpConfiguration(self.pump_configuration); return True
         if item.type=='clean': return self.clean()
         return False
 
     def clean(self):
-        print("[DEBUG] clean() start")
-        self.running=True; wait=5
-        threads=[]
-        for p in self.pump_configuration:
-            t=threading.Thread(target=self.pour,args=(self.pump_configuration[p]['pin'],wait)); threads.append(t); t.start()
-        self.progressBar(wait)
-        for t in threads: t.join()
-        print("[DEBUG] clean() done")
-        self.menuContext.showMenu(); time.sleep(0.5); self.running=False
-        return True
+        log.debug("clean() start")
+        return self.startTask(self.cleanPumps(5))
+
+    async def cleanPumps(self, wait):
+        self.running=True
+        plan=plan_pours([PourJob(self.pump_configuration[p]['pin'],wait) for p in self.pump_configuration], MAX_CONCURRENT_PUMPS)
+        await asyncio.gather(self.pour(plan), self.progressBar(makespan(plan)))
+        log.debug("clean() done")
+        self.menuContext.showMenu(); await asyncio.sleep(0.5); self.running=False
+
+    def displayMenuItem(self, item):
+        # menu moves show at once; redisplaying the same item costs nothing
+        self.screen.clear(); self.screen.draw((0,20), (item.name,2)); self.screen.present(force=True)
+
+    def fillLights(self, color):
+        for i in range(self.strip.numpixels): self.lights.draw(i, color)
+        self.lights.present(force=True)
 
-    def displayMenuItem(self, item): print(f"[DISPLAY] Now showing: {item.name}")
+    def startTask(self, coro):
+        # pours run as tasks on the event loop; the keyboard task awaits self.task before reading again
+        try: loop=asyncio.get_running_loop()
+        except RuntimeError: asyncio.run(coro); return True
+        self.task=loop.create_task(coro); return True
 
-    def cycleLights(self):
-        print("[DEBUG] cycleLights() start")
-        t=threading.currentThread()
-        while getattr(t,'do_run',True): time.sleep(0.2)
-        print("[DEBUG] cycleLights() end")
+    async def cycleLights(self):
+        """a comet runs round the strip until cancelled; each step rewrites only the two pixels that change"""
+        log.debug("cycleLights() start")
+        loop=asyncio.get_running_loop(); n=self.strip.numpixels; start=loop.time(); head=-1
+        try:
+            while True:
+                head=max(head+1, int((loop.time()-start)/LIGHTS_STEP))
+                for i in range(n): self.lights.draw(i, COMET_COLOR if (head-i)%n<COMET_TAIL else 0)
+                self.lights.present()
+                await asyncio.sleep(max(start+(head+1)*LIGHTS_STEP-loop.time(), self.lights.due()))
+        finally: self.fillLights(0); log.debug("cycleLights() end")
 
-    def lightsEndingSequence(self):
-        print("[DEBUG] lightsEndingSequence() start")
-        print("[LIGHT] Simulate green lights on"); time.sleep(1); print("[LIGHT] Lights off")
+    async def lightsEndingSequence(self):
+        log.debug("lightsEndingSequence() start")
+        log.info("Green lights on"); self.fillLights(GREEN)
+        await asyncio.sleep(1); self.fillLights(0); log.info("Lights off")
 
-    def pour(self, pin, wait):
-        print(f"[PUMP] Pour on pin {pin} for {wait:.2f}s"); time.sleep(wait); print(f"[PUMP] Pin {pin} done")
+    async def pour(self, plan):
+        """runs a plan_pours() plan: the jobs starting at 0 at once, each later one as a pump frees its slot; loop timers switch each off at its deadline"""
+        loop=asyncio.get_running_loop(); done=loop.create_future(); running={}; waiting=collections.deque(plan)
+        def on(job):
+            log.info("Pour on pin %s for %.2fs", job.pin, job.duration)
+            # each deadline counts from that pump's own switch-on, aimed early by the learned lag
+            self.pumps.on(job.pin); t=loop.time(); running[job.pin]=loop.call_at(self.timer.target(t+job.duration), off, job.pin, t, job.duration)
+        def off(pin, on_at, wait):
+            running.pop(pin,None); self.pumps.off(pin); t=loop.time()
+            self.timer.observe(on_at+wait, t); self.timing.record(pin, wait, t-on_at)
+            log.info("Pin %s done (%+.1f ms)", pin, (t-on_at-wait)*1000, extra={'event': {'pin': pin, 'commanded': wait, 'actual': t-on_at}})
+            # the freed slot goes to the next job, so at most MAX_CONCURRENT_PUMPS run and a late one keeps its full time
+            if waiting: on(waiting.popleft())
+            elif not running and not done.done(): done.set_result(None)
+        while waiting and waiting[0].start==0: on(waiting.popleft())
+        try:
+            if running: await done
+        finally:
+            # cancelled mid-pour: nothing may be left running
+            for pin,handle in list(running.items()): handle.cancel(); self.pumps.off(pin)
 
-    def progressBar(self, wait):
-        print(f"[DEBUG] progressBar(wait={wait:.2f}) start")
-        for x in range(1,101):
-            filled=int(30*x/100);
-            bar='#'*filled+'-'*(30-filled)
-            sys.stdout.write(f"\rProgress: [{bar}] {x}%"); sys.stdout.flush(); time.sleep(wait/100)
-        print(); print("[DEBUG] progressBar end")
+    async def progressBar(self, wait):
+        log.debug("progressBar(wait=%.2f) start", wait)
+        loop=asyncio.get_running_loop(); start=loop.time(); self.console.invalidate(); filled=0
+        while True:
+            # at least one more # per wake-up, so float rounding at a deadline cannot stall the bar
+            done=(loop.time()-start)/wait if wait>0 else 1.0
+            filled=min(PROGRESS_WIDTH, max(filled+1, int(PROGRESS_WIDTH*done)))
+            x=100 if filled==PROGRESS_WIDTH else min(99, max(100*filled//PROGRESS_WIDTH, int(100*done)))
+            bar='#'*filled+'-'*(PROGRESS_WIDTH-filled)
+            self.console.draw('progress', f"\rProgress: [{bar}] {x}%"); self.console.present(force=x==100)
+            if x==100: break
+            # only redraw when the bar grows (deadlines from start, so no drift), but no sooner than the next frame
+            await asyncio.sleep(max(start+wait*(filled+1)/PROGRESS_WIDTH-loop.time(), self.console.due()))
+        print(); log.debug("progressBar end")
 
     def makeDrink(self, drink, ingredients):
-        print(f"[DEBUG] makeDrink({drink}) start")
-        self.running=True; print(f"[ACTION] Making: {drink}")
-        lt=threading.Thread(target=self.cycleLights); lt.do_run=True; lt.start()
-        threads=[]; maxt=0
-        for ing,qty in ingredients.items():
-            for p in self.pump_configuration:
-                if ing==self.pump_configuration[p]['value']:
-                    tme=qty*FLOW_RATE; maxt=max(maxt,tme)
-                    t=threading.Thread(target=self.pour,args=(self.pump_configuration[p]['pin'],tme))
-                    threads.append(t); t.start()
-        print(f"[DEBUG] Started {len(threads)} pumps, maxt={maxt:.2f}s")
-        self.progressBar(maxt)
-        for t in threads: t.join()
-        print("[DEBUG] Pumps done")
-        self.menuContext.showMenu(); lt.do_run=False; lt.join(); self.lightsEndingSequence(); time.sleep(0.5); self.running=False
-        print(f"[DEBUG] makeDrink({drink}) end")
-        return True
+        log.debug("makeDrink(%s) start", drink)
+        return self.startTask(self.pourDrink(drink, ingredients))
 
-    def run(self):
-        print("[DEBUG] Bartender.run() start")
+    async def pourDrink(self, drink, ingredients):
+        short=self.inventory.shortages({'ingredients': ingredients})
+        if short: log.info("Not enough %s left for %s", ', '.join(short), drink); return
+        self.running=True; log.info("Making: %s", drink)
+        lights=asyncio.create_task(self.cycleLights())
+        # calibrated per-pump on-times; pumps sharing an ingredient split its dose
+        doses=[d for ing,qty in ingredients.items()
+               for d in split_dose({p:self.pump_configuration[p] for p in self.pumpIndex.pumps_for(ing)},qty,FLOW_RATE)]
+        # at most MAX_CONCURRENT_PUMPS on at once; the drink takes the plan's makespan
+        plan=plan_pours([PourJob(self.pump_configuration[k]['pin'],t) for k,ml,t in doses], MAX_CONCURRENT_PUMPS)
+        maxt=makespan(plan)
+        log.debug("Planned %d pumps, maxt=%.2fs", len(plan), maxt)
+        try:
+            with POURS.time(): await asyncio.gather(self.pour(plan), self.progressBar(maxt))
+        finally: lights.cancel(); await asyncio.wait([lights])
+        if log.isEnabledFor(logging.DEBUG): log.debug("Pumps done; %s", self.timing.summary())
+        # drinks whose ingredient just ran out disappear from the menu
+        self.invalidateDrinks(self.inventory.consume((k,ml) for k,ml,t in doses))
+        self.menuContext.showMenu(); await self.lightsEndingSequence(); await asyncio.sleep(0.5); self.running=False
+        log.debug("makeDrink(%s) end", drink)
+
+    async def readLines(self):
+        """yields stdin lines as they arrive (None at EOF) without blocking the loop"""
+        loop=asyncio.get_running_loop(); lines=asyncio.Queue()
+        try:
+            fd=sys.stdin.fileno(); buf=bytearray()
+            def readable():
+                chunk=os.read(fd,4096)
+                if not chunk: loop.remove_reader(fd); lines.put_nowait(None); return
+                buf.extend(chunk)
+                while b"\n" in buf:
+                    line,_,rest=buf.partition(b"\n"); buf[:]=rest; lines.put_nowait(line.decode(errors="replace"))
+            loop.add_reader(fd, readable)
+        except (AttributeError, OSError, ValueError, NotImplementedError):
+            # no selectable stdin (e.g. Windows): fall back to one reader thread
+            while True:
+                line=await loop.run_in_executor(None, sys.stdin.readline)
+                yield line.rstrip("\n") if line else None
+                if not line: return
+        try:
+            while True:
+                line=await lines.get(); yield line
+                if line is None: return
+        finally:
+            loop.remove_reader(fd)
+
+    async def syncInventory(self):
+        """picks up refills (python inventory.py refill ...) and the daemon's pours off the keypress path"""
+        loop=asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(INVENTORY_SYNC)
+            # the log is read on a worker thread; only the menu invalidation runs on the loop
+            self.invalidateDrinks(await loop.run_in_executor(None, self.inventory.sync))
+
+    async def runAsync(self):
         print("Welcome to the Bartender CLI!")
+        syncer=asyncio.create_task(self.syncInventory())
+        try: await self.readMenu()
+        finally: syncer.cancel(); await asyncio.wait([syncer])
+
+    async def readMenu(self):
         self.menuContext.showMenu()
-        while True:
-            print(f"[DEBUG] Loop start, running={self.running}")
-            if self.running: time.sleep(0.2); continue
-            print("Commands: n=next, s=select, q=quit")
-            choice=input("Choice: ").strip().lower()
-            print(f"[DEBUG] Input received: '{choice}'")
+        prompt=lambda: (print("Commands: n=next, s=select, q=quit"), sys.stdout.write("Choice: "), sys.stdout.flush())
+        prompt()
+        async for line in self.readLines():
+            if line is None: print(); print("Exiting... Bye!"); break
+            choice=line.strip().lower()
+            log.debug("Input received: '%s'", choice)
             if choice=='q': print("Exiting... Bye!"); break
-            if choice=='n': print("[ACTION] Advancing"); self.menuContext.advance(); self.menuContext.showMenu(); continue
-            if choice=='s': print("[ACTION] Selecting"); self.menuContext.select(); self.menuContext.showMenu(); continue
-            print("Invalid, please try.")
-        print("[DEBUG] Bartender.run() end")
+            if choice=='n':
+                with KEYPRESS.time(key='n'): log.info("Advancing"); self.menuContext.advance(); self.menuContext.showMenu()
+            elif choice=='s':
+                with KEYPRESS.time(key='s'): log.info("Selecting"); self.menuContext.select()
+                # keypresses typed while pouring stay buffered until the pour is done
+                if self.task: task,self.task=self.task,None; await task
+                with KEYPRESS.time(key='redraw'): self.menuContext.showMenu()
+            else: print("Invalid, please try.")
+            prompt()
+
+    def run(self):
+        log.debug("Bartender.run() start")
+        try: asyncio.run(self.runAsync())
+        finally: configStore.flush(); self.inventory.close()
+        log.debug("Bartender.run() end")
 
 if __name__=="__main__":
-    print("[INFO] Starting Bartender program...")
+    log_setup.configure()   # BARTENDER_LOG=debug for the [DEBUG] trace, BARTENDER_EVENTS=<file> for a JSONL event log
+    if os.environ.get("BARTENDER_METRICS_PORT"): metrics.serve(int(os.environ["BARTENDER_METRICS_PORT"]), os.environ.get("BARTENDER_METRICS_HOST", "127.0.0.1"))
+    log.info("Starting Bartender program...")
     try:
         b=Bartender(); b.buildMenu(drink_list, drink_options); b.run()
     except Exception as e:
-        print(f"[ERROR] {e}"); traceback.print_exc()
+        log.exception("%s", e)
@@ -0,0 +1,10 @@
+"""
+Headless benchmarks. Run from the repository root, e.g.
+
+    python -m benchmarks.mailbox_latency
+
+benchmarks.suite runs the hot paths together and checks them against
+benchmarks/baseline.json, which the first run on each machine writes:
+
+    python -m benchmarks.suite
+"""
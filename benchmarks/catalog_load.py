@@ -0,0 +1,83 @@
+"""
+Catalog load time and name lookup latency.
+
+Writes a synthetic catalog as JSON and CSV, then times a cold load (parse and
+write the compiled cache), a warm load (cache hit), and lookups through the
+case-folded index against the original linear scan with .lower().
+
+    python -m benchmarks.catalog_load --drinks 5000
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+
+from catalog import load_catalog
+
+
+def synthetic(count, seed=1):
+    rng = random.Random(seed)
+    pool = [f"ingredient {i}" for i in range(40)]
+    return [{"name": f"Drink {i}", "ingredients": {ing: rng.choice((15, 25, 50))
+                                                  for ing in rng.sample(pool, rng.randint(1, 6))}}
+            for i in range(count)]
+
+
+def write_files(drinks, directory):
+    json_path = os.path.join(directory, "recipes.json")
+    with open(json_path, "w") as f:
+        json.dump(drinks, f)
+    csv_path = os.path.join(directory, "recipes.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "ingredient", "amount"])
+        for d in drinks:
+            for ing, amount in d["ingredients"].items():
+                writer.writerow([d["name"], ing, amount])
+    return json_path, csv_path
+
+
+def linear_find(drinks, name):
+    """find_drink_by_name as it was: a scan with .lower() on every drink"""
+    for drink in drinks:
+        if drink["name"].lower() == name:
+            return drink
+    return None
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--drinks", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    drinks = synthetic(args.drinks)
+    rng = random.Random(2)
+    queries = [f"drink {rng.randrange(args.drinks)}" for _ in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.drinks} drinks")
+        for path in write_files(drinks, tmp):
+            cold, _ = timed(lambda: load_catalog(path))
+            warm, catalog = timed(lambda: load_catalog(path), 5)
+            print(f"  {os.path.basename(path):<13} cold load {cold * 1e3:8.2f} ms   "
+                  f"cached load {warm * 1e3:8.2f} ms")
+
+    scan, _ = timed(lambda: [linear_find(drinks, q) for q in queries])
+    index, _ = timed(lambda: [catalog.find(q) for q in queries])
+    print(f"  lookup, linear scan   {scan / args.lookups * 1e6:10.2f} us")
+    print(f"  lookup, name index    {index / args.lookups * 1e6:10.2f} us")
+
+
+if __name__ == "__main__":
+    main()
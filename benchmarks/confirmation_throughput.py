@@ -0,0 +1,74 @@
+"""
+Orders per minute with inline SMTP confirmations versus the background sender.
+
+Each order "pours" for `--pour` seconds and then confirms over a local
+FakeSMTPServer whose `--handshake` delay stands in for the TLS handshake and
+login of Gmail's SMTP_SSL.
+
+    python -m benchmarks.confirmation_throughput --orders 20 --pour 0.05 --handshake 0.2
+"""
+import argparse
+import smtplib
+import time
+from email.message import EmailMessage
+
+from confirmations import ConfirmationSender
+from fake_mail import FakeSMTPServer
+
+
+def confirmation(i):
+    msg = EmailMessage()
+    msg["Subject"] = f"D{i % 7 + 1} ready – Coffee Decision"
+    msg["From"] = "bartender@example.com"
+    msg["To"] = "phone@sms.example.com"
+    msg.set_content(f"Your D{i % 7 + 1} has been prepared. Enjoy!")
+    return msg
+
+
+def run_inline(orders, pour, handshake):
+    with FakeSMTPServer(handshake_delay=handshake) as server:
+        host, port = server.address
+        start = time.perf_counter()
+        for i in range(orders):
+            time.sleep(pour)
+            with smtplib.SMTP(host, port) as smtp:
+                smtp.login("user", "pass")
+                smtp.send_message(confirmation(i))
+        poured = delivered = time.perf_counter() - start
+        return poured, delivered, server.commands["logins"]
+
+
+def run_background(orders, pour, handshake):
+    with FakeSMTPServer(handshake_delay=handshake) as server:
+        host, port = server.address
+        sender = ConfirmationSender(host, "user", "pass", port=port,
+                                    smtp_class=smtplib.SMTP, batch_window=0.05).start()
+        start = time.perf_counter()
+        for i in range(orders):
+            time.sleep(pour)
+            sender.send(confirmation(i))
+        poured = time.perf_counter() - start
+        server.wait_for(orders, timeout=60)
+        delivered = time.perf_counter() - start
+        sender.stop()
+        return poured, delivered, server.commands["logins"]
+
+
+def report(name, orders, poured, delivered, logins):
+    print(f"{name:<11} pour loop {orders / poured * 60:8.1f} orders/min   "
+          f"all confirmed after {delivered:6.2f} s   logins={logins}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=20)
+    parser.add_argument("--pour", type=float, default=0.05)
+    parser.add_argument("--handshake", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report("inline", args.orders, *run_inline(args.orders, args.pour, args.handshake))
+    report("background", args.orders, *run_background(args.orders, args.pour, args.handshake))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Fleet throughput against the number of stations.
+
+Starts a Coordinator on an ephemeral localhost port and `--stations` counts
+of simulated stations (StationClients on simulated pumps running
+`--speedup` times faster than real time), queues `--orders` drinks at once
+and reports how long the fleet takes to pour them all, converted back to
+real time, and how the work was spread. `--mixed` gives every other station
+a different pump assignment, so some drinks can only go to some stations.
+
+    python -m benchmarks.fleet_scaling --stations 1 2 4 --orders 40
+"""
+import argparse
+import json
+import threading
+import time
+
+from catalog import RecipeCatalog
+from drinks import drink_list
+from fleet import Coordinator, simulated_station
+from flow_model import DEFAULT_FLOW_RATE
+from order_queue import OrderQueue
+from pump_index import PumpIndex
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def rotated(pump_configuration, shift):
+    """the same pumps with their ingredients moved `shift` places along"""
+    keys = sorted(pump_configuration)
+    values = [pump_configuration[k]["value"] for k in keys]
+    return {k: dict(pump_configuration[k], value=values[(i + shift) % len(values)] if i < 4 else None)
+            for i, k in enumerate(keys)}
+
+
+def run_fleet(count, orders, pump_configuration, speedup, mixed):
+    queue = OrderQueue(":memory:", log=quiet)
+    catalog = RecipeCatalog(drink_list)
+    finished = threading.Semaphore(0)
+    coordinator = Coordinator(queue, catalog.find,
+                              lambda kind, order: kind in ("ready", "failed") and finished.release(),
+                              port=0, flow_rate=DEFAULT_FLOW_RATE / speedup, changeover=0.0, log=quiet)
+    coordinator.start()
+    host, port = coordinator.address
+    stations = []
+    for i in range(count):
+        configuration = rotated(pump_configuration, i) if mixed and i % 2 else pump_configuration
+        station = simulated_station(f"sim-{i + 1}", configuration, speedup, host, port, log=quiet)
+        threading.Thread(target=station.run, daemon=True).start()
+        stations.append(station)
+    while len(coordinator.stations) < count:
+        time.sleep(0.01)
+
+    start = time.perf_counter()
+    for i, drink in enumerate(orders):
+        queue.add(f"bench/{i}", drink["name"])
+    for _ in orders:
+        finished.acquire()
+    elapsed = time.perf_counter() - start
+
+    coordinator.stop()
+    for station in stations:
+        station.stop()
+    queue.close()
+    return elapsed, [s.poured for s in stations]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stations", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--orders", type=int, default=40)
+    parser.add_argument("--speedup", type=float, default=1000.0)
+    parser.add_argument("--mixed", action="store_true", help="give every other station different pumps")
+    args = parser.parse_args()
+
+    with open("pump_config.json") as f:
+        pump_configuration = json.load(f)
+    index = PumpIndex(pump_configuration)
+    makeable = [d for d in drink_list if index.can_make(index.requirement(d["ingredients"]))]
+    orders = [makeable[i % len(makeable)] for i in range(args.orders)]
+
+    print(f"{args.orders} orders, pumps {args.speedup:g}x real time"
+          f"{', mixed pump assignments' if args.mixed else ''}")
+    baseline = None
+    for count in args.stations:
+        elapsed, poured = run_fleet(count, orders, pump_configuration, args.speedup, args.mixed)
+        real = elapsed * args.speedup
+        baseline = baseline or real
+        print(f"  {count:2d} station(s)  {real / 60:7.1f} min of pouring  "
+              f"{args.orders / real * 3600:6.1f} drinks/h  "
+              f"x{baseline / real:.2f}  per station {poured}")
+
+
+if __name__ == "__main__":
+    main()
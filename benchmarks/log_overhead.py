@@ -0,0 +1,81 @@
+"""
+Keypress latency of the bartender menu with debug logging on and off.
+
+Times "n" keypresses (advance + showMenu) on a synthetic catalog while the
+log goes to a stand-in for a Pi serial console that blocks for the time
+`--baud` takes to send each line. Runs with debug off, with debug on written
+on the calling thread (what the unconditional [DEBUG] prints cost), with
+debug on through the queued handler, and queued with a JSONL event log too.
+
+    python -m benchmarks.log_overhead --drinks 200 --baud 115200
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import tempfile
+import time
+
+import log_setup
+from bartender import Bartender
+from benchmarks.menu_render import synthetic_drinks
+from drinks import drink_options
+
+
+class SerialConsole(object):
+    """a text stream that blocks like a UART: 10 bits per character at `baud`"""
+
+    def __init__(self, baud):
+        self.baud = baud
+        self.lines = 0
+
+    def write(self, text):
+        self.lines += text.count("\n")
+        time.sleep(len(text) * 10 / self.baud)
+
+    def flush(self):
+        pass
+
+
+def press_latencies(context, presses):
+    latencies = []
+    for _ in range(presses):
+        start = time.perf_counter()
+        context.advance()
+        context.showMenu()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--drinks", type=int, default=200)
+    parser.add_argument("--presses", type=int, default=200)
+    parser.add_argument("--baud", type=int, default=115200)
+    args = parser.parse_args()
+
+    Bartender.writePumpConfiguration = staticmethod(lambda configuration: None)
+    events = os.path.join(tempfile.mkdtemp(), "events.jsonl")
+    modes = (("debug off", dict(level="info")),
+             ("debug on, direct", dict(level="debug", queued=False)),
+             ("debug on, queued", dict(level="debug")),
+             ("debug on, queued + JSONL", dict(level="debug", events=events)))
+
+    print(f"{args.drinks} drinks, {args.presses} keypresses, console at {args.baud} baud")
+    for name, options in modes:
+        console = SerialConsole(args.baud)
+        log_setup.configure(stream=console, **options)
+        with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+            bartender = Bartender()
+            bartender.buildMenu(synthetic_drinks(args.drinks), drink_options)
+            latencies = press_latencies(bartender.menuContext, args.presses)
+        start = time.perf_counter()
+        log_setup.stop()
+        drain = time.perf_counter() - start
+        cuts = statistics.quantiles(latencies, n=100)
+        print(f"  {name:<26} p50={cuts[49] * 1e3:8.3f} ms  p99={cuts[98] * 1e3:8.3f} ms  "
+              f"({console.lines} lines, {drain:.2f} s to drain)")
+
+
+if __name__ == "__main__":
+    main()
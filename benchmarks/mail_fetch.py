@@ -0,0 +1,110 @@
+"""
+Round-trips and parse time per order for a burst of unread orders.
+
+Compares the original per-message `FETCH (RFC822)` + full MIME parse + one
+STORE per message with a single UID FETCH of the text part, header-only
+parsing, and one batched UID STORE.
+
+    python -m benchmarks.mail_fetch --orders 50
+"""
+import argparse
+import email
+import imaplib
+import time
+
+from fake_mail import FakeIMAPServer
+from mailbox_listener import fetch_text_bodies, mark_seen
+
+SENDER = "phone@sms.example.com"
+CRITERIA = f'(UNSEEN SUBJECT "Coffee Decision" FROM "{SENDER}")'
+
+
+def per_message(mail):
+    """The original get_unread_commands loop, plus its per-message STORE."""
+    parse = 0.0
+    commands = []
+    typ, data = mail.search(None, CRITERIA)
+    for num in data[0].split():
+        typ, msg_data = mail.fetch(num, "(RFC822)")
+        start = time.perf_counter()
+        msg = email.message_from_bytes(msg_data[0][1])
+        payload = ""
+        if msg.is_multipart():
+            for part in msg.walk():
+                if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition")):
+                    payload = part.get_payload(decode=True).decode()
+                    break
+        else:
+            payload = msg.get_payload(decode=True).decode()
+        parse += time.perf_counter() - start
+        commands.append((num, payload.strip().lower()))
+    for num, _ in commands:
+        mail.store(num, "+FLAGS", "\\Seen")
+    return commands, parse
+
+
+def bulk(mail):
+    typ, data = mail.uid("SEARCH", None, CRITERIA)
+    uids = data[0].split()
+    recorder = _Recorder(mail)
+    bodies = fetch_text_bodies(recorder, uids)
+    # time the parse on its own by replaying the recorded FETCH response
+    replay = _Replay(recorder.response)
+    start = time.perf_counter()
+    fetch_text_bodies(replay, uids)
+    parse = time.perf_counter() - start
+    mark_seen(mail, list(bodies))
+    return [(uid, text.strip().lower()) for uid, text in bodies.items()], parse
+
+
+class _Recorder(object):
+    """Passes UID commands through and keeps the last response."""
+
+    def __init__(self, mail):
+        self.mail = mail
+        self.response = None
+
+    def uid(self, command, *args):
+        typ, self.response = self.mail.uid(command, *args)
+        return typ, self.response
+
+
+class _Replay(object):
+    """Answers UID FETCH with a canned response."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def uid(self, command, *args):
+        return "OK", self.data
+
+
+def run(name, consume, orders, rtt):
+    with FakeIMAPServer() as server:
+        for i in range(orders):
+            server.deliver(SENDER, "Coffee Decision", f"D{i % 7 + 1}", multipart=bool(i % 2))
+        mail = imaplib.IMAP4(*server.address)
+        mail.login("user", "pass")
+        mail.select("inbox")
+        server.commands.clear()
+        commands, parse = consume(mail)
+        trips = sum(n for c, n in server.commands.items() if c != "UID")
+        mail.logout()
+    # the fake server answers in microseconds; estimate a real link instead
+    estimate = trips * rtt + parse
+    print(f"{name:<12} orders={len(commands):4d} round-trips={trips:4d}  "
+          f"parse={parse / max(len(commands), 1) * 1e6:7.1f} us/order  "
+          f"~{estimate * 1000:7.1f} ms at {rtt * 1000:.0f} ms RTT")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=50)
+    parser.add_argument("--rtt", type=float, default=0.05, help="round-trip time to the IMAP server (s)")
+    args = parser.parse_args()
+    run("per-message", per_message, args.orders, args.rtt)
+    run("bulk", bulk, args.orders, args.rtt)
+
+
+if __name__ == "__main__":
+    main()
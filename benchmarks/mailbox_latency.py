@@ -0,0 +1,120 @@
+"""
+Order pickup latency: reconnect-and-poll versus a persistent IDLE session.
+
+Delivers orders to a local FakeIMAPServer at random moments and measures how
+long each one takes to be seen by the consumer. The poll interval is scaled
+down from the real 15 s so the run takes seconds, not minutes.
+
+    python -m benchmarks.mailbox_latency --orders 20 --poll-interval 1.0
+"""
+import argparse
+import imaplib
+import random
+import threading
+import time
+
+from fake_mail import FakeIMAPServer
+from mailbox_listener import MailboxListener
+
+SENDER = "phone@sms.example.com"
+SUBJECT = "Coffee Decision"
+CRITERIA = f'(UNSEEN SUBJECT "{SUBJECT}" FROM "{SENDER}")'
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+
+class Consumer(object):
+    def __init__(self, expected):
+        self.expected = expected
+        self.delivered = {}
+        self.seen = {}
+        self.done = threading.Event()
+
+    def handle(self, mail):
+        mail.select("inbox")
+        typ, data = mail.search(None, CRITERIA)
+        for num in data[0].split():
+            typ, msg_data = mail.fetch(num, "(UID)")
+            uid = int(msg_data[0].split(b"UID ")[1].split(b")")[0])
+            self.seen.setdefault(uid, time.monotonic())
+            mail.store(num, "+FLAGS", "\\Seen")
+        if len(self.seen) >= self.expected:
+            self.done.set()
+
+    def latencies(self):
+        return [self.seen[uid] - at for uid, at in self.delivered.items() if uid in self.seen]
+
+
+def produce(server, consumer, orders, spacing):
+    for i in range(orders):
+        time.sleep(random.uniform(*spacing))
+        at = time.monotonic()
+        uid = server.deliver(SENDER, SUBJECT, f"D{i % 7 + 1}")
+        consumer.delivered[uid] = at
+
+
+def run_polling(orders, poll_interval, spacing):
+    with FakeIMAPServer() as server:
+        host, port = server.address
+        consumer = Consumer(orders)
+        stop = threading.Event()
+
+        def loop():
+            while not stop.is_set():
+                with imaplib.IMAP4(host, port) as mail:
+                    mail.login("user", "pass")
+                    consumer.handle(mail)
+                    mail.logout()
+                stop.wait(poll_interval)
+
+        worker = threading.Thread(target=loop, daemon=True)
+        worker.start()
+        produce(server, consumer, orders, spacing)
+        consumer.done.wait(poll_interval * 2 + 5)
+        stop.set()
+        worker.join()
+        return consumer.latencies(), server.commands["logins"]
+
+
+def run_idle(orders, spacing):
+    with FakeIMAPServer() as server:
+        host, port = server.address
+        consumer = Consumer(orders)
+        listener = MailboxListener(host, "user", "pass", port=port, imap_class=imaplib.IMAP4)
+        worker = threading.Thread(target=listener.listen, args=(consumer.handle,), daemon=True)
+        worker.start()
+        produce(server, consumer, orders, spacing)
+        consumer.done.wait(5)
+        listener.stop()
+        worker.join()
+        return consumer.latencies(), server.commands["logins"]
+
+
+def report(name, latencies, logins):
+    ms = [l * 1000 for l in latencies]
+    print(f"{name:<8} orders={len(ms):3d} logins={logins:3d} "
+          f"mean={sum(ms) / max(len(ms), 1):8.1f} ms  p50={percentile(ms, 50):8.1f} ms  "
+          f"p95={percentile(ms, 95):8.1f} ms  max={max(ms, default=0):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=20)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    spacing = (0.05, 0.3)
+
+    random.seed(args.seed)
+    report("poll", *run_polling(args.orders, args.poll_interval, spacing))
+    random.seed(args.seed)
+    report("idle", *run_idle(args.orders, spacing))
+
+
+if __name__ == "__main__":
+    main()
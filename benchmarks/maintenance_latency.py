@@ -0,0 +1,104 @@
+"""
+Order wait behind cleaning, and first-pour time after a bottle change.
+
+An order arrives at a random moment during a cleaning cycle. With the
+blocking menu Clean it waits for the rest of the cycle. With Maintenance the
+cycle is stopped and the pour starts at once. After a bottle change, the
+first drink on that pump either fills the empty line itself or finds the
+line already primed in an idle window. Pumps are simulated in real time
+scaled down by `--speedup`, and times are reported scaled back up. The one
+exception is the maintenance wait, which is how long stopping takes
+(STOP_CHECK) and does not depend on pump speed.
+
+    python -m benchmarks.maintenance_latency --orders 20 --speedup 20
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+import maintenance
+from flow_model import pour_jobs
+from maintenance import CLEAN_SECONDS, Maintenance
+from pour_scheduler import PourScheduler, makespan
+from pump_driver import SimulatedPumpDriver, SystemClock
+from pump_index import PumpIndex
+from simulator import percentile
+
+MAX_CONCURRENT = 6
+DRINK = {"name": "bench", "ingredients": {"p1": 50, "p2": 25}}
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def machine(pump_configuration, speedup, **kwargs):
+    pumps = SimulatedPumpDriver(clock=SystemClock())
+    pumps.setup(p["pin"] for p in pump_configuration.values())
+    scheduler = PourScheduler(pumps.on, pumps.off, MAX_CONCURRENT)
+    return scheduler, Maintenance(scheduler, pump_configuration, flow_rate=0.6 / speedup, log=quiet, **kwargs)
+
+
+def wait_blocking(rng, clean):
+    """the menu Clean runs to the end before the next pour can start"""
+    return clean - rng.uniform(0, clean)
+
+
+def wait_maintenance(rng, pump_configuration, speedup, clean):
+    scheduler, upkeep = machine(pump_configuration, speedup, idle_after=0.0, clean_seconds=clean, clean_after=1)
+    upkeep.poured = 1
+    cleaning = threading.Thread(target=upkeep._run, args=upkeep.due())
+    cleaning.start()
+    time.sleep(rng.uniform(0, clean))
+    start = time.perf_counter()
+    with upkeep.pouring():
+        waited = time.perf_counter() - start
+    cleaning.join()
+    return waited
+
+
+def first_pour(pump_configuration, speedup, primed):
+    # pump_1 was empty and has just been given a fresh bottle of p1
+    empty = {k: dict(v, value=None) if k == "pump_1" else v for k, v in pump_configuration.items()}
+    scheduler, upkeep = machine(empty, speedup)
+    upkeep.update(pump_configuration)
+    if primed:
+        upkeep._run(*upkeep.due())
+    jobs = pour_jobs(DRINK, pump_configuration, PumpIndex(pump_configuration), 0.6 / speedup)
+    with upkeep.pouring(jobs):
+        start = time.perf_counter()
+        scheduler.run(jobs)
+        return time.perf_counter() - start, makespan(jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=20)
+    parser.add_argument("--speedup", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    maintenance.POLL = 0.01
+
+    with open("pump_config.json") as f:
+        pump_configuration = json.load(f)
+    clean = CLEAN_SECONDS / args.speedup
+
+    rng = random.Random(args.seed)
+    blocking = [wait_blocking(rng, clean) * args.speedup for _ in range(args.orders)]
+    rng = random.Random(args.seed)
+    aborted = [wait_maintenance(rng, pump_configuration, args.speedup, clean) for _ in range(args.orders)]
+    print(f"order arriving during cleaning ({CLEAN_SECONDS:g} s/pump, {args.orders} orders)")
+    for name, waits in (("menu Clean", blocking), ("maintenance", aborted)):
+        print(f"  {name:<12} wait p50={percentile(waits, 50):6.3f} s  p95={percentile(waits, 95):6.3f} s  "
+              f"max={max(waits):6.3f} s")
+
+    print("first pour after a bottle change")
+    for name, primed in (("unprimed", False), ("primed idle", True)):
+        elapsed, planned = first_pour(pump_configuration, args.speedup, primed)
+        print(f"  {name:<12} {elapsed * args.speedup:6.2f} s  (planned {planned * args.speedup:6.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Memory footprint of the bartender menu tree for a large catalog.
+
+Builds the menu for `--drinks` synthetic drinks and `--pumps` pumps with
+tracemalloc running, once with the slotted menu model and shared attribute
+records, and once with a replica of the original dict-based model, and
+reports the bytes held by each tree.
+
+    python -m benchmarks.menu_memory --drinks 10000 --pumps 16
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import random
+import tempfile
+import tracemalloc
+
+from bartender import Bartender
+
+
+class LegacyItem(object):
+    def __init__(self, type, name, attributes=None, visible=True):
+        self.type = type
+        self.name = name
+        self.attributes = attributes
+        self.visible = visible
+
+
+class LegacyMenu(LegacyItem):
+    def __init__(self, name):
+        LegacyItem.__init__(self, "menu", name)
+        self.options = []
+        self.selectedOption = 0
+        self.parent = None
+
+    def addOptions(self, options):
+        self.options = self.options + options
+
+
+def legacy_tree(drinks, options, configuration):
+    """The original buildMenu, against the original classes."""
+    m = LegacyMenu("Main Menu")
+    for d in drinks:
+        m.addOptions([LegacyItem('drink', d['name'], {'ingredients': d['ingredients']})])
+    config_menu = LegacyMenu("Configure")
+    for p in sorted(configuration):
+        submenu = LegacyMenu(configuration[p]['name'])
+        for opt in options:
+            sel = '*' if opt['value'] == configuration[p]['value'] else ''
+            submenu.addOptions([LegacyItem('pump_selection', f"{opt['name']} {sel}".strip(),
+                                           {'key': p, 'value': opt['value'], 'name': opt['name']})])
+        config_menu.addOptions([submenu])
+    m.addOptions([config_menu])
+    return m
+
+
+def catalog(drinks, pumps, seed=1):
+    rng = random.Random(seed)
+    options = [{"name": f"Ingredient {i}", "value": f"ing{i}"} for i in range(pumps * 2)]
+    values = [o["value"] for o in options]
+    drink_list = [{"name": f"Drink {i}",
+                   "ingredients": {v: rng.choice((15, 25, 50)) for v in rng.sample(values, rng.randint(1, 6))}}
+                  for i in range(drinks)]
+    configuration = {f"pump_{i + 1}": {"name": f"Pump {i + 1}", "pin": i + 2, "value": values[i]}
+                     for i in range(pumps)}
+    return drink_list, options, configuration
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tree = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--drinks", type=int, default=10000)
+    parser.add_argument("--pumps", type=int, default=16)
+    args = parser.parse_args()
+
+    drink_list, options, configuration = catalog(args.drinks, args.pumps)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        with open(os.path.join(tmp, "pump_config.json"), "w") as f:
+            json.dump(configuration, f)
+        os.chdir(tmp)
+        try:
+            bartender = Bartender()
+        finally:
+            os.chdir(cwd)
+
+        def build():
+            bartender.buildMenu(drink_list, options)
+            return bartender.menuContext
+
+        compact, _ = measure(build)
+        legacy, _ = measure(lambda: legacy_tree(drink_list, options, configuration))
+
+    print(f"{args.drinks} drinks, {args.pumps} pumps, {len(options)} options per pump")
+    print(f"  dict-based menu   {legacy / 1024:9.1f} KiB")
+    print(f"  slotted menu      {compact / 1024:9.1f} KiB  (includes requirement masks"
+          f" and the visible-option index)")
+
+
+if __name__ == "__main__":
+    main()
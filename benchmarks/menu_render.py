@@ -0,0 +1,89 @@
+"""
+Keypress latency of the bartender menu on a large synthetic catalog.
+
+Times an "n" keypress (advance + showMenu) with dirty tracking, the same
+keypress when the whole tree is invalidated first (what every keypress cost
+before), and a pump reassignment, which only invalidates the drinks using the
+old or new ingredient.
+
+    python -m benchmarks.menu_render --drinks 5000
+"""
+import argparse
+import contextlib
+import os
+import random
+import time
+
+from bartender import Bartender
+from drinks import drink_options
+
+
+def synthetic_drinks(count, seed=1):
+    """Drinks over p1..p6 plus ingredients no pump holds, so many are hidden."""
+    rng = random.Random(seed)
+    pool = [o["value"] for o in drink_options] + [f"x{i}" for i in range(6)]
+    return [{"name": f"Drink {i}",
+             "ingredients": {ing: rng.choice((15, 25, 50)) for ing in rng.sample(pool, rng.randint(1, 4))}}
+            for i in range(count)]
+
+
+def invalidate_all(menu):
+    menu.invalidate()
+    for opt in menu.options:
+        if opt.type == "menu":
+            invalidate_all(opt)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--drinks", type=int, default=5000)
+    parser.add_argument("--presses", type=int, default=200)
+    args = parser.parse_args()
+
+    # keep the benchmark from rewriting the real pump_config.json
+    Bartender.writePumpConfiguration = staticmethod(lambda configuration: None)
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        bartender = Bartender()
+        bartender.buildMenu(synthetic_drinks(args.drinks), drink_options)
+        context = bartender.menuContext
+
+        def press_next():
+            context.advance()
+            context.showMenu()
+
+        def press_next_full():
+            invalidate_all(context.topLevelMenu)
+            press_next()
+
+        incremental = timed(press_next, args.presses)
+        full = timed(press_next_full, max(1, args.presses // 10))
+
+        config_menu = context.topLevelMenu.options[-1]
+        pump_menu = config_menu.options[0]
+        choices = [o for o in pump_menu.options if o.type == "pump_selection"]
+
+        rng = random.Random(2)
+
+        def reassign():
+            item = rng.choice(choices)
+            bartender.menuItemClicked(item)
+            context.showMenu()
+
+        reconfigure = timed(reassign, max(1, args.presses // 10))
+        visible = sum(1 for o in context.topLevelMenu.options if o.visible)
+
+    print(f"{args.drinks} drinks ({visible} visible)")
+    print(f"  next, dirty-tracked   {incremental * 1e3:8.3f} ms/keypress")
+    print(f"  next, full re-render  {full * 1e3:8.3f} ms/keypress")
+    print(f"  pump reassignment     {reconfigure * 1e3:8.3f} ms/keypress")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Headless end-to-end order flow on simulated pumps.
+
+Wires the same pieces as the SMS daemon (MailboxListener, OrderQueue,
+OrderPipeline, PourScheduler, ConfirmationSender) against a local
+FakeIMAPServer and FakeSMTPServer, with a SimulatedPumpDriver on a
+VirtualClock in place of the relays. Delivers `--orders` SMS orders at once
+and reports wall time until every acknowledgement and "ready" message has
+gone out, next to the pump time the same orders take on the machine.
+
+    python -m benchmarks.order_flow --orders 50
+"""
+import argparse
+import imaplib
+import json
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+from catalog import RecipeCatalog
+from confirmations import ConfirmationSender
+from drinks import drink_list
+from fake_mail import FakeIMAPServer, FakeSMTPServer
+from flow_model import pour_jobs
+from mailbox_listener import MailboxListener, fetch_text_bodies
+from order_pipeline import OrderPipeline
+from order_queue import OrderQueue
+from pour_scheduler import PourScheduler
+from pump_driver import RecordingPumpDriver, VirtualClock
+from pump_index import PumpIndex
+
+SENDER = "phone@sms.example.com"
+SUBJECT = "Coffee Decision"
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+class Station(object):
+    """The daemon's glue functions, bound to fake servers and simulated pumps."""
+
+    def __init__(self, imap, smtp, pump_configuration):
+        self.pump_configuration = pump_configuration
+        self.catalog = RecipeCatalog(drink_list)
+        self.index = PumpIndex(pump_configuration, self.catalog)
+        self.pumps = RecordingPumpDriver(clock=VirtualClock())
+        self.pumps.setup(p["pin"] for p in pump_configuration.values())
+        self.scheduler = PourScheduler(self.pumps.on, self.pumps.off, 6,
+                                       clock=self.pumps.clock.now, sleep=self.pumps.clock.sleep)
+        host, port = imap.address
+        self.listener = MailboxListener(host, "user", "pass", port=port,
+                                        imap_class=imaplib.IMAP4, log=quiet)
+        host, port = smtp.address
+        self.confirmations = ConfirmationSender(host, "user", "pass", port=port,
+                                                smtp_class=smtplib.SMTP, batch_window=0.01, log=quiet)
+        self.orders = OrderQueue(":memory:", log=quiet)
+        self.pipeline = OrderPipeline(self.listener, self.orders, self.fetch, self.catalog.find,
+                                      self.pour, self.notify, log=quiet)
+
+    def fetch(self, mail):
+        mail.select("inbox")
+        typ, data = mail.uid("SEARCH", None, f'(UNSEEN SUBJECT "{SUBJECT}" FROM "{SENDER}")')
+        bodies = fetch_text_bodies(mail, data[0].split())
+        return [(uid, text.strip().lower()) for uid, text in bodies.items()]
+
+    def pour(self, drink):
+        self.scheduler.run(pour_jobs(drink, self.pump_configuration, self.index))
+
+    def notify(self, kind, order):
+        if kind not in ("accepted", "ready"):
+            return
+        msg = EmailMessage()
+        msg["Subject"] = f"{order.drink} {kind} – {SUBJECT}"
+        msg["From"] = "bartender@example.com"
+        msg["To"] = SENDER
+        msg.set_content(order.drink)
+        self.confirmations.send(msg)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=50)
+    args = parser.parse_args()
+
+    with open("pump_config.json") as f:
+        pump_configuration = json.load(f)
+
+    with FakeIMAPServer() as imap, FakeSMTPServer() as smtp:
+        station = Station(imap, smtp, pump_configuration)
+        station.confirmations.start()
+        station.pipeline.start()
+        intake = threading.Thread(target=station.pipeline.run, daemon=True)
+
+        start = time.perf_counter()
+        intake.start()
+        for i in range(args.orders):
+            imap.deliver(SENDER, SUBJECT, drink_list[i % len(drink_list)]["name"])
+        delivered = smtp.wait_for(2 * args.orders, timeout=60)
+        elapsed = time.perf_counter() - start
+
+        station.pipeline.stop()
+        intake.join()
+        station.confirmations.stop()
+
+    pumps = station.pumps
+    switches = len(pumps.events)
+    print(f"{args.orders} orders, {len(smtp.messages)} messages sent"
+          f"{'' if delivered else ' (timed out)'}")
+    print(f"  wall time          {elapsed * 1e3:10.1f} ms  ({elapsed / args.orders * 1e3:.2f} ms/order)")
+    print(f"  simulated pumping  {pumps.clock.now():10.1f} s   ({switches} pump switches, "
+          f"at most {pumps.driver.peak} pumps on at once)")
+    for pin, seconds in sorted(pumps.driver.on_time.items()):
+        print(f"    pin {pin:>2}  on for {seconds:8.1f} s")
+
+
+if __name__ == "__main__":
+    main()
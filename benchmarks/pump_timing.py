@@ -0,0 +1,96 @@
+"""
+Pump on-time error: sleep-per-thread pours versus the deadline timer.
+
+Pours `--drinks` synthetic drinks of six pumps each on a simulated driver in
+real time, once the way bartender.pour used to (a thread per pump calling
+time.sleep(wait)) and once through PourScheduler's DeadlineTimer, and reports
+commanded-versus-actual on-time error percentiles. `--load N` keeps N
+busy-looping processes running meanwhile to show how each holds up under
+CPU contention.
+
+    python -m benchmarks.pump_timing --drinks 10 --load 4
+"""
+import argparse
+import multiprocessing
+import random
+import threading
+import time
+
+from pour_scheduler import PourJob, PourScheduler
+from pump_driver import SimulatedPumpDriver, SystemClock
+from pump_timing import TOLERANCE, TimingStats
+
+PINS = (17, 27, 22, 23, 24, 25)
+
+
+def burn(stop):
+    while not stop.is_set():
+        sum(range(10000))
+
+
+def drinks(count, seed=1):
+    rng = random.Random(seed)
+    return [[(pin, rng.uniform(0.05, 0.5)) for pin in PINS] for _ in range(count)]
+
+
+def run_threads(recipes):
+    """the original pour: one thread per pump, relative sleeps"""
+    pumps = SimulatedPumpDriver(clock=SystemClock())
+    stats = TimingStats()
+
+    def pour(pin, wait):
+        pumps.on(pin)
+        on = time.monotonic()
+        time.sleep(wait)
+        pumps.off(pin)
+        stats.record(pin, wait, time.monotonic() - on)
+
+    for recipe in recipes:
+        threads = [threading.Thread(target=pour, args=run) for run in recipe]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return stats
+
+
+def run_scheduler(recipes):
+    pumps = SimulatedPumpDriver(clock=SystemClock())
+    scheduler = PourScheduler(pumps.on, pumps.off)
+    for recipe in recipes:
+        scheduler.run([PourJob(pin, wait) for pin, wait in recipe])
+    return scheduler.stats, scheduler.timer.lag
+
+
+def report(name, stats):
+    p = stats.percentiles((50, 95, 99, 100))
+    print(f"  {name:<16} p50={p[50] * 1e3:6.2f} ms  p95={p[95] * 1e3:6.2f} ms  "
+          f"p99={p[99] * 1e3:6.2f} ms  max={p[100] * 1e3:6.2f} ms  "
+          f"{'within' if stats.within() else 'OUTSIDE'} {TOLERANCE * 1e3:.0f} ms at p99")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--drinks", type=int, default=10)
+    parser.add_argument("--load", type=int, default=0, help="busy processes running alongside")
+    args = parser.parse_args()
+
+    recipes = drinks(args.drinks)
+    stop = multiprocessing.Event()
+    burners = [multiprocessing.Process(target=burn, args=(stop,), daemon=True) for _ in range(args.load)]
+    for p in burners:
+        p.start()
+    try:
+        print(f"{args.drinks * len(PINS)} pump runs, {args.load} busy processes")
+        report("thread + sleep", run_threads(recipes))
+        stats, lag = run_scheduler(recipes)
+        report("deadline timer", stats)
+        print(f"  learned switch lag {lag * 1e3:.3f} ms")
+    finally:
+        stop.set()
+        for p in burners:
+            p.join()
+
+
+if __name__ == "__main__":
+    main()
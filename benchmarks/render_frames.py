@@ -0,0 +1,125 @@
+"""
+Display and LED traffic during a pour: eager drawing versus FrameBuffer.
+
+Replays the console progress bar and the pouring animation on the LED strip
+for a `--seconds` pour, once drawing straight to the device (every progress
+step written and flushed, every pixel set and shown on every animation step)
+and once through FrameBuffer as bartender.py does now, where the bar is only
+redrawn when one more of its PROGRESS_WIDTH characters fills. The devices
+count region writes and commits (flush / show) and busy-wait `--write-us` and
+`--commit-us` microseconds per call, the way a bus transfer holds the CPU;
+time is simulated, so only the drawing and the device calls are measured.
+
+    python -m benchmarks.render_frames --seconds 5
+"""
+import argparse
+import time
+
+from bartender import COMET_TAIL, LIGHTS_FPS, LIGHTS_STEP, NUMBER_NEOPIXELS, PROGRESS_FPS, PROGRESS_WIDTH
+from frame_buffer import FrameBuffer
+
+
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class CountingDevice(object):
+    def __init__(self, write_cost, commit_cost):
+        self.write_cost = write_cost
+        self.commit_cost = commit_cost
+        self.writes = 0
+        self.commits = 0
+
+    def write(self, region, value):
+        self.writes += 1
+        spin(self.write_cost)
+
+    def commit(self):
+        self.commits += 1
+        spin(self.commit_cost)
+
+
+class Clock(object):
+    def __init__(self):
+        self.t = 0.0
+
+    def now(self):
+        return self.t
+
+
+def bar(filled, x):
+    return f"\rProgress: [{'#' * filled + '-' * (PROGRESS_WIDTH - filled)}] {x}%"
+
+
+def eager_progress(device, wait):
+    for x in range(1, 101):
+        device.write("progress", bar(int(PROGRESS_WIDTH * x / 100), x))
+        device.commit()
+
+
+def buffered_progress(device, wait):
+    clock = Clock()
+    frames = FrameBuffer(device.write, device.commit, fps=PROGRESS_FPS, clock=clock.now)
+    filled = 0
+    while True:
+        done = clock.t / wait
+        filled = min(PROGRESS_WIDTH, max(filled + 1, int(PROGRESS_WIDTH * done)))
+        x = 100 if filled == PROGRESS_WIDTH else min(99, max(100 * filled // PROGRESS_WIDTH, int(100 * done)))
+        frames.draw("progress", bar(filled, x))
+        frames.present(force=x == 100)
+        if x == 100:
+            return
+        clock.t += max(wait * (filled + 1) / PROGRESS_WIDTH - clock.t, frames.due())
+
+
+def comet(head, i):
+    return 0xFF8000 if (head - i) % NUMBER_NEOPIXELS < COMET_TAIL else 0
+
+
+def eager_lights(device, wait):
+    for head in range(int(wait / LIGHTS_STEP)):
+        for i in range(NUMBER_NEOPIXELS):
+            device.write(i, comet(head, i))
+        device.commit()
+
+
+def buffered_lights(device, wait):
+    clock = Clock()
+    frames = FrameBuffer(device.write, device.commit, fps=LIGHTS_FPS, clock=clock.now)
+    head = -1
+    while clock.t < wait:
+        head = max(head + 1, int(clock.t / LIGHTS_STEP))
+        for i in range(NUMBER_NEOPIXELS):
+            frames.draw(i, comet(head, i))
+        frames.present()
+        clock.t += max((head + 1) * LIGHTS_STEP - clock.t, frames.due())
+
+
+def measure(render, wait, write_cost, commit_cost):
+    device = CountingDevice(write_cost, commit_cost)
+    start = time.process_time()
+    render(device, wait)
+    return device, time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0, help="length of the simulated pour")
+    parser.add_argument("--write-us", type=float, default=5.0, help="CPU cost of one region write")
+    parser.add_argument("--commit-us", type=float, default=200.0, help="CPU cost of one flush / show")
+    args = parser.parse_args()
+
+    costs = (args.write_us * 1e-6, args.commit_us * 1e-6)
+    print(f"{args.seconds:.1f} s pour, {args.write_us:.0f} µs per write, {args.commit_us:.0f} µs per commit")
+    for name, eager, buffered in (("progress bar", eager_progress, buffered_progress),
+                                  ("LED strip", eager_lights, buffered_lights)):
+        for mode, render in (("eager", eager), ("framed", buffered)):
+            device, cpu = measure(render, args.seconds, *costs)
+            print(f"  {name:<13} {mode:<7} {device.writes:6d} writes  {device.commits:5d} commits  "
+                  f"{cpu * 1e3:8.2f} ms CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""
+Benchmark suite for the menu, catalog, scheduling and messaging hot paths.
+
+Runs every case headless on synthetic workloads sized by `--scale`. It writes
+the results to a JSON file and compares them with a stored baseline. The
+process exits with status 1 if any metric is more than `--tolerance` slower
+than the baseline, so a regression is caught before it reaches a machine.
+
+Each metric is in seconds and lower is better. A timed metric is the best of
+`--repeat` runs, which is less noisy than the mean. Each run loops over many
+operations (milliseconds of work at least) and is divided by their number,
+so the timer's resolution and one-off stalls do not decide the result.
+Untimed metrics such as the planned makespan are recorded as they are.
+
+    python -m benchmarks.suite                      # run and compare with benchmarks/baseline.json
+    python -m benchmarks.suite --only menu catalog
+    python -m benchmarks.suite --save-baseline      # accept the current numbers
+
+Baselines only compare on the same hardware, so benchmarks/baseline.json is
+not committed: the first run on a machine saves its results as that
+machine's baseline, and a baseline from another machine or Python version is
+not compared against. Timings on a busy Pi still vary by a fair fraction
+from run to run, which is why the tolerance is wide.
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import imaplib
+import json
+import os
+import platform
+import random
+import smtplib
+import sys
+import tempfile
+import time
+
+from bartender import Bartender
+from benchmarks.catalog_load import synthetic, write_files
+from benchmarks.confirmation_throughput import confirmation
+from benchmarks.menu_render import invalidate_all, synthetic_drinks
+from catalog import RecipeCatalog, load_catalog
+from drinks import drink_list, drink_options
+from fake_mail import FakeIMAPServer, FakeSMTPServer
+from flow_model import pour_jobs
+from mailbox_listener import fetch_text_bodies, mark_seen
+from pour_planner import PourPlanner
+from pour_scheduler import makespan, plan_pours
+from pump_index import PumpIndex
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "baseline.json")
+RESULTS = "bench_results.json"
+TOLERANCE = 0.60      # fraction slower than the baseline that counts as a regression; runs vary by ~30 %
+SENDER = "phone@sms.example.com"
+CRITERIA = f'(UNSEEN SUBJECT "Coffee Decision" FROM "{SENDER}")'
+
+CASES = []
+
+
+def case(name):
+    """registers a benchmark case: a function(run, scale) that records metrics on `run`"""
+    def register(fn):
+        CASES.append((name, fn))
+        return fn
+    return register
+
+
+class Run(object):
+    """Collects the metrics of one case under "<case>.<metric>" names."""
+
+    def __init__(self, name, repeat):
+        self.name = name
+        self.repeat = repeat
+        self.results = {}
+
+    def time(self, metric, fn, count=1, setup=None):
+        """
+        records the best of `repeat` runs of fn(), per `count` operations;
+        setup() runs untimed first. As in timeit, the garbage collector is off
+        while fn() runs, so a collection of the menus' heap does not land in
+        one sample.
+        """
+        best = None
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                fn()
+                elapsed = (time.perf_counter() - start) / count
+            finally:
+                gc.enable()
+            best = elapsed if best is None else min(best, elapsed)
+        self.results[f"{self.name}.{metric}"] = best
+
+    def value(self, metric, value):
+        self.results[f"{self.name}.{metric}"] = value
+
+
+def many_pumps(count):
+    """`count` pumps with one ingredient each, plus the drink options to assign them"""
+    configuration = {f"pump_{i + 1}": {"name": f"Pump {i + 1}", "pin": 100 + i, "value": f"i{i}"}
+                     for i in range(count)}
+    options = [{"name": f"Ingredient {i}", "value": f"i{i}"} for i in range(count + count // 4)]
+    return configuration, options
+
+
+def many_pump_drinks(count, ingredients, seed=1):
+    """drinks over `ingredients` names, some of which no pump holds"""
+    rng = random.Random(seed)
+    return [{"name": f"Drink {i}",
+             "ingredients": {f"i{j}": rng.choice((15, 25, 50)) for j in rng.sample(range(ingredients), rng.randint(1, 4))}}
+            for i in range(count)]
+
+
+@contextlib.contextmanager
+def bartender(pump_configuration=None):
+    """a Bartender on `pump_configuration` (default pump_config.json) that prints nothing and never saves"""
+    saved = (Bartender.readPumpConfiguration, Bartender.writePumpConfiguration)
+    if pump_configuration is not None:
+        Bartender.readPumpConfiguration = staticmethod(lambda: pump_configuration)
+    Bartender.writePumpConfiguration = staticmethod(lambda configuration: None)
+    try:
+        with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+            yield Bartender()
+    finally:
+        Bartender.readPumpConfiguration, Bartender.writePumpConfiguration = saved
+
+
+@case("menu")
+def menu_case(run, scale):
+    drinks = synthetic_drinks(int(2000 * scale))
+    presses = 1000
+    builds = 5
+    renders = 100
+    with bartender() as b:
+        def build():
+            for _ in range(builds):
+                b.buildMenu(drinks, drink_options)
+
+        run.time("build", build, builds)
+        context = b.menuContext
+
+        def press_next():
+            for _ in range(presses):
+                context.advance()
+                context.showMenu()
+
+        def render_all():
+            for _ in range(renders):
+                invalidate_all(context.topLevelMenu)
+                context.showMenu()
+
+        run.time("advance", press_next, presses)
+        run.time("render_all", render_all, renders)
+
+        pump_menu = context.topLevelMenu.options[-1].options[0]
+        choices = [o for o in pump_menu.options if o.type == "pump_selection"]
+        rng = random.Random(2)
+
+        def reassign():
+            for _ in range(presses):
+                b.menuItemClicked(rng.choice(choices))
+                context.showMenu()
+
+        run.time("reassign", reassign, presses)
+
+
+@case("filter")
+def filter_case(run, scale):
+    pumps = max(8, int(64 * scale))
+    configuration, options = many_pumps(pumps)
+    drinks = many_pump_drinks(int(2000 * scale), len(options))
+    with bartender(configuration) as b:
+        b.buildMenu(drinks, options)
+        menu = b.drinkMenu
+        run.time("filterDrinks", lambda: b.filterDrinks(menu, menu.options), len(menu.options))
+        index = b.pumpIndex
+        rng = random.Random(3)
+        keys = sorted(configuration)
+        values = [o["value"] for o in options]
+        assignments = [(rng.choice(keys), rng.choice(values)) for _ in range(20000)]
+
+        def assign():
+            for key, value in assignments:
+                index.assign(key, value)
+
+        run.time("assign", assign, len(assignments))
+
+
+@case("catalog")
+def catalog_case(run, scale):
+    drinks = synthetic(int(5000 * scale))
+    rng = random.Random(2)
+    # find_drink_by_name is catalog.find on whatever case the SMS arrived in
+    queries = [rng.choice(("drink {}", "Drink {}", "DRINK {}")).format(rng.randrange(len(drinks)))
+               for _ in range(2000)]
+    catalog = RecipeCatalog(drinks)
+    rounds = 10
+
+    def find():
+        for _ in range(rounds):
+            for q in queries:
+                catalog.find(q)
+
+    run.time("find_drink_by_name", find, rounds * len(queries))
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path, _ = write_files(drinks, tmp)
+        cache = json_path + ".cache"
+        loads = 10
+
+        def load_cold():
+            for _ in range(loads):
+                os.remove(cache)
+                load_catalog(json_path, cache)
+
+        def load_cached():
+            for _ in range(loads):
+                load_catalog(json_path, cache)
+
+        load_catalog(json_path, cache)
+        run.time("load_cold", load_cold, loads)
+        run.time("load_cached", load_cached, loads)
+
+
+@case("schedule")
+def schedule_case(run, scale):
+    with open("pump_config.json") as f:
+        pump_configuration = json.load(f)
+    index = PumpIndex(pump_configuration)
+    makeable = [d for d in drink_list if index.can_make(index.requirement(d["ingredients"]))]
+    orders = [(i, makeable[i % len(makeable)]) for i in range(int(40 * scale))]
+
+    def plan_each():
+        for _, drink in orders:
+            makespan(plan_pours(pour_jobs(drink, pump_configuration, index), max_concurrent=3))
+
+    run.time("plan_pours", plan_each, len(orders))
+    planner = PourPlanner(pump_configuration, index, max_concurrent=3, positions=2, lookahead=3)
+    run.time("planner", lambda: planner.plan(orders), len(orders))
+    run.value("makespan", planner.plan(orders).makespan)
+
+
+@case("mail")
+def mail_case(run, scale):
+    orders = max(1, int(200 * scale))
+    with FakeIMAPServer() as server:
+        host, port = server.address
+
+        def deliver():
+            for i in range(orders):
+                server.deliver(SENDER, "Coffee Decision", f"D{i % 7 + 1}")
+
+        with imaplib.IMAP4(host, port) as mail:
+            mail.login("user", "pass")
+            mail.select("inbox")
+
+            def pick_up():
+                typ, data = mail.uid("SEARCH", None, CRITERIA)
+                uids = data[0].split()
+                bodies = fetch_text_bodies(mail, uids)
+                mark_seen(mail, list(bodies))
+
+            run.time("imap_fetch", pick_up, orders, setup=deliver)
+            mail.logout()
+
+    messages = 50
+    with FakeSMTPServer() as server:
+        host, port = server.address
+
+        def send():
+            for i in range(messages):
+                with smtplib.SMTP(host, port) as smtp:
+                    smtp.login("user", "pass")
+                    smtp.send_message(confirmation(i))
+
+        run.time("smtp_send", send, messages)
+
+
+def compare(results, baseline, tolerance):
+    """returns (lines, regressions) comparing `results` with `baseline` metric by metric"""
+    lines = []
+    regressions = []
+    for name, value in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            lines.append(f"  {name:<28} {_seconds(value):>10}   (new)")
+            continue
+        ratio = value / before if before else float("inf") if value else 1.0
+        slower = ratio > 1 + tolerance
+        if slower:
+            regressions.append(name)
+        lines.append(f"  {name:<28} {_seconds(value):>10}   baseline {_seconds(before):>10}   "
+                     f"x{ratio:5.2f}{'   REGRESSION' if slower else ''}")
+    for name in sorted(set(baseline) - set(results)):
+        lines.append(f"  {name:<28} {'':>10}   baseline {_seconds(baseline[name]):>10}   (not run)")
+    return lines, regressions
+
+
+def _seconds(value):
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if abs(value) >= scale:
+            return f"{value / scale:.3f} {unit}"
+    return f"{value / 1e-9:.1f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=[name for name, _ in CASES], help="cases to run")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every workload size")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default=RESULTS, help="where to write the results")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args()
+
+    results = {}
+    for name, fn in CASES:
+        if args.only and name not in args.only:
+            continue
+        run = Run(name, args.repeat)
+        start = time.perf_counter()
+        fn(run, args.scale)
+        print(f"{name:<10} {len(run.results)} metrics in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+        results.update(run.results)
+
+    report = {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(), "machine": platform.machine(),
+              "scale": args.scale, "repeat": args.repeat, "results": results}
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = None
+    save_baseline = args.save_baseline or baseline is None
+    for path in [args.out] + ([args.baseline] if save_baseline else []):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if save_baseline:
+        for name, value in sorted(results.items()):
+            print(f"  {name:<28} {_seconds(value):>10}")
+        print(f"baseline saved to {args.baseline}" if args.save_baseline
+              else f"no baseline yet; these results were saved to {args.baseline} for the next run")
+        return 0
+    for key in ("machine", "python"):
+        if baseline.get(key) != report[key]:
+            print(f"baseline was run on {key} {baseline.get(key)}, not {report[key]}; not comparing "
+                  f"(run with --save-baseline to replace it)")
+            return 2
+    if baseline.get("scale") != args.scale:
+        print(f"baseline was run at --scale {baseline.get('scale')}, not {args.scale}; not comparing")
+        return 2
+
+    lines, regressions = compare(results, baseline["results"], args.tolerance)
+    for line in lines:
+        print(line)
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"no regressions over {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
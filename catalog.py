@@ -0,0 +1,109 @@
+"""
+Recipe catalog.
+
+Holds the drink list behind a name index that is case-folded once, so
+find() is a dict lookup instead of a scan calling .lower() on every drink.
+Large catalogs can live in a JSON or CSV file; load_catalog() parses the file
+once and keeps a compiled pickle next to it, reused until the source file's
+mtime or size changes.
+
+JSON files hold the same structure as drinks.drink_list:
+    [{"name": "D1", "ingredients": {"p1": 50, "p2": 150}}, ...]
+CSV files hold one row per ingredient, with a header:
+    name,ingredient,amount
+"""
+import csv
+import json
+import os
+import pickle
+import sys
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".cache"
+
+
+class RecipeCatalog(object):
+    def __init__(self, drinks, index=None):
+        self.drinks = list(drinks)
+        if index is None:
+            index = {}
+            for position, drink in enumerate(self.drinks):
+                index.setdefault(drink["name"].casefold(), position)
+        self._index = index
+
+    def __len__(self):
+        return len(self.drinks)
+
+    def __iter__(self):
+        return iter(self.drinks)
+
+    def __contains__(self, name):
+        return name.casefold() in self._index
+
+    def find(self, name):
+        """returns the drink called `name` (any case, surrounding space ignored) or None"""
+        position = self._index.get(name.strip().casefold())
+        return None if position is None else self.drinks[position]
+
+    def names(self):
+        return [drink["name"] for drink in self.drinks]
+
+
+def parse_json(path):
+    with open(path, encoding="utf-8") as f:
+        drinks = json.load(f)
+    # interned ingredient names are shared, which also keeps the pickled cache small
+    return [{"name": d["name"], "ingredients": {sys.intern(k): v for k, v in d["ingredients"].items()}}
+            for d in drinks]
+
+
+def parse_csv(path):
+    drinks = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = row["name"].strip()
+            drink = drinks.get(name)
+            if drink is None:
+                drink = drinks[name] = {"name": name, "ingredients": {}}
+            amount = float(row["amount"])
+            drink["ingredients"][sys.intern(row["ingredient"].strip())] = int(amount) if amount.is_integer() else amount
+    return list(drinks.values())
+
+
+def parse_file(path):
+    if path.lower().endswith(".csv"):
+        return parse_csv(path)
+    return parse_json(path)
+
+
+def load_catalog(path, cache_path=None):
+    """
+    Loads a recipe file through its compiled cache (`path` + ".cache" unless
+    `cache_path` is given), rebuilding the cache when the file has changed.
+
+    returns a RecipeCatalog
+    """
+    cache_path = cache_path or path + CACHE_SUFFIX
+    stat = os.stat(path)
+    key = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, drinks, index = pickle.load(f)
+        if cached_key == key:
+            return RecipeCatalog(drinks, index)
+    except Exception:
+        # a truncated or foreign cache can fail in almost any way (EOFError,
+        # UnpicklingError, ImportError, a tuple of the wrong shape...); the
+        # source file is the truth, so rebuild from it
+        pass
+
+    catalog = RecipeCatalog(parse_file(path))
+    tmp = cache_path + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump((key, catalog.drinks, catalog._index), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    except OSError:
+        # a read-only location just means no cache
+        pass
+    return catalog
@@ -0,0 +1,164 @@
+"""
+Pump configuration store.
+
+pump_config.json is shared by the console bartender, which edits it, and the
+SMS daemon, which pours from it. The store makes that safe and cheap:
+
+  * writes go to a temporary file that is fsync'ed and renamed over the
+    original, so a reader (or a power cut) never sees half a file;
+  * save() only records the latest configuration; a writer thread puts it
+    on disk once changes have been quiet for `debounce` seconds, so a burst
+    of menu clicks costs one write and never blocks the caller, not even
+    while a write and its fsync are in progress;
+  * watch() notices when another process replaces the file and hands the
+    new configuration to a callback. It compares the file's inode, mtime and
+    size every `poll` seconds, which catches atomic renames without needing
+    inotify; the store's own writes are not reported back to it.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import traceback
+
+DEBOUNCE = 0.5   # seconds without changes before a save is written
+POLL = 1.0       # seconds between checks for changes by other processes
+
+
+def write_atomic(path, text):
+    """Replaces `path` with `text` in one rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class ConfigStore(object):
+    def __init__(self, path="pump_config.json", debounce=DEBOUNCE, poll=POLL, log=print):
+        self.path = path
+        self.debounce = debounce
+        self.poll = poll
+        self.log = log
+        self.writes = 0
+        self._cond = threading.Condition()
+        self._io = threading.Lock()    # one write at a time, in save() order
+        self._pending = None       # serialized configuration waiting to be written
+        self._writing = False      # a write is replacing the file right now
+        self._changed = 0          # bumped by every save(), restarts the debounce
+        self._own = None           # signature of the file as this store last wrote or read it
+        self._writer = None
+        self._watcher = None
+        self._stopping = threading.Event()
+        atexit.register(self.flush)
+
+    def load(self):
+        with self._cond:
+            with open(self.path, encoding="utf-8") as f:
+                configuration = json.load(f)
+            self._own = _signature(self.path)
+        return configuration
+
+    def save(self, configuration):
+        """Queues `configuration` to be written; returns immediately."""
+        text = json.dumps(configuration, indent="\t")
+        with self._cond:
+            self._pending = text
+            self._changed += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="config-writer", daemon=True)
+                self._writer.start()
+            self._cond.notify_all()
+
+    def flush(self):
+        """Writes any pending configuration now."""
+        self._write_pending()
+
+    def _write_pending(self):
+        # the pending text is swapped out under the lock, but written and
+        # fsync'ed outside it, so save() never waits on the disk
+        with self._io:
+            with self._cond:
+                text, self._pending = self._pending, None
+                if text is None:
+                    return
+                self._writing = True
+            signature = self._own
+            try:
+                write_atomic(self.path, text)
+                signature = _signature(self.path)
+                self.writes += 1
+            except OSError:
+                self.log(f"Could not save {self.path}:")
+                traceback.print_exc()
+            finally:
+                with self._cond:
+                    self._own = signature
+                    self._writing = False
+
+    def _write_loop(self):
+        while not self._stopping.is_set():
+            with self._cond:
+                if self._pending is None:
+                    self._cond.wait()
+                    continue
+                # wait for a quiet spell; every save() in between restarts it
+                seen = self._changed
+                self._cond.wait(self.debounce)
+                if seen != self._changed:
+                    continue
+            self._write_pending()
+
+    def watch(self, callback):
+        """
+        Calls `callback(configuration)` on a background thread whenever the
+        file is replaced by someone else.
+        """
+        if self._own is None:
+            self._own = _signature(self.path)
+        self._watcher = threading.Thread(target=self._watch_loop, args=(callback,),
+                                         name="config-watcher", daemon=True)
+        self._watcher.start()
+        return self
+
+    def _watch_loop(self, callback):
+        while not self._stopping.wait(self.poll):
+            signature = _signature(self.path)
+            with self._cond:
+                if signature is None or signature == self._own or self._pending is not None or self._writing:
+                    continue
+            try:
+                configuration = self.load()
+            except ValueError:
+                # not valid JSON yet (a non-atomic editor); try again next poll
+                continue
+            except OSError:
+                continue
+            try:
+                callback(configuration)
+            except Exception:
+                traceback.print_exc()
+
+    def close(self):
+        self.flush()
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify_all()
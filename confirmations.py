@@ -0,0 +1,174 @@
+"""
+Background SMS confirmation sender.
+
+Confirmations are queued by the pour loop and delivered from a worker thread
+over one reused SMTP session, so the next pour never waits on a TLS handshake
+and login. Messages queued within `batch_window` seconds of each other go out
+together on the same session; failed messages are retried with backoff.
+"""
+import collections
+import smtplib
+import threading
+import time
+import traceback
+
+BATCH_WINDOW = 0.5       # seconds to keep collecting once a message is queued
+MAX_BATCH = 20
+IDLE_CLOSE = 120         # close the session after this long without traffic
+RETRY_INITIAL = 1.0
+RETRY_MAX = 60.0
+MAX_ATTEMPTS = 5
+
+
+class ConfirmationSender(object):
+    """
+    Owns a single SMTP connection and a queue of EmailMessages.
+
+    `smtp_class` defaults to SMTP_SSL; pass smtplib.SMTP and a port to talk to
+    a local FakeSMTPServer.
+    """
+
+    def __init__(self, host, user, password, port=465, smtp_class=smtplib.SMTP_SSL,
+                 batch_window=BATCH_WINDOW, max_batch=MAX_BATCH, idle_close=IDLE_CLOSE,
+                 retry_initial=RETRY_INITIAL, retry_max=RETRY_MAX,
+                 max_attempts=MAX_ATTEMPTS, log=print):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.smtp_class = smtp_class
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.idle_close = idle_close
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        self.log = log
+        self.sent = 0
+        self.dropped = 0
+        self.connects = 0
+        self._pending = collections.deque()     # (message, attempts, on_sent)
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._smtp = None
+        self._last_used = 0.0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="confirmations", daemon=True)
+        self._thread.start()
+        return self
+
+    def send(self, message, on_sent=None):
+        """
+        Queues `message` and returns immediately. `on_sent()` is called on the
+        sender thread once the message has been delivered.
+        """
+        with self._cond:
+            self._pending.append((message, 0, on_sent))
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stop(self, timeout=30):
+        """Delivers what is still queued (within `timeout`) and closes the session."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+
+    # ── worker ──────────────────────────────────────────────────────────────
+
+    def _run(self):
+        retry = self.retry_initial
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            if not batch:
+                self._close()
+                continue
+            failed = self._deliver(batch)
+            if not failed:
+                retry = self.retry_initial
+                continue
+            with self._cond:
+                for message, attempts, on_sent in reversed(failed):
+                    if attempts + 1 >= self.max_attempts:
+                        self.dropped += 1
+                        self.log(f"Giving up on confirmation '{message['Subject']}'")
+                    else:
+                        self._pending.appendleft((message, attempts + 1, on_sent))
+                self._cond.wait(retry)
+            retry = min(retry * 2, self.retry_max)
+        self._close()
+
+    def _next_batch(self):
+        """
+        returns the next batch to send, [] if the session has been idle for
+        `idle_close`, or None once stopping with nothing left to send
+        """
+        with self._cond:
+            if not self._pending:
+                if self._stopping:
+                    return None
+                if not self._cond.wait(self.idle_close if self._smtp else None):
+                    return []
+                if not self._pending:
+                    return None if self._stopping else []
+            # a message is waiting; give the busy window a moment to fill up
+            deadline = time.monotonic() + self.batch_window
+            while len(self._pending) < self.max_batch and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    break
+            count = min(len(self._pending), self.max_batch)
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _deliver(self, batch):
+        """Sends `batch` over the shared session. returns the items that failed."""
+        for i, (message, attempts, on_sent) in enumerate(batch):
+            try:
+                self._session().send_message(message)
+                self.sent += 1
+                self._last_used = time.monotonic()
+            except (smtplib.SMTPException, OSError):
+                traceback.print_exc()
+                self._close()
+                return batch[i:]
+            if on_sent is not None:
+                try:
+                    on_sent()
+                except Exception:
+                    traceback.print_exc()
+        return []
+
+    def _session(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > 30:
+            # servers drop quiet sessions; make sure this one is still alive
+            try:
+                self._smtp.noop()
+            except (smtplib.SMTPException, OSError):
+                self._close()
+        if self._smtp is None:
+            smtp = self.smtp_class(self.host, self.port)
+            try:
+                smtp.login(self.user, self.password)
+            except Exception:
+                smtp.close()
+                raise
+            self._smtp = smtp
+            self.connects += 1
+        return self._smtp
+
+    def _close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
@@ -53,6 +53,15 @@ drink_list = [
 	}
 ]
 
+drink_options = [
+	{"name": "P1", "value": "p1"},
+	{"name": "P2", "value": "p2"},
+	{"name": "P3", "value": "p3"},
+	{"name": "P4", "value": "p4"},
+	{"name": "P5", "value": "p5"},
+	{"name": "P6", "value": "p6"}
+]
+
 # drink_options = [
 # 	{"name": "Gin", "value": "gin"},
 # 	{"name": "Rum", "value": "rum"},
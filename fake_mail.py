@@ -0,0 +1,629 @@
+"""
+Local stand-in mail server for headless runs and benchmarks.
+
+FakeIMAPServer speaks enough plain-text IMAP4rev1 for imaplib and the
+MailboxListener: LOGIN, SELECT, SEARCH, FETCH, STORE (plain and UID forms),
+EXPUNGE, NOOP, IDLE and LOGOUT. Messages are delivered in-process with
+`deliver()`, and removed as another client would with `expunge()`; both wake
+any session sitting in IDLE, so order latency can be measured without Gmail. FakeSMTPServer accepts what smtplib.SMTP sends and keeps the
+messages for inspection.
+"""
+import imaplib
+import re
+import select
+import socket
+import socketserver
+import threading
+import time
+from collections import Counter
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+
+_TOKEN = re.compile(rb'"((?:[^"\\]|\\.)*)"|(\()|(\))|([^\s()"]+)')
+_FETCH_ITEM = re.compile(r'BODY(?:\.PEEK)?\[[^\]]*\](?:<\d+\.\d+>)?|[A-Z0-9.]+', re.I)
+
+
+def _tokens(data):
+    """Splits IMAP arguments into strings; parentheses become '(' / ')' tokens."""
+    out = []
+    for quoted, lpar, rpar, atom in _TOKEN.findall(data):
+        if lpar:
+            out.append("(")
+        elif rpar:
+            out.append(")")
+        elif atom:
+            out.append(atom.decode())
+        else:
+            out.append(re.sub(r'\\(.)', r'\1', quoted.decode()))
+    return out
+
+
+def _parse_set(spec, largest):
+    """Expands an IMAP sequence set such as '1,3:5,7:*'."""
+    values = set()
+    for part in spec.split(","):
+        lo, _, hi = part.partition(":")
+        lo = largest if lo == "*" else int(lo)
+        hi = lo if not hi else (largest if hi == "*" else int(hi))
+        values.update(range(min(lo, hi), max(lo, hi) + 1))
+    return values
+
+
+class FakeMessage(object):
+    def __init__(self, uid, raw, flags=()):
+        self.uid = uid
+        self.raw = raw
+        self.flags = set(flags)
+        self.arrived = time.time()
+        head, _, body = raw.partition(b"\r\n\r\n")
+        self.header = head + b"\r\n\r\n"
+        self.text = body
+        self._parsed = None
+
+    @property
+    def parsed(self):
+        if self._parsed is None:
+            self._parsed = message_from_bytes(self.raw)
+        return self._parsed
+
+    def header_fields(self, names, exclude=False):
+        wanted = {n.lower() for n in names}
+        lines = []
+        keep = False
+        for line in self.header.split(b"\r\n")[:-2]:
+            if line[:1] in (b" ", b"\t"):
+                if keep:
+                    lines.append(line)
+                continue
+            name = line.split(b":", 1)[0].decode().strip().lower()
+            keep = (name in wanted) != exclude
+            if keep:
+                lines.append(line)
+        return b"".join(l + b"\r\n" for l in lines) + b"\r\n"
+
+    def part(self, path):
+        """Returns (mime header, body) bytes of the dotted body part `path`."""
+        node = self.parsed
+        for index in path.split("."):
+            if node.is_multipart():
+                node = node.get_payload(int(index) - 1)
+            elif index != "1":
+                raise IndexError(path)
+        if node is self.parsed:
+            return b"", self.text
+        head, _, body = node.as_bytes(policy=policy.SMTP).partition(b"\r\n\r\n")
+        return head + b"\r\n\r\n", body
+
+    def section(self, spec):
+        spec = spec.upper()
+        if spec == "":
+            return self.raw
+        if spec == "HEADER":
+            return self.header
+        if spec == "TEXT":
+            return self.text
+        match = re.match(r'HEADER\.FIELDS(\.NOT)?\s*\((.*)\)$', spec)
+        if match:
+            return self.header_fields(match.group(2).split(), bool(match.group(1)))
+        if spec.endswith(".MIME"):
+            return self.part(spec[:-5])[0]
+        if spec.endswith(".TEXT"):
+            return self.part(spec[:-5])[1]
+        return self.part(spec)[1]
+
+    def matches(self, criteria, seq):
+        """Evaluates a flat SEARCH key list (implicit AND)."""
+        keys = [c for c in criteria if c not in ("(", ")")]
+        i = 0
+        while i < len(keys):
+            key = keys[i].upper()
+            i += 1
+            if key == "ALL":
+                continue
+            elif key in ("UNSEEN", "SEEN"):
+                if ("\\Seen" in self.flags) != (key == "SEEN"):
+                    return False
+            elif key in ("SUBJECT", "FROM", "TO", "BODY"):
+                needle = keys[i].lower()
+                i += 1
+                if key == "BODY":
+                    haystack = self.text.decode(errors="replace")
+                else:
+                    haystack = str(self.parsed.get(key, ""))
+                if needle not in haystack.lower():
+                    return False
+            elif key == "UID":
+                if self.uid not in _parse_set(keys[i], self.uid):
+                    return False
+                i += 1
+            elif key[0].isdigit() or key[0] == "*":
+                if seq not in _parse_set(key, seq):
+                    return False
+            else:
+                raise ValueError(f"unsupported SEARCH key {key}")
+        return True
+
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.fake.register(self)
+        self.selected = False
+        self.known = 0
+        self.expunged = []        # sequence numbers removed since this session last heard
+        self.tag = None
+        self.wake_r, self.wake_w = socket.socketpair()
+        # only drained while idling; a full pipe already means "wake up"
+        self.wake_w.setblocking(False)
+
+    def finish(self):
+        self.server.fake.unregister(self)
+        self.wake_r.close()
+        self.wake_w.close()
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+    def send(self, line):
+        if isinstance(line, str):
+            line = line.encode()
+        if self.tag and line.startswith(self.tag + b" "):
+            # like a real server, mail that arrived during a command is
+            # reported once, in that command's response
+            self.tag = None
+            self.report_exists()
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        self.send("* OK [CAPABILITY IMAP4rev1 IDLE UIDPLUS] Fake IMAP ready")
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                return
+            if not line:
+                return
+            tag, _, rest = line.rstrip(b"\r\n").partition(b" ")
+            command, _, args = rest.partition(b" ")
+            command = command.decode().upper()
+            self.tag = tag
+            tag = tag.decode()
+            fake = self.server.fake
+            fake.count(command)
+            try:
+                if not getattr(self, "cmd_" + command, None):
+                    self.send(f"{tag} BAD unknown command {command}")
+                    continue
+                if getattr(self, "cmd_" + command)(tag, args) is False:
+                    return
+            except (ValueError, IndexError) as e:
+                self.send(f"{tag} BAD {e}")
+            except OSError:
+                return
+
+    def notify(self):
+        try:
+            self.wake_w.send(b"!")
+        except OSError:
+            pass
+
+    def report_exists(self):
+        fake = self.server.fake
+        with fake.lock:
+            expunged, self.expunged = self.expunged, []
+            total = len(fake.messages)
+        if not self.selected:
+            return
+        for seq in expunged:
+            self.known -= 1
+            self.send(f"* {seq} EXPUNGE")
+        if total != self.known:
+            self.known = total
+            self.send(f"* {total} EXISTS")
+            self.send("* 1 RECENT")
+
+    # ── commands ────────────────────────────────────────────────────────────
+
+    def cmd_CAPABILITY(self, tag, args):
+        self.send("* CAPABILITY IMAP4rev1 IDLE UIDPLUS")
+        self.send(f"{tag} OK CAPABILITY completed")
+
+    def cmd_LOGIN(self, tag, args):
+        user, password = _tokens(args)[:2]
+        fake = self.server.fake
+        if fake.user is not None and (user, password) != (fake.user, fake.password):
+            self.send(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials")
+            return
+        fake.count("logins")
+        self.send(f"{tag} OK LOGIN completed")
+
+    def cmd_SELECT(self, tag, args):
+        fake = self.server.fake
+        with fake.lock:
+            total = len(fake.messages)
+            nxt = fake.next_uid
+            self.expunged = []
+        self.selected = True
+        self.known = total
+        self.send("* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)")
+        self.send(f"* {total} EXISTS")
+        self.send("* 0 RECENT")
+        self.send("* OK [UIDVALIDITY 1] UIDs valid")
+        self.send(f"* OK [UIDNEXT {nxt}] Predicted next UID")
+        self.send(f"{tag} OK [READ-WRITE] SELECT completed")
+
+    cmd_EXAMINE = cmd_SELECT
+
+    def cmd_NOOP(self, tag, args):
+        self.report_exists()
+        self.send(f"{tag} OK NOOP completed")
+
+    def cmd_EXPUNGE(self, tag, args):
+        fake = self.server.fake
+        with fake.lock:
+            deleted = [m.uid for m in fake.messages if "\\Deleted" in m.flags]
+        fake.expunge(deleted)
+        # the completion line reports this session's EXPUNGE responses first
+        self.send(f"{tag} OK EXPUNGE completed")
+
+    def cmd_CLOSE(self, tag, args):
+        self.selected = False
+        self.send(f"{tag} OK CLOSE completed")
+
+    def cmd_LOGOUT(self, tag, args):
+        self.send("* BYE Fake IMAP logging out")
+        self.send(f"{tag} OK LOGOUT completed")
+        return False
+
+    def cmd_IDLE(self, tag, args):
+        self.send("+ idling")
+        while True:
+            readable, _, _ = select.select([self.connection, self.wake_r], [], [])
+            if self.wake_r in readable:
+                self.wake_r.recv(64)
+                self.report_exists()
+            if self.connection in readable:
+                line = self.rfile.readline()
+                if not line:
+                    return False
+                if line.strip().upper() == b"DONE":
+                    break
+        self.send(f"{tag} OK IDLE terminated")
+
+    def cmd_UID(self, tag, args):
+        command, _, rest = args.partition(b" ")
+        command = command.decode().upper()
+        if command not in ("SEARCH", "FETCH", "STORE"):
+            raise ValueError(f"unsupported UID {command}")
+        self.server.fake.count("UID " + command)
+        getattr(self, "cmd_" + command)(tag, rest, uid=True)
+
+    def _select_messages(self, spec, uid):
+        messages = self.server.fake.messages
+        if uid:
+            largest = messages[-1].uid if messages else 0
+            wanted = _parse_set(spec, largest)
+            return [(i + 1, m) for i, m in enumerate(messages) if m.uid in wanted]
+        wanted = _parse_set(spec, len(messages))
+        return [(seq, messages[seq - 1]) for seq in sorted(wanted) if 0 < seq <= len(messages)]
+
+    def cmd_SEARCH(self, tag, args, uid=False):
+        criteria = _tokens(args)
+        if criteria and criteria[0].upper() == "CHARSET":
+            criteria = criteria[2:]
+        fake = self.server.fake
+        with fake.lock:
+            hits = [str(m.uid if uid else seq)
+                    for seq, m in enumerate(fake.messages, 1) if m.matches(criteria, seq)]
+        self.send("* SEARCH" + "".join(" " + h for h in hits))
+        self.send(f"{tag} OK SEARCH completed")
+
+    def cmd_FETCH(self, tag, args, uid=False):
+        spec, _, items = args.decode().partition(" ")
+        items = _FETCH_ITEM.findall(items.strip())
+        fake = self.server.fake
+        with fake.lock:
+            selected = self._select_messages(spec, uid)
+            for seq, message in selected:
+                parts = []
+                names = [i.upper() for i in items]
+                if uid and "UID" not in names:
+                    names.insert(0, "UID")
+                for name in names:
+                    if name == "UID":
+                        parts.append(f"UID {message.uid}".encode())
+                    elif name == "FLAGS":
+                        parts.append(f"FLAGS ({' '.join(sorted(message.flags))})".encode())
+                    elif name == "INTERNALDATE":
+                        parts.append(f"INTERNALDATE {imaplib.Time2Internaldate(message.arrived)}".encode())
+                    elif name in ("RFC822", "RFC822.HEADER", "RFC822.TEXT") or name.startswith("BODY"):
+                        if name == "RFC822":
+                            section, label = "", "RFC822"
+                        elif name == "RFC822.HEADER":
+                            section, label = "HEADER", "RFC822.HEADER"
+                        elif name == "RFC822.TEXT":
+                            section, label = "TEXT", "RFC822.TEXT"
+                        else:
+                            section = name[name.index("[") + 1:name.rindex("]")]
+                            label = f"BODY[{section}]"
+                        if not name.startswith("BODY.PEEK") and name != "RFC822.HEADER":
+                            message.flags.add("\\Seen")
+                        try:
+                            data = message.section(section)
+                        except IndexError:
+                            parts.append(f"{label} NIL".encode())
+                            continue
+                        parts.append(f"{label} {{{len(data)}}}\r\n".encode() + data)
+                    else:
+                        raise ValueError(f"unsupported FETCH item {name}")
+                self.wfile.write(f"* {seq} FETCH (".encode() + b" ".join(parts) + b")\r\n")
+        self.send(f"{tag} OK FETCH completed")
+
+    def cmd_STORE(self, tag, args, uid=False):
+        spec, mode, flags = args.decode().split(" ", 2)
+        flags = {f for f in _tokens(flags.encode()) if f not in ("(", ")")}
+        mode = mode.upper()
+        fake = self.server.fake
+        with fake.lock:
+            for seq, message in self._select_messages(spec, uid):
+                if mode.startswith("+"):
+                    message.flags |= flags
+                elif mode.startswith("-"):
+                    message.flags -= flags
+                else:
+                    message.flags = set(flags)
+                if not mode.endswith(".SILENT"):
+                    self.send(f"* {seq} FETCH (UID {message.uid} FLAGS ({' '.join(sorted(message.flags))}))")
+        self.send(f"{tag} OK STORE completed")
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeIMAPServer(object):
+    """
+    In-process IMAP server on localhost. Use as a context manager or call
+    start()/stop(). `address` is the (host, port) to connect imaplib.IMAP4 to.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, user=None, password=None):
+        self.user = user
+        self.password = password
+        self.messages = []
+        self.next_uid = 1
+        self.lock = threading.RLock()
+        self.commands = Counter()
+        self.sessions = set()
+        self._server = _ThreadingServer((host, port), _IMAPHandler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.drop_connections()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def register(self, session):
+        with self.lock:
+            self.sessions.add(session)
+
+    def unregister(self, session):
+        with self.lock:
+            self.sessions.discard(session)
+
+    def count(self, command):
+        with self.lock:
+            self.commands[command] += 1
+
+    def deliver(self, sender, subject, body, multipart=False, to="bartender@example.com"):
+        """
+        Adds a message to the inbox and wakes idling sessions.
+
+        returns the new message's UID
+        """
+        msg = EmailMessage()
+        msg["From"] = sender
+        msg["To"] = to
+        msg["Subject"] = subject
+        msg.set_content(body)
+        if multipart:
+            msg.add_alternative(f"<html><body>{body}</body></html>", subtype="html")
+        return self.deliver_raw(msg.as_bytes(policy=policy.SMTP))
+
+    def deliver_raw(self, raw):
+        with self.lock:
+            uid = self.next_uid
+            self.next_uid += 1
+            self.messages.append(FakeMessage(uid, raw))
+            sessions = list(self.sessions)
+        for session in sessions:
+            session.notify()
+        return uid
+
+    def expunge(self, uids):
+        """Removes the messages with `uids`, as another client deleting them would."""
+        with self.lock:
+            sessions = list(self.sessions)
+            for uid in uids:
+                for seq, message in enumerate(self.messages, 1):
+                    if message.uid == uid:
+                        del self.messages[seq - 1]
+                        for session in sessions:
+                            session.expunged.append(seq)
+                        break
+        for session in sessions:
+            session.notify()
+
+    def drop_connections(self):
+        """Closes every client connection, as a flaky network would."""
+        with self.lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            try:
+                session.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def flags(self, uid):
+        with self.lock:
+            for message in self.messages:
+                if message.uid == uid:
+                    return set(message.flags)
+        raise KeyError(uid)
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def send(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        fake = self.server.fake
+        fake.count("connections")
+        time.sleep(fake.handshake_delay)
+        self.send("220 fake.smtp ESMTP ready")
+        sender, recipients = None, []
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                return
+            if not line:
+                return
+            command, _, args = line.decode(errors="replace").rstrip("\r\n").partition(" ")
+            command = command.upper()
+            fake.count(command)
+            if command in ("EHLO", "HELO"):
+                if command == "EHLO":
+                    self.send("250-fake.smtp")
+                    self.send("250-AUTH PLAIN LOGIN")
+                    self.send("250 8BITMIME")
+                else:
+                    self.send("250 fake.smtp")
+            elif command == "AUTH":
+                time.sleep(fake.handshake_delay)
+                mechanism, _, initial = args.partition(" ")
+                if mechanism.upper() == "LOGIN":
+                    for prompt in ("VXNlcm5hbWU6", "UGFzc3dvcmQ6"):
+                        if not initial:
+                            self.send(f"334 {prompt}")
+                            self.rfile.readline()
+                        initial = ""
+                elif not initial:
+                    self.send("334 ")
+                    self.rfile.readline()
+                fake.count("logins")
+                self.send("235 2.7.0 Authentication successful")
+            elif command == "MAIL":
+                sender, recipients = args.split(":", 1)[1].strip().strip("<>"), []
+                self.send("250 OK")
+            elif command == "RCPT":
+                recipients.append(args.split(":", 1)[1].strip().strip("<>"))
+                self.send("250 OK")
+            elif command == "DATA":
+                self.send("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line == b".\r\n":
+                        break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                time.sleep(fake.send_delay)
+                if fake.take_failure():
+                    self.send("451 4.3.0 Temporary failure, try again")
+                else:
+                    fake.accept(sender, recipients, b"".join(lines))
+                    self.send("250 OK queued")
+            elif command in ("RSET", "NOOP"):
+                self.send("250 OK")
+            elif command == "QUIT":
+                self.send("221 Bye")
+                return
+            else:
+                self.send("502 Command not implemented")
+
+
+class FakeSMTPServer(object):
+    """
+    In-process SMTP server on localhost for smtplib.SMTP. `handshake_delay`
+    is added to the greeting and to AUTH to stand in for the TLS handshake and
+    login of a real SMTP_SSL session; `send_delay` is added to every DATA.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, handshake_delay=0.0, send_delay=0.0):
+        self.handshake_delay = handshake_delay
+        self.send_delay = send_delay
+        self.messages = []
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.commands = Counter()
+        self.received = threading.Condition(self.lock)
+        self._server = _ThreadingServer((host, port), _SMTPHandler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, command):
+        with self.lock:
+            self.commands[command] += 1
+
+    def fail_next(self, count=1):
+        """Rejects the next `count` messages with a temporary 451 error."""
+        with self.lock:
+            self.failures += count
+
+    def take_failure(self):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                return True
+            return False
+
+    def accept(self, sender, recipients, data):
+        with self.received:
+            self.messages.append((sender, recipients, message_from_bytes(data)))
+            self.received.notify_all()
+
+    def wait_for(self, count, timeout=None):
+        """Blocks until `count` messages have been accepted. returns True if so."""
+        with self.received:
+            return self.received.wait_for(lambda: len(self.messages) >= count, timeout)
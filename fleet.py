@@ -0,0 +1,541 @@
+"""
+Multi-station fleet: one coordinator, several machines.
+
+Standalone, every bartender polls the same inbox and would race its
+neighbours for the same orders. In a fleet only the coordinator reads mail
+and keeps the OrderQueue. Each station tells it what its pumps hold, and the
+coordinator sends every order to the station that can finish it soonest.
+
+Stations connect over TCP (localhost or the LAN) and speak one JSON object
+per line:
+
+    station → coordinator   {"type": "hello", "station": "bar-2", "pumps": {...}, "max_concurrent": 6}
+                            {"type": "pumps", "pumps": {...}}        a pump was reassigned
+                            {"type": "started", "order": 17}
+                            {"type": "done", "order": 17, "ok": true}
+                            {"type": "refused", "order": 17}       its bottles cannot cover it
+    coordinator → station   {"type": "pour", "order": 17, "drink": {"name": ..., "ingredients": {...}}}
+
+The coordinator estimates when each station will be free from the drinks it
+has sent there, planned with that station's own calibration and concurrency
+cap, and corrects the estimate on every "started" and "done". An order is
+only sent once its best station has fewer than PREFETCH drinks waiting, so
+orders bind late and a station that joins or frees up early still gets
+work. If a station
+disconnects, the orders it had not started are routed again. A drink it was
+pouring is marked failed rather than poured twice.
+
+Orders stay ASSIGNED in the OrderQueue until their station reports
+"started", so if the coordinator itself dies, the next start queues them
+again instead of marking them interrupted.
+
+Each station reserves a drink from its own inventory when it is sent, as
+the standalone intake does, and refuses it if its bottles cannot cover it.
+A refused order is routed to another station. When every station that holds
+its ingredients has refused it, the order fails.
+
+    FLEET_ROLE=coordinator python "CoffeeMaker - V2.py"
+    FLEET_ROLE=station python "CoffeeMaker - V2.py"           # on each machine
+    python fleet.py station --name sim-1 --speedup 60         # a simulated station
+"""
+import argparse
+import collections
+import json
+import queue
+import socket
+import socketserver
+import threading
+import time
+import traceback
+
+from flow_model import DEFAULT_FLOW_RATE, pour_jobs
+from order_queue import ASSIGNED, DONE, FAILED
+from pour_scheduler import PourScheduler, makespan, plan_pours
+from pump_driver import SimulatedPumpDriver, SystemClock
+from pump_index import PumpIndex
+
+HOST = "127.0.0.1"
+PORT = 9200
+CHANGEOVER = 10.0        # seconds between two drinks on one station (glass swap)
+POLL = 0.5               # seconds between stop checks while the queue is empty
+PREFETCH = 1             # drinks a station holds besides the one it is pouring
+RECONNECT_INITIAL = 1.0
+RECONNECT_MAX = 30.0
+
+
+class Connection(object):
+    """One JSON-lines socket; send() may be called from any thread."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+        self._wfile = sock.makefile("wb")
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        data = json.dumps(message).encode() + b"\n"
+        with self._lock:
+            self._wfile.write(data)
+            self._wfile.flush()
+
+    def messages(self):
+        """yields decoded messages until the peer disconnects"""
+        for line in self.rfile:
+            if line.strip():
+                yield json.loads(line)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class InFlight(object):
+    def __init__(self, order, drink, estimate):
+        self.order = order
+        self.drink = drink
+        self.estimate = estimate
+        self.started = None
+
+
+class StationLink(object):
+    """The coordinator's view of one connected station."""
+
+    def __init__(self, name, connection, pump_configuration, max_concurrent, flow_rate):
+        self.name = name
+        self.connection = connection
+        self.max_concurrent = max_concurrent
+        self.flow_rate = flow_rate
+        self.in_flight = collections.OrderedDict()   # order id -> InFlight, in pour order
+        self.free_at = 0.0
+        self.poured = 0
+        self.update(pump_configuration)
+
+    def update(self, pump_configuration):
+        self.pump_configuration = pump_configuration
+        self.index = PumpIndex(pump_configuration)
+
+    def can_make(self, drink):
+        return self.index.can_make(self.index.requirement(drink["ingredients"]))
+
+    def estimate(self, drink):
+        """seconds this station's pumps take for `drink`"""
+        jobs = pour_jobs(drink, self.pump_configuration, self.index, self.flow_rate)
+        return makespan(plan_pours(jobs, self.max_concurrent))
+
+    def waiting(self):
+        """drinks sent here that have not started"""
+        return sum(1 for entry in self.in_flight.values() if entry.started is None)
+
+    def replan(self, now, changeover):
+        """Recomputes when the drinks sent here will be done."""
+        t = now
+        for entry in self.in_flight.values():
+            if entry.started is not None:
+                t = max(t, entry.started + entry.estimate)
+            else:
+                t += entry.estimate
+            t += changeover
+        self.free_at = t
+
+
+class Coordinator(object):
+    """
+    Routes the orders in `queue` to connected stations. `find_drink(name)`
+    returns a recipe; `notify(kind, order)` is called with "pouring",
+    "ready" or "failed" as stations report back. can_make() is meant as the
+    intake's `admit` hook.
+    """
+
+    def __init__(self, queue, find_drink, notify, host=HOST, port=PORT, flow_rate=DEFAULT_FLOW_RATE,
+                 changeover=CHANGEOVER, prefetch=PREFETCH, clock=time.monotonic, log=print):
+        self.queue = queue
+        self.find_drink = find_drink
+        self.notify = notify
+        self.flow_rate = flow_rate
+        self.changeover = changeover
+        self.prefetch = prefetch
+        self.clock = clock
+        self.log = log
+        self.stations = {}            # name -> StationLink, connected
+        self.known = {}               # name -> StationLink, including stations that dropped out
+        self._waiting = collections.deque()
+        self._refused = {}            # order id -> names of the stations that refused it
+        self._lock = threading.RLock()
+        self._stopping = False
+        self._server = self._make_server(host, port)
+        self._threads = []
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        for target, name in ((self._server.serve_forever, "fleet-server"), (self._dispatch_loop, "fleet-dispatch")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.log(f"Fleet coordinator listening on {self.address[0]}:{self.address[1]}")
+        return self
+
+    def stop(self):
+        """Stops routing; orders not yet started at a station go back to the queue."""
+        self._stopping = True
+        self._server.shutdown()
+        self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        with self._lock:
+            for link in list(self.stations.values()):
+                link.connection.close()
+                self._drop(link)
+            for order in self._waiting:
+                self.queue.requeue(order)
+            self._waiting.clear()
+
+    def can_make(self, drink):
+        """
+        True if a station has every ingredient of `drink`. Stations that are
+        away (rebooting, say) still count, so their orders wait for them;
+        before any station has been seen, every drink is accepted.
+        """
+        with self._lock:
+            return not self.known or any(link.can_make(drink) for link in self.known.values())
+
+    def missing(self, drink):
+        """ingredients of `drink` that no station holds"""
+        with self._lock:
+            return [i for i in drink["ingredients"]
+                    if not any(link.index.pumps_for(i) for link in self.known.values())]
+
+    # ── routing ─────────────────────────────────────────────────────────────
+
+    def _dispatch_loop(self):
+        while not self._stopping:
+            order = self.queue.get(timeout=POLL, state=ASSIGNED)
+            with self._lock:
+                if order is not None:
+                    self._waiting.append(order)
+                self._route_waiting()
+
+    def _choose(self, drink, now, exclude=()):
+        """
+        returns (link, estimate) for the station that finishes `drink` first,
+        or (None, None) if none can make it or that station's queue is full.
+        Stations named in `exclude` are not considered.
+        """
+        best = None
+        for link in self.stations.values():
+            if link.name in exclude or not link.can_make(drink):
+                continue
+            estimate = link.estimate(drink)
+            finish = max(now, link.free_at) + estimate
+            if best is None or (finish, len(link.in_flight)) < best[0]:
+                best = ((finish, len(link.in_flight)), link, estimate)
+        if best is None or best[1].waiting() >= self.prefetch:
+            return None, None
+        return best[1:]
+
+    def _route_waiting(self):
+        kept = collections.deque()
+        while self._waiting:
+            order = self._waiting.popleft()
+            drink = self.find_drink(order.drink)
+            if drink is None:
+                self.log(f"'{order.drink}' is no longer on the menu")
+                self._finish(order, False)
+                continue
+            refused = self._refused.get(order.id, ())
+            if refused and not any(link.can_make(drink) for name, link in self.known.items() if name not in refused):
+                self.log(f"No station has enough left for '{order.drink}'")
+                self._finish(order, False)
+                continue
+            link, estimate = self._choose(drink, self.clock(), refused)
+            if link is None:
+                kept.append(order)
+                continue
+            try:
+                link.connection.send({"type": "pour", "order": order.id, "drink": drink})
+            except OSError:
+                self._drop(link)
+                kept.append(order)
+                continue
+            link.in_flight[order.id] = InFlight(order, drink, estimate)
+            link.free_at = max(self.clock(), link.free_at) + estimate + self.changeover
+        self._waiting = kept
+
+    def _finish(self, order, ok):
+        self._refused.pop(order.id, None)
+        self.queue.complete(order, DONE if ok else FAILED)
+        self.notify("ready" if ok else "failed", order)
+
+    # ── station connections ─────────────────────────────────────────────────
+
+    def _make_server(self, host, port):
+        coordinator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                coordinator._serve_station(Connection(self.request))
+
+        server = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=False)
+        server.allow_reuse_address = True
+        server.daemon_threads = True
+        server.server_bind()
+        server.server_activate()
+        return server
+
+    def _serve_station(self, connection):
+        link = None
+        try:
+            for message in connection.messages():
+                kind = message.get("type")
+                if link is None:
+                    if kind != "hello":
+                        break
+                    link = self._register(message, connection)
+                elif kind == "pumps":
+                    with self._lock:
+                        link.update(message["pumps"])
+                        self._route_waiting()
+                elif kind == "started":
+                    self._started(link, message["order"])
+                elif kind == "done":
+                    self._done(link, message["order"], message.get("ok", False))
+                elif kind == "refused":
+                    self._refuse(link, message["order"])
+        except (OSError, ValueError):
+            traceback.print_exc()
+        finally:
+            if link is not None:
+                with self._lock:
+                    self._drop(link)
+
+    def _register(self, message, connection):
+        with self._lock:
+            previous = self.stations.get(message["station"])
+            if previous is not None:
+                previous.connection.close()
+                self._drop(previous)
+            link = StationLink(message["station"], connection, message["pumps"],
+                               message.get("max_concurrent"), self.flow_rate)
+            self.stations[link.name] = self.known[link.name] = link
+            self.log(f"Station {link.name} joined the fleet ({len(self.stations)} connected)")
+            self._route_waiting()
+            return link
+
+    def _started(self, link, order_id):
+        with self._lock:
+            entry = link.in_flight.get(order_id)
+            if entry is None:
+                return
+            entry.started = self.clock()
+            link.replan(entry.started, self.changeover)
+            self._route_waiting()
+        self.queue.begin(entry.order)
+        self.notify("pouring", entry.order)
+
+    def _done(self, link, order_id, ok):
+        with self._lock:
+            entry = link.in_flight.pop(order_id, None)
+            if entry is None:
+                return
+            link.poured += 1
+            link.replan(self.clock(), self.changeover)
+            self._route_waiting()
+        self._finish(entry.order, ok)
+
+    def _refuse(self, link, order_id):
+        with self._lock:
+            entry = link.in_flight.pop(order_id, None)
+            if entry is None:
+                return
+            self.log(f"Station {link.name} cannot cover '{entry.order.drink}'; routing it elsewhere")
+            self._refused.setdefault(order_id, set()).add(link.name)
+            link.replan(self.clock(), self.changeover)
+            self._waiting.appendleft(entry.order)
+            self._route_waiting()
+
+    def _drop(self, link):
+        """
+        Forgets `link`: unstarted orders are routed again and a started one
+        has failed (on shutdown it is left pouring, to be marked interrupted
+        by the next start).
+        """
+        if self.stations.get(link.name) is not link:
+            return
+        del self.stations[link.name]
+        failed = []
+        for entry in reversed(link.in_flight.values()):
+            if entry.started is None:
+                self._waiting.appendleft(entry.order)
+            else:
+                failed.append(entry.order)
+        link.in_flight.clear()
+        if self._stopping:
+            return
+        self.log(f"Station {link.name} left the fleet; {len(failed)} drink(s) cut short")
+        for order in failed:
+            self._finish(order, False)
+        self._route_waiting()
+
+
+class StationClient(object):
+    """
+    Connects one machine to the coordinator: announces its pumps, pours what
+    it is sent one drink at a time with `pour(drink)` and reports back.
+    `admit(drink)`, if given, is asked as each drink arrives (e.g.
+    Inventory.reserve_for); a drink it refuses is sent back. `release(drink)`
+    gives back what admit() set aside for drinks that are dropped unpoured.
+    Reconnects with backoff; drinks queued here when the link drops are
+    forgotten, since the coordinator routes them again.
+    """
+
+    def __init__(self, name, pump_configuration, pour, host=HOST, port=PORT, max_concurrent=None, log=print,
+                 admit=None, release=None):
+        self.name = name
+        self.pump_configuration = pump_configuration
+        self.pour = pour
+        self.host = host
+        self.port = port
+        self.max_concurrent = max_concurrent
+        self.log = log
+        self.admit = admit
+        self.release = release
+        self.poured = 0
+        self.refused = 0
+        self._jobs = queue.Queue()
+        self._connection = None
+        self._stopping = threading.Event()
+        self._worker = None
+
+    def run(self):
+        """Serves the coordinator on the calling thread until stop()."""
+        self._worker = threading.Thread(target=self._pour_loop, name="station-worker", daemon=True)
+        self._worker.start()
+        backoff = RECONNECT_INITIAL
+        while not self._stopping.is_set():
+            try:
+                sock = socket.create_connection((self.host, self.port))
+            except OSError:
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, RECONNECT_MAX)
+                continue
+            backoff = RECONNECT_INITIAL
+            connection = self._connection = Connection(sock)
+            try:
+                connection.send({"type": "hello", "station": self.name, "pumps": self.pump_configuration,
+                                 "max_concurrent": self.max_concurrent})
+                self.log(f"Station {self.name} connected to {self.host}:{self.port}")
+                for message in connection.messages():
+                    if message.get("type") != "pour":
+                        continue
+                    if self.admit is not None and not self.admit(message["drink"]):
+                        self.log(f"Not enough left for {message['drink']['name']}; sent back")
+                        self.refused += 1
+                        connection.send({"type": "refused", "order": message["order"]})
+                        continue
+                    self._jobs.put(message)
+            except (OSError, ValueError):
+                if not self._stopping.is_set():
+                    traceback.print_exc()
+            finally:
+                self._connection = None
+                connection.close()
+                # the coordinator re-routes whatever had not started here
+                while not self._jobs.empty():
+                    message = self._jobs.get_nowait()
+                    if message is not None and self.release is not None:
+                        self.release(message["drink"])
+            if not self._stopping.is_set():
+                self.log(f"Lost the coordinator; reconnecting in {backoff:.0f} s")
+                self._stopping.wait(backoff)
+        self._jobs.put(None)
+
+    def update(self, pump_configuration):
+        """Tells the coordinator about a changed pump configuration."""
+        self.pump_configuration = pump_configuration
+        self._send({"type": "pumps", "pumps": pump_configuration})
+
+    def stop(self):
+        """Disconnects and lets the drink being poured finish."""
+        self._stopping.set()
+        self._jobs.put(None)
+        connection = self._connection
+        if connection is not None:
+            connection.close()
+        if self._worker is not None:
+            self._worker.join()
+
+    def _send(self, message):
+        connection = self._connection
+        if connection is None:
+            return False
+        try:
+            connection.send(message)
+            return True
+        except OSError:
+            return False
+
+    def _pour_loop(self):
+        while True:
+            message = self._jobs.get()
+            if message is None:
+                return
+            self._send({"type": "started", "order": message["order"]})
+            try:
+                self.pour(message["drink"])
+                ok = True
+            except Exception:
+                traceback.print_exc()
+                ok = False
+            self.poured += ok
+            self._send({"type": "done", "order": message["order"], "ok": ok})
+
+
+def simulated_station(name, pump_configuration, speedup=1.0, host=HOST, port=PORT,
+                      max_concurrent=None, flow_rate=DEFAULT_FLOW_RATE, log=print, admit=None, release=None):
+    """A StationClient pouring on simulated pumps, `speedup` times faster than real time."""
+    pumps = SimulatedPumpDriver(clock=SystemClock())
+    scheduler = PourScheduler(pumps.on, pumps.off, max_concurrent, clock=pumps.clock.now, sleep=pumps.clock.sleep)
+
+    def pour(drink):
+        configuration = station.pump_configuration
+        jobs = pour_jobs(drink, configuration, PumpIndex(configuration), flow_rate)
+        for job in jobs:
+            job.duration /= speedup
+        scheduler.run(jobs)
+
+    station = StationClient(name, pump_configuration, pour, host, port, max_concurrent, log, admit, release)
+    station.pumps = pumps
+    return station
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("role", choices=["station"], help="run a simulated station")
+    parser.add_argument("--name", default=socket.gethostname())
+    parser.add_argument("--coordinator", default=f"{HOST}:{PORT}", help="host:port")
+    parser.add_argument("--speedup", type=float, default=1.0, help="pour this many times faster than real time")
+    parser.add_argument("--max-concurrent", type=int, default=None)
+    parser.add_argument("--pump-config", default="pump_config.json")
+    args = parser.parse_args()
+
+    with open(args.pump_config) as f:
+        pump_configuration = json.load(f)
+    host, _, port = args.coordinator.rpartition(":")
+    station = simulated_station(args.name, pump_configuration, args.speedup, host or HOST, int(port),
+                                args.max_concurrent)
+    try:
+        station.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        station.stop()
+        print(f"{args.name} poured {station.poured} drink(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Per-pump flow model.
+
+Each pump in pump_config.json may carry its own calibration:
+
+    "flow_rate":   seconds per mL of water (measured by `pump_test.py calibrate`)
+    "dead_volume": mL the pump moves before liquid reaches the glass, because
+                   the line drains back between pours (0 if it stays primed)
+    "viscosity":   on-time multiplier for the liquid it holds (1.0 = water)
+    "prime_volume": mL that fill the line from a fresh bottle after a change
+                   (PRIME_VOLUME if not measured)
+
+Uncalibrated pumps fall back to the global FLOW_RATE. When several pumps hold
+the same ingredient the dose is split between them so they all finish
+together, instead of every one of them pouring the full amount.
+"""
+from pour_scheduler import PourJob
+
+DEFAULT_FLOW_RATE = 60.0 / 100.0   # seconds per mL
+PRIME_VOLUME = 10.0                # mL in the line from bottle to nozzle
+
+
+def calibration(pump, flow_rate=DEFAULT_FLOW_RATE):
+    """returns (seconds per mL, dead volume in mL, viscosity factor) for a pump entry"""
+    return (pump.get("flow_rate") or flow_rate, pump.get("dead_volume") or 0.0,
+            pump.get("viscosity") or 1.0)
+
+
+def on_time(pump, amount, flow_rate=DEFAULT_FLOW_RATE):
+    """seconds `pump` must run to deliver `amount` mL into the glass"""
+    rate, dead, viscosity = calibration(pump, flow_rate)
+    return (amount + dead) * rate * viscosity
+
+
+def prime_time(pump, flow_rate=DEFAULT_FLOW_RATE):
+    """seconds `pump` must run to fill its empty line from a new bottle"""
+    rate, dead, viscosity = calibration(pump, flow_rate)
+    return (pump.get("prime_volume") or PRIME_VOLUME) * rate * viscosity
+
+
+def split_dose(pumps, amount, flow_rate=DEFAULT_FLOW_RATE):
+    """
+    Shares `amount` mL between `pumps` ({key: pump entry}) so that they all
+    stop at the same moment.
+
+    returns [(key, mL, seconds)]; pumps whose dead volume alone would outlast
+    the others are left out
+    """
+    shares = {key: calibration(pump, flow_rate) for key, pump in pumps.items()}
+    while shares:
+        # every pump i runs T = (a_i + d_i) * r_i * v_i and sum(a_i) = amount
+        speed = sum(1.0 / (r * v) for r, d, v in shares.values())
+        finish = (amount + sum(d for r, d, v in shares.values())) / speed
+        portions = {key: finish / (r * v) - d for key, (r, d, v) in shares.items()}
+        slow = [key for key, ml in portions.items() if ml <= 0]
+        if not slow:
+            return [(key, ml, finish) for key, ml in portions.items()]
+        for key in slow:
+            del shares[key]
+    return []
+
+
+def pour_jobs(drink, pump_configuration, index, flow_rate=DEFAULT_FLOW_RATE):
+    """the calibrated PourJobs that pour `drink` on the pumps holding its ingredients"""
+    jobs = []
+    for ingredient, amount in drink["ingredients"].items():
+        pumps = {key: pump_configuration[key] for key in index.pumps_for(ingredient)}
+        for key, ml, seconds in split_dose(pumps, amount, flow_rate):
+            jobs.append(PourJob(pump_configuration[key]["pin"], seconds, f"{ml:.4g} mL of {ingredient}",
+                                key, ml))
+    return jobs
@@ -0,0 +1,94 @@
+"""
+Frame-buffered output for the display, the LED strip and the console.
+
+On the Pi every OLED display() and every NeoPixel show() is a bus transfer,
+and on the console every progress update is a write and a flush. A
+FrameBuffer sits between the drawing code and such a device:
+
+  * draw() only records what a region (a text position, a pixel, a console
+    line) should show; nothing reaches the device until present();
+  * present() writes only the regions whose content changed since the last
+    frame, then commits once (display(), show(), flush());
+  * frames go out at most `fps` times a second. A present() that comes too
+    soon is dropped and the next one carries its changes, so animations
+    should wait due() seconds between frames and present(force=True) their
+    final frame.
+"""
+import time
+
+FPS = 20   # frames per second a device is sent at most
+
+_MISSING = object()
+
+
+class FrameBuffer(object):
+    """
+    `write(region, value)` draws one region on the device; it is called with
+    value None for a region that was cleared, unless `wipe()` is given, in
+    which case a frame that drops regions wipes the device and redraws the
+    rest. `commit()` pushes a finished frame out.
+    """
+
+    def __init__(self, write, commit=None, wipe=None, fps=FPS, clock=time.monotonic):
+        self.write = write
+        self.commit = commit
+        self.wipe = wipe
+        self.interval = 1.0 / fps if fps else 0.0
+        self.clock = clock
+        self.frames = 0      # frames sent to the device
+        self.writes = 0      # region writes sent to the device
+        self.skipped = 0     # present() calls with nothing changed
+        self.dropped = 0     # present() calls refused by the frame rate cap
+        self._frame = {}     # region -> value being drawn
+        self._shown = {}     # region -> value on the device
+        self._next = None    # earliest time the next frame may go out
+
+    def draw(self, region, value):
+        self._frame[region] = value
+
+    def clear(self):
+        """Starts a frame with nothing drawn; regions not drawn again are cleared."""
+        self._frame = {}
+
+    def invalidate(self):
+        """Forgets what the device shows, e.g. after something else drew on it."""
+        self._shown = {}
+
+    def due(self):
+        """seconds until present() may send a frame"""
+        return 0.0 if self._next is None else max(0.0, self._next - self.clock())
+
+    def present(self, force=False):
+        """
+        Sends what changed since the last frame. `force` ignores the frame
+        rate cap (not the change check), for output that must appear at once.
+
+        returns True if a frame was sent
+        """
+        changed = [(r, v) for r, v in self._frame.items() if self._shown.get(r, _MISSING) != v]
+        removed = [r for r in self._shown if r not in self._frame]
+        if not changed and not removed:
+            self.skipped += 1
+            return False
+        now = self.clock()
+        if not force and self._next is not None and now < self._next:
+            self.dropped += 1
+            return False
+        if removed and self.wipe is not None:
+            self.wipe()
+            changed, removed = list(self._frame.items()), []
+        for region in removed:
+            self.write(region, None)
+        for region, value in changed:
+            self.write(region, value)
+        if self.commit is not None:
+            self.commit()
+        self.writes += len(changed) + len(removed)
+        self.frames += 1
+        self._shown = dict(self._frame)
+        self._next = now + self.interval
+        return True
+
+    def summary(self):
+        return (f"{self.frames} frames, {self.writes} writes, "
+                f"{self.skipped} unchanged, {self.dropped} over the frame cap")
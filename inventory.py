@@ -0,0 +1,266 @@
+"""
+Reservoir inventory.
+
+Tracks how many mL are left behind each pump so that drinks the bottles can
+no longer cover are hidden from the menu and refused at SMS intake, instead
+of pumping air for the full pour time.
+
+Every change is one line appended to a JSONL log (default inventory.log):
+
+    {"w": "3f9c01aa", "pump": "pump_1", "set": 750}     refill / new bottle
+    {"w": "3f9c01aa", "pump": "pump_1", "use": 42.5}    poured
+    {"w": "3f9c01aa", "pump": "pump_1", "set": null}    stop tracking
+
+Appends are a few dozen bytes, and the SMS daemon and the console bartender
+can share the log: sync() replays lines other writers (other "w") appended.
+Pumps that were never filled are untracked and never limit a drink, so the
+machine behaves as before until a bottle is registered.
+
+For the menu, the ingredients that have run out are kept as a mask over the
+PumpIndex bits, so a drink check is one AND. Orders accepted but not yet
+poured reserve what they need, so the queue can never promise more than the
+bottles hold.
+
+    python inventory.py status
+    python inventory.py refill pump_1 750
+    python inventory.py compact        # rewrite the log; stop the daemon first
+"""
+import collections
+import json
+import os
+import sys
+import threading
+import uuid
+
+from config_store import write_atomic
+from pump_index import PumpIndex
+
+RESERVE = 20.0   # mL at the bottom of a reservoir the pump cannot draw
+
+
+class Inventory(object):
+    def __init__(self, index, path="inventory.log", reserve=RESERVE, log=print):
+        self.index = index
+        self.path = path
+        self.reserve = reserve
+        self.log = log
+        self.levels = {}                          # pump key -> mL left; untracked pumps are absent
+        self.committed = collections.Counter()    # ingredient -> mL reserved by queued orders
+        self.out = 0                              # mask of ingredients that cannot be poured
+        self._writer = uuid.uuid4().hex[:8]
+        self._offset = 0
+        self._lock = threading.RLock()
+        self._file = None                         # opened on the first append
+        self.sync()
+
+    # ── queries ─────────────────────────────────────────────────────────────
+
+    def stock(self, ingredient):
+        """mL of `ingredient` that can still be poured, or None if untracked"""
+        keys = self.index.pumps_for(ingredient)
+        if not keys or any(key not in self.levels for key in keys):
+            return None if keys else 0.0
+        return sum(max(0.0, self.levels[key] - self.reserve) for key in keys)
+
+    def can_make(self, mask):
+        """`mask` is a PumpIndex requirement; True unless an ingredient has run out"""
+        return not mask & self.out
+
+    def shortages(self, drink):
+        """returns the ingredients of `drink` there is not enough of"""
+        with self._lock:
+            short = []
+            for ingredient, amount in drink["ingredients"].items():
+                if not self.index.pumps_for(ingredient):
+                    short.append(ingredient)
+                    continue
+                stock = self.stock(ingredient)
+                if stock is not None and stock - self.committed[self._key(ingredient)] < amount:
+                    short.append(ingredient)
+            return short
+
+    def can_pour(self, drink):
+        return not self.shortages(drink)
+
+    # ── orders ──────────────────────────────────────────────────────────────
+
+    def reserve_for(self, drink):
+        """
+        Sets aside what `drink` needs for a queued order.
+
+        returns False (reserving nothing) if the bottles cannot cover it
+        """
+        with self._lock:
+            self.sync()
+            if self.shortages(drink):
+                return False
+            for ingredient, amount in drink["ingredients"].items():
+                self.committed[self._key(ingredient)] += amount
+            self._refresh(drink["ingredients"])
+            return True
+
+    def release(self, drink):
+        """Returns a reservation made by reserve_for()."""
+        with self._lock:
+            for ingredient, amount in drink["ingredients"].items():
+                key = self._key(ingredient)
+                self.committed[key] = max(0.0, self.committed[key] - amount)
+            self._refresh(drink["ingredients"])
+
+    def consume(self, usage):
+        """
+        Records (pump key, mL) pairs that were poured.
+
+        returns the mask of ingredients whose availability changed
+        """
+        with self._lock:
+            touched = set()
+            for key, ml in usage:
+                if key in self.levels and ml:
+                    self._append({"pump": key, "use": round(ml, 2)})
+                    touched.add(self.index.pump_configuration.get(key, {}).get("value"))
+            if touched:
+                self._file.flush()
+            return self._refresh(touched)
+
+    def consume_jobs(self, jobs):
+        """consume() for poured PourJobs, scaled down for runs cut short"""
+        return self.consume((job.pump, job.volume * min(1.0, (job.actual or job.duration) / job.duration))
+                            for job in jobs if job.pump is not None and job.volume and job.duration)
+
+    def refill(self, pump_key, volume):
+        """Sets the level behind `pump_key` (None stops tracking it)."""
+        with self._lock:
+            self._append({"pump": pump_key, "set": volume})
+            self._file.flush()
+            return self._refresh([self.index.pump_configuration.get(pump_key, {}).get("value")])
+
+    def refresh(self, ingredients):
+        """
+        Rechecks `ingredients`, e.g. after a pump was reassigned.
+
+        returns the mask of ingredients whose availability changed
+        """
+        with self._lock:
+            return self._refresh(ingredients)
+
+    def rebind(self, index):
+        """Switches to a rebuilt PumpIndex (bits may have changed)."""
+        with self._lock:
+            self.index = index
+            self.out = 0
+            self._refresh(p["value"] for p in index.pump_configuration.values())
+
+    # ── log ─────────────────────────────────────────────────────────────────
+
+    def sync(self):
+        """
+        Applies lines other processes appended since the last call.
+
+        returns the mask of ingredients whose availability changed
+        """
+        with self._lock:
+            try:
+                # nothing appended since the last call: no need to open the file
+                if os.path.getsize(self.path) <= self._offset:
+                    return 0
+                with open(self.path, "rb") as f:
+                    f.seek(self._offset)
+                    data = f.read()
+            except FileNotFoundError:
+                data = b""
+            # a line still being written has no newline yet; leave it for next time
+            complete = data[:data.rfind(b"\n") + 1]
+            self._offset += len(complete)
+            touched = set()
+            for line in complete.decode("utf-8", errors="replace").splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    self.log(f"Skipping damaged inventory line: {line!r}")
+                    continue
+                if entry.get("w") != self._writer and self._apply(entry):
+                    pump = self.index.pump_configuration.get(entry["pump"])
+                    if pump:
+                        touched.add(pump["value"])
+            return self._refresh(touched)
+
+    def compact(self):
+        """Rewrites the log as one line per tracked pump."""
+        with self._lock:
+            self.sync()
+            text = "".join(json.dumps({"w": self._writer, "pump": key, "set": round(ml, 2)}) + "\n"
+                           for key, ml in sorted(self.levels.items()))
+            self.close()
+            write_atomic(self.path, text)
+            self._offset = len(text.encode("utf-8"))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _append(self, entry):
+        entry["w"] = self._writer
+        self._apply(entry)
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(entry) + "\n")
+
+    def _apply(self, entry):
+        key = entry.get("pump")
+        if "set" in entry:
+            if entry["set"] is None:
+                self.levels.pop(key, None)
+            else:
+                self.levels[key] = float(entry["set"])
+        elif "use" in entry and key in self.levels:
+            self.levels[key] -= float(entry["use"])
+        else:
+            return False
+        return True
+
+    def _key(self, ingredient):
+        return ingredient.casefold()
+
+    def _refresh(self, ingredients):
+        before = self.out
+        for ingredient in set(ingredients):
+            if ingredient is None:
+                continue
+            bit = self.index.bit(ingredient)
+            stock = self.stock(ingredient)
+            if stock is not None and stock - self.committed[self._key(ingredient)] <= 0:
+                self.out |= bit
+            else:
+                self.out &= ~bit
+        return before ^ self.out
+
+
+def main():
+    usage = "usage: python inventory.py status | refill <pump> <mL> | untrack <pump> | compact"
+    args = sys.argv[1:] or ["status"]
+    with open("pump_config.json", encoding="utf-8") as f:
+        configuration = json.load(f)
+    inventory = Inventory(PumpIndex(configuration))
+    try:
+        if args[0] == "refill" and len(args) == 3:
+            inventory.refill(args[1], float(args[2]))
+        elif args[0] == "untrack" and len(args) == 2:
+            inventory.refill(args[1], None)
+        elif args[0] == "compact":
+            inventory.compact()
+        elif args[0] != "status":
+            sys.exit(usage)
+        for key in sorted(configuration):
+            pump = configuration[key]
+            level = inventory.levels.get(key)
+            print(f"{pump['name']:<8} {str(pump['value']):<12} "
+                  f"{'untracked' if level is None else f'{level:8.1f} mL'}")
+    finally:
+        inventory.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Leveled logging for the console bartender.
+
+Code logs through the standard `logging` module with %-style arguments
+(log.debug("filterDrinks(menu=%s)", menu.name)), so a disabled level costs
+one level check and the message is never formatted. configure() sends
+records through a QueueHandler: the caller merges the arguments of enabled
+records into the message and enqueues it, and a QueueListener thread
+formats the lines and writes them to the console (stderr, so
+log lines never garble the menu on stdout) and, optionally, to a JSONL event
+log for post-mortem analysis, one object per record:
+
+    {"t": 1792321643.46, "level": "INFO", "logger": "bartender", "msg": "Making: D1"}
+
+Fields passed as extra={"event": {...}} are added to that object.
+
+    BARTENDER_LOG=debug BARTENDER_EVENTS=events.jsonl python bartender.py
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LEVEL = "info"
+CONSOLE_FORMAT = "[%(levelname)s] %(message)s"
+
+_listener = None
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records with their message merged but exc_info kept. The
+    arguments are formatted on the caller's thread, since the listener may
+    only get to the record after the caller has changed a list or object it
+    logged. Only records at an enabled level reach the handler, so disabled
+    levels still cost one level check. The stock prepare() would also drop
+    exc_info, losing the event log's "exc" field; the queue never leaves the
+    process, so nothing else has to be made picklable.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"t": round(record.created, 6), "level": record.levelname,
+                 "logger": record.name, "msg": record.getMessage()}
+        entry.update(getattr(record, "event", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure(level=None, events=None, stream=None, queued=True):
+    """
+    Sets up the root logger. `level` defaults to $BARTENDER_LOG (else
+    "info"), `events` to $BARTENDER_EVENTS (else no event log). With
+    queued=False records are written on the calling thread.
+
+    returns the QueueListener (None if not queued); it is stopped, and the
+    queue drained, by a later configure() or at exit
+    """
+    global _listener
+    level = (level or os.environ.get("BARTENDER_LOG") or LEVEL).upper()
+    events = events if events is not None else os.environ.get("BARTENDER_EVENTS")
+
+    console = logging.StreamHandler(stream or sys.stderr)
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    handlers = [console]
+    if events:
+        event_log = logging.FileHandler(events, encoding="utf-8")
+        event_log.setFormatter(JsonLinesFormatter())
+        handlers.append(event_log)
+
+    stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(level)
+    if not queued:
+        for handler in handlers:
+            root.addHandler(handler)
+        return None
+    records = queue.SimpleQueue()
+    root.addHandler(LocalQueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, *handlers)
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def stop():
+    """Writes out every queued record and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,329 @@
+"""
+Persistent IMAP mailbox listener.
+
+Keeps one authenticated IMAP connection open and waits for new mail with IDLE
+(RFC 2177) instead of logging in and searching every POLL_INTERVAL seconds.
+Servers without IDLE are polled with NOOP on the same connection. A dropped
+connection is re-established with exponential backoff.
+
+fetch_text_bodies() and mark_seen() retrieve and flag a whole burst of orders
+in one round-trip each.
+"""
+import base64
+import email
+import imaplib
+import quopri
+import re
+import select
+import socket
+import ssl
+import time
+import traceback
+from email.parser import BytesHeaderParser
+
+IDLE_TIMEOUT = 25 * 60     # re-issue IDLE before the server's 30 min autologout
+NOOP_INTERVAL = 15         # seconds between NOOPs when IDLE is not supported
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 300.0
+
+
+class MailboxListener(object):
+    """
+    Calls `handler(mail)` with a logged-in, selected connection once on
+    connect and again every time the server reports new mail.
+
+    `imap_class` defaults to IMAP4_SSL; pass imaplib.IMAP4 and a port to talk
+    to a local FakeIMAPServer.
+    """
+
+    def __init__(self, host, user, password, port=None, mailbox="inbox",
+                 imap_class=imaplib.IMAP4_SSL, idle_timeout=IDLE_TIMEOUT,
+                 noop_interval=NOOP_INTERVAL, backoff_initial=BACKOFF_INITIAL,
+                 backoff_max=BACKOFF_MAX, log=print):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.mailbox = mailbox
+        self.imap_class = imap_class
+        self.idle_timeout = idle_timeout
+        self.noop_interval = noop_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.log = log
+        self.connects = 0
+        self._exists = 0           # message count the server last reported
+        self._stopped = False
+        self._wake_r, self._wake_w = socket.socketpair()
+
+    def connect(self):
+        if self.port is None:
+            mail = self.imap_class(self.host)
+        else:
+            mail = self.imap_class(self.host, self.port)
+        try:
+            mail.login(self.user, self.password)
+            mail.select(self.mailbox)
+        except Exception:
+            self._close(mail)
+            raise
+        self._exists = 0
+        self._reported_new_mail(mail)
+        self.connects += 1
+        return mail
+
+    def stop(self):
+        """Makes listen() return; safe to call from another thread."""
+        self._stopped = True
+        try:
+            self._wake_w.send(b"!")
+        except OSError:
+            pass
+
+    def listen(self, handler):
+        """
+        Runs until stop() is called, reconnecting with backoff whenever the
+        connection or the handler fails.
+        """
+        backoff = self.backoff_initial
+        while not self._stopped:
+            mail = None
+            try:
+                mail = self.connect()
+                backoff = self.backoff_initial
+                while not self._stopped:
+                    handler(mail)
+                    if not self._stopped:
+                        self.wait(mail)
+            except KeyboardInterrupt:
+                raise
+            except Exception:
+                traceback.print_exc()
+                if self._stopped:
+                    break
+                self.log(f"Mailbox connection lost; reconnecting in {backoff:.1f} s")
+                self._sleep(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+            finally:
+                if mail is not None:
+                    self._close(mail)
+
+    def wait(self, mail):
+        """
+        Blocks until the server reports new mail, the idle timeout expires, or
+        stop() is called.
+
+        returns True if new mail was reported
+        """
+        if "IDLE" in mail.capabilities:
+            return self._idle(mail)
+        if self._sleep(self.noop_interval):
+            return False
+        mail.noop()
+        return self._reported_new_mail(mail)
+
+    def _reported_new_mail(self, mail):
+        """
+        Takes the EXISTS/EXPUNGE responses imaplib collected since the last
+        call. Servers report mail that arrives mid-command in that command's
+        response, e.g. during the handler's UID FETCH, and never again.
+
+        returns True if the message count went past the last one seen
+        """
+        typ, exists = mail.response("EXISTS")
+        typ, expunged = mail.response("EXPUNGE")
+        counts = [int(n) for n in exists if n is not None]
+        known = self._exists - len([n for n in expunged if n is not None])
+        self._exists = counts[-1] if counts else known
+        return any(n > known for n in counts)
+
+    def _idle(self, mail):
+        # mail reported while the handler ran would otherwise wait for the next one
+        if self._reported_new_mail(mail):
+            return True
+        tag = mail._new_tag()
+        mail.send(tag + b" IDLE\r\n")
+        line = mail.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+
+        got_mail = False
+        deadline = time.monotonic() + self.idle_timeout
+        while not got_mail and not self._stopped:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self._readable(mail, remaining):
+                continue
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("socket error: EOF during IDLE")
+            if line.startswith(b"* BYE"):
+                raise imaplib.IMAP4.abort(line.decode(errors="replace").strip())
+            words = line.split()
+            if len(words) < 3 or words[0] != b"*" or not words[1].isdigit():
+                continue
+            count, kind = int(words[1]), words[2].upper()
+            if kind == b"EXPUNGE":
+                # the count shrinks, so the next EXISTS is compared against the real size
+                self._exists = max(0, self._exists - 1)
+            elif kind == b"EXISTS":
+                got_mail = count > self._exists
+                self._exists = count
+            elif kind == b"RECENT":
+                got_mail = count > 0
+
+        mail.send(b"DONE\r\n")
+        while True:
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("socket error: EOF ending IDLE")
+            if line.startswith(tag):
+                break
+        return got_mail
+
+    def _readable(self, mail, timeout):
+        sock = mail.sock
+        if self._buffered(mail):
+            return True
+        readable, _, _ = select.select([sock, self._wake_r], [], [], timeout)
+        if self._wake_r in readable:
+            self._wake_r.recv(64)
+        return sock in readable
+
+    @staticmethod
+    def _buffered(mail):
+        """
+        returns True if a response is already sitting in imaplib's read buffer
+        (or the TLS layer), where select() on the socket cannot see it
+        """
+        sock = mail.sock
+        timeout = sock.gettimeout()
+        sock.settimeout(0)
+        try:
+            return bool(mail.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def _sleep(self, seconds):
+        """Sleeps unless stop() is called first. returns True if stopped."""
+        readable, _, _ = select.select([self._wake_r], [], [], seconds)
+        if readable:
+            self._wake_r.recv(64)
+        return self._stopped
+
+    @staticmethod
+    def _close(mail):
+        try:
+            mail.logout()
+        except Exception:
+            try:
+                mail.shutdown()
+            except Exception:
+                pass
+
+# -----------------------------------------------------------------------------
+# Bulk retrieval helpers
+# -----------------------------------------------------------------------------
+
+_TEXT_ITEMS = ("(BODY.PEEK[HEADER.FIELDS (CONTENT-TYPE CONTENT-TRANSFER-ENCODING)] "
+               "BODY.PEEK[1.MIME] BODY.PEEK[1])")
+_FETCH_START = re.compile(rb"^\d+ \(")
+_UID = re.compile(rb"UID (\d+)")
+_LITERAL = re.compile(rb"(BODY\[[^\]]*\])(?:<\d+>)? \{\d+\}$")
+
+
+def _decode_part(headers, body):
+    encoding = (headers.get("Content-Transfer-Encoding") or "").strip().lower()
+    if encoding == "base64":
+        body = base64.b64decode(body)
+    elif encoding == "quoted-printable":
+        body = quopri.decodestring(body)
+    charset = headers.get_content_charset() or "utf-8"
+    try:
+        return body.decode(charset, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def fetch_text_bodies(mail, uids, arrivals=None):
+    """
+    Fetches the text/plain body of every message in `uids` with a single
+    UID FETCH, parsing only the MIME headers needed to decode it. If
+    `arrivals` is a dict, it is filled with {uid: epoch seconds} from each
+    message's INTERNALDATE (when the server received it; whole seconds).
+
+    returns {uid: text}. Messages whose first part is not text/plain are
+    fetched whole and parsed the slow way.
+    """
+    if not uids:
+        return {}
+    uids = [u.decode() if isinstance(u, bytes) else str(u) for u in uids]
+    items = _TEXT_ITEMS if arrivals is None else "(INTERNALDATE " + _TEXT_ITEMS[1:]
+    typ, data = mail.uid("FETCH", ",".join(uids), items)
+    if typ != "OK":
+        return {}
+
+    messages = []
+    current = None
+    for item in data:
+        prefix = item[0] if isinstance(item, tuple) else item
+        if not prefix:
+            continue
+        if _FETCH_START.match(prefix):
+            current = {}
+            messages.append(current)
+        if current is None:
+            continue
+        uid = _UID.search(prefix)
+        if uid:
+            current["uid"] = uid.group(1).decode()
+        if arrivals is not None and b"INTERNALDATE" in prefix:
+            arrived = imaplib.Internaldate2tuple(prefix)
+            if arrived:
+                current["arrived"] = time.mktime(arrived)
+        if isinstance(item, tuple):
+            label = _LITERAL.search(prefix)
+            if label:
+                current[label.group(1).decode().upper()] = item[1]
+
+    parser = BytesHeaderParser()
+    texts = {}
+    fallback = []
+    for parts in messages:
+        uid = parts.get("uid")
+        if uid is None:
+            continue
+        if "arrived" in parts:
+            arrivals[uid] = parts["arrived"]
+        top = parser.parsebytes(parts.get("BODY[HEADER.FIELDS (CONTENT-TYPE CONTENT-TRANSFER-ENCODING)]", b""))
+        if top.get_content_maintype() == "multipart":
+            headers = parser.parsebytes(parts.get("BODY[1.MIME]") or b"")
+            if headers.get_content_type() != "text/plain":
+                fallback.append(uid)
+                continue
+        else:
+            headers = top
+        texts[uid] = _decode_part(headers, parts.get("BODY[1]") or b"")
+
+    for uid in fallback:
+        typ, msg_data = mail.uid("FETCH", uid, "(BODY.PEEK[])")
+        if typ == "OK" and isinstance(msg_data[0], tuple):
+            texts[uid] = _plain_text(email.message_from_bytes(msg_data[0][1]))
+    return texts
+
+
+def _plain_text(msg):
+    for part in msg.walk():
+        if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition")):
+            return part.get_payload(decode=True).decode(errors="replace")
+    return ""
+
+
+def mark_seen(mail, uids):
+    """Flags every message in `uids` \\Seen with a single UID STORE."""
+    if uids:
+        uids = [u.decode() if isinstance(u, bytes) else str(u) for u in uids]
+        mail.uid("STORE", ",".join(uids), "+FLAGS.SILENT", "(\\Seen)")
@@ -0,0 +1,198 @@
+"""
+Cleaning and priming in idle time.
+
+Cleaning used to run every pump for a fixed 5 s from the console menu while
+the UI waited. After a bottle change, the first drink also paid for filling
+the empty line. Maintenance now does both on its own thread once the machine
+has been idle for `idle_after` seconds, meaning no queued orders and no pour:
+
+    priming   runs each pump whose bottle changed for its prime_time()
+    cleaning  runs every pump for `clean_seconds` once `clean_after` drinks
+              have been poured since the last cleaning
+
+Both dispense with nobody watching, so the script only starts Maintenance
+when asked to (IDLE_MAINTENANCE=1), and cleaning stays off unless
+`clean_after` is set, for machines with a drip tray under the nozzles.
+
+The runs are staggered through the shared PourScheduler, so they stay within
+its concurrency cap. A pour always wins. pouring() stops any cycle at once
+(within STOP_CHECK seconds) and holds the pumps until the drink is done.
+Anything the cycle did not finish is picked up in the next idle window.
+
+    maintenance = Maintenance(scheduler, pump_configuration, queue=orders).start()
+    with maintenance.pouring(jobs):
+        scheduler.run(jobs)
+"""
+import contextlib
+import threading
+import time
+import traceback
+
+from flow_model import DEFAULT_FLOW_RATE, calibration, prime_time
+from pour_scheduler import PourJob
+
+IDLE_AFTER = 30.0       # seconds without orders or pours before maintenance starts
+CLEAN_SECONDS = 5.0     # per pump, as the console menu's Clean
+CLEAN_AFTER = None      # drinks poured between cleanings; None never cleans on its own
+POLL = 1.0              # seconds between idle checks
+
+
+class Maintenance(object):
+    """
+    Runs cleaning and priming on `scheduler` while the machine is idle.
+    `queue` (an OrderQueue, optional) counts as busy while it holds queued
+    orders. `consume(jobs)`, if given, is called with the maintenance runs
+    that switched on, e.g. Inventory.consume_jobs, so that the liquid they
+    used is counted.
+    """
+
+    def __init__(self, scheduler, pump_configuration, queue=None, consume=None, flow_rate=DEFAULT_FLOW_RATE,
+                 idle_after=IDLE_AFTER, clean_seconds=CLEAN_SECONDS, clean_after=CLEAN_AFTER,
+                 clock=time.monotonic, log=print):
+        self.scheduler = scheduler
+        self.pump_configuration = pump_configuration
+        self.queue = queue
+        self.consume = consume
+        self.flow_rate = flow_rate
+        self.idle_after = idle_after
+        self.clean_seconds = clean_seconds
+        self.clean_after = clean_after
+        self.clock = clock
+        self.log = log
+        self.unprimed = set()       # pump keys whose line is empty
+        self.to_clean = set()       # pump keys still due in the current cleaning
+        self.poured = 0             # drinks since the last cleaning
+        self.cycles = {"prime": 0, "clean": 0, "aborted": 0}
+        self._lock = threading.Lock()
+        self._pumps = threading.Lock()  # held by whoever is running pumps
+        self._abort = threading.Event()
+        self._busy = 0
+        self._last_active = clock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="maintenance", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops a running cycle and the thread."""
+        self._stopping.set()
+        self._abort.set()
+        if self._thread:
+            self._thread.join()
+
+    def update(self, pump_configuration):
+        """Takes a new pump configuration; pumps given a different ingredient need priming."""
+        with self._lock:
+            for key, pump in pump_configuration.items():
+                old = self.pump_configuration.get(key)
+                if pump["value"] is not None and (old is None or old["value"] != pump["value"]):
+                    self.unprimed.add(key)
+                elif pump["value"] is None:
+                    self.unprimed.discard(key)
+            self.unprimed &= set(pump_configuration)
+            self.to_clean &= set(pump_configuration)
+            self.pump_configuration = pump_configuration
+
+    def prime(self, keys):
+        """Marks pumps as needing priming, e.g. after a bottle was swapped for a full one."""
+        with self._lock:
+            self.unprimed.update(k for k in keys if self.pump_configuration.get(k, {}).get("value") is not None)
+
+    @contextlib.contextmanager
+    def pouring(self, jobs=()):
+        """
+        Holds the pumps for a drink: any cycle is stopped first. Jobs on
+        pumps that still need priming get their prime time and volume added,
+        so the liquid that fills the line is counted too. Those pumps count
+        as primed once they have run for at least their prime time.
+        """
+        primes = {}     # job -> seconds of it that fill the empty line
+        with self._lock:
+            self._busy += 1
+            self._abort.set()
+            for job in jobs:
+                if job.pump in self.unprimed:
+                    pump = self.pump_configuration[job.pump]
+                    seconds = primes[job] = prime_time(pump, self.flow_rate)
+                    job.duration += seconds
+                    if job.volume is not None:
+                        rate, dead, viscosity = calibration(pump, self.flow_rate)
+                        job.volume += seconds / (rate * viscosity)
+        try:
+            with self._pumps:
+                yield
+        finally:
+            with self._lock:
+                self._busy -= 1
+                self._last_active = self.clock()
+                self.poured += 1
+                # a run cut short before the line filled leaves it unprimed
+                self.unprimed -= {job.pump for job, seconds in primes.items()
+                                  if job.actual is not None and job.actual >= seconds}
+
+    def idle(self):
+        """returns True if nothing has poured for `idle_after` seconds and no order is waiting"""
+        with self._lock:
+            quiet = not self._busy and self.clock() - self._last_active >= self.idle_after
+        return quiet and not (self.queue is not None and self.queue.pending())
+
+    def due(self):
+        """returns the next cycle as (kind, jobs), or None when nothing is due"""
+        with self._lock:
+            if self.unprimed:
+                return "prime", [self._job(key, prime_time(self.pump_configuration[key], self.flow_rate), "prime")
+                                 for key in sorted(self.unprimed)]
+            if not self.to_clean and self.clean_after is not None and self.poured >= max(1, self.clean_after):
+                self.to_clean = set(self.pump_configuration)
+                self.poured = 0
+            if self.to_clean:
+                return "clean", [self._job(key, self.clean_seconds, "clean") for key in sorted(self.to_clean)]
+        return None
+
+    def _job(self, key, seconds, kind):
+        """a PourJob running pump `key` for `seconds`, with the volume that draws from its bottle"""
+        pump = self.pump_configuration[key]
+        rate, dead, viscosity = calibration(pump, self.flow_rate)
+        return PourJob(pump["pin"], seconds, f"{kind} {pump['name']}", key, seconds / (rate * viscosity))
+
+    # ── maintenance thread ──────────────────────────────────────────────────
+
+    def _loop(self):
+        while not self._stopping.wait(POLL):
+            if not self.idle():
+                continue
+            cycle = self.due()
+            if cycle is None:
+                continue
+            try:
+                self._run(*cycle)
+            except Exception:
+                traceback.print_exc()
+
+    def _run(self, kind, jobs):
+        with self._pumps:
+            with self._lock:
+                # a pour that arrived since idle() was checked goes first
+                if self._busy or self._stopping.is_set():
+                    return
+                self._abort.clear()
+            self.log(f"Maintenance: {kind} on {len(jobs)} pump(s)")
+            start = self.clock()
+            try:
+                self.scheduler.run(jobs, on_finish=lambda job: self._finished(kind, job), stop=self._abort)
+            finally:
+                if self.consume:
+                    self.consume([job for job in jobs if job.actual is not None])
+        with self._lock:
+            left = self.unprimed if kind == "prime" else self.to_clean
+            aborted = bool(left & {job.pump for job in jobs})
+            self.cycles["aborted" if aborted else kind] += 1
+        self.log(f"Maintenance: {kind} {'interrupted' if aborted else 'done'} "
+                 f"after {self.clock() - start:.1f} s")
+
+    def _finished(self, kind, job):
+        with self._lock:
+            (self.unprimed if kind == "prime" else self.to_clean).discard(job.pump)
@@ -1,29 +1,136 @@
 # menu.py
+from collections import namedtuple
+
+def attributeRecord(typename, fields):
+	"""
+	Creates an immutable record type for MenuItem.attributes. Records are tuples,
+	so they carry no per-instance dict, but they index by field name like the
+	dicts they replace (record['ingredients']). Equal records can be shared by
+	any number of items.
+	"""
+	base = namedtuple(typename, fields)
+
+	def __getitem__(self, key):
+		if isinstance(key, str):
+			try:
+				return getattr(self, key)
+			except AttributeError:
+				raise KeyError(key)
+		return tuple.__getitem__(self, key)
+
+	def get(self, key, default = None):
+		return getattr(self, key, default)
+
+	return type(typename, (base,), {'__slots__': (), '__getitem__': __getitem__, 'get': get})
+
 class MenuItem(object):
+	__slots__ = ('type', 'name', 'attributes', 'container', '_visible')
+
 	def __init__(self, type, name, attributes = None, visible = True):
 		self.type = type
 		self.name = name
 		self.attributes = attributes
-		self.visible = visible
+		self.container = None
+		self._visible = visible
+
+	@property
+	def visible(self):
+		return self._visible
+
+	@visible.setter
+	def visible(self, visible):
+		if visible != self._visible:
+			self._visible = visible
+			if self.container:
+				self.container.visibilityChanged()
 
 class Back(MenuItem):
+	__slots__ = ()
+
 	def __init__(self, name):
 		MenuItem.__init__(self, "back", name)
 
 class Menu(MenuItem):
+	__slots__ = ('options', 'selectedOption', 'parent', 'dirty', 'dirtyOptions', 'successors')
+
 	def __init__(self, name, attributes = None, visible = True):
 		MenuItem.__init__(self, "menu", name, attributes, visible)
 		self.options = []
 		self.selectedOption = 0
 		self.parent = None
+		self.dirty = True
+		self.dirtyOptions = set()
+		self.successors = None
 
 	def addOptions(self, options):
-		self.options = self.options + options
+		"""
+		Appends any iterable of options in place, without copying the existing list
+		"""
+		start = len(self.options)
+		self.options.extend(options)
+		for i in range(start, len(self.options)):
+			self.options[i].container = self
 		self.selectedOption = 0
+		self.successors = None
+		self.invalidate()
 
 	def addOption(self, option):
+		option.container = self
 		self.options.append(option)
 		self.selectedOption = 0
+		self.successors = None
+		self.invalidate()
+
+	def visibilityChanged(self):
+		self.successors = None
+
+	def buildSuccessors(self):
+		"""
+		successors[i] is the index of the first visible option after i, wrapping
+		around, or -1 if no option is visible. Rebuilt only after visibility changes.
+		"""
+		successors = [-1] * len(self.options)
+		following = -1
+		for i, option in enumerate(self.options):
+			if option.visible:
+				following = i
+				break
+		for i in range(len(self.options) - 1, -1, -1):
+			successors[i] = following
+			if self.options[i].visible:
+				following = i
+		self.successors = successors
+		return successors
+
+	def invalidate(self, option = None):
+		"""
+		Marks an option (or the whole menu when option is None) as needing
+		prepareForRender, and flags this menu as dirty in its container so the
+		render pass can find it without walking clean subtrees.
+		"""
+		if option is None:
+			if self.dirty:
+				return
+			self.dirty = True
+		elif option in self.dirtyOptions:
+			return
+		else:
+			self.dirtyOptions.add(option)
+		if self.container:
+			self.container.invalidate(self)
+
+	def isDirty(self):
+		return self.dirty or len(self.dirtyOptions) > 0
+
+	def takeDirty(self):
+		"""
+		Returns the options that need prepareForRender (all of them if the whole
+		menu was invalidated) and marks the menu clean.
+		"""
+		options = self.options if self.dirty else list(self.dirtyOptions)
+		self.dirty = False
+		self.dirtyOptions = set()
+		return options
 
 	def setParent(self, parent):
 		self.parent = parent
@@ -31,6 +138,18 @@ class Menu(MenuItem):
 	def nextSelection(self):
 		self.selectedOption = (self.selectedOption + 1) % len(self.options)
 
+	def nextVisibleSelection(self):
+		"""
+		Moves the selection to the next visible option in constant time
+
+		raises ValueError if all options are visible==False
+		"""
+		successors = self.successors if self.successors is not None else self.buildSuccessors()
+		following = successors[self.selectedOption]
+		if (following < 0):
+			raise ValueError("At least one option in a menu must be visible!")
+		self.selectedOption = following
+
 	def getSelection(self):
 		return self.options[self.selectedOption]
 
@@ -63,12 +182,18 @@ class MenuContext(object):
 		"""
 		Tells the delegate to display the selection. Advances to the next selection if the
 		menuItem is visible==False
+
+		prepareForRender is only called while something in the menu is invalidated
 		"""
-		self.delegate.prepareForRender(self.topLevelMenu)
+		self.prepare()
 		if (not menuItem.visible):
-			self.advance()
-		else:
-			self.delegate.displayMenuItem(menuItem)
+			self.currentMenu.nextVisibleSelection()
+			menuItem = self.currentMenu.getSelection()
+		self.delegate.displayMenuItem(menuItem)
+
+	def prepare(self):
+		if (self.topLevelMenu.isDirty()):
+			self.delegate.prepareForRender(self.topLevelMenu)
 
 	def advance(self):
 		"""
@@ -76,13 +201,9 @@ class MenuContext(object):
 
 		raises ValueError if all options are visible==False
 		"""
-		for i in self.currentMenu.options:
-			self.currentMenu.nextSelection()
-			selection = self.currentMenu.getSelection()
-			if (selection.visible):
-				self.display(selection)
-				return
-		raise ValueError("At least one option in a menu must be visible!")
+		self.prepare()
+		self.currentMenu.nextVisibleSelection()
+		self.display(self.currentMenu.getSelection())
 
 	def select(self):
 		"""
@@ -112,7 +233,9 @@ class MenuContext(object):
 class MenuDelegate(object):
 	def prepareForRender(self, menu):
 		"""
-		Called before the menu needs to display. Useful for changing visibility.
+		Called before the menu needs to display while it has invalidated options.
+		Useful for changing visibility. Use menu.takeDirty() to get the options
+		to update; call menu.invalidate() when state the menu depends on changes.
 		"""
 		raise NotImplementedError
 
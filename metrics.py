@@ -0,0 +1,300 @@
+"""
+Counters, histograms and spans for the order path.
+
+Instrumented code records into the module-level REGISTRY:
+
+    ORDERS = metrics.counter("orders_total", "Orders by outcome")
+    ORDERS.inc(outcome="accepted")
+    with metrics.span("order_stage_seconds", stage="pour"):
+        ...
+
+Recording takes a lock and a few additions, so it can stay on in
+production. serve() exposes the registry in the Prometheus text format,
+on 127.0.0.1 unless given another host. This module doubles as a CLI that
+summarises a running process (or a saved scrape) with per-stage percentiles
+estimated from the histogram buckets:
+
+    python metrics.py                              # http://127.0.0.1:9108/metrics
+    python metrics.py --file scrape.txt
+
+To scrape a Pi from another machine, start it with METRICS_HOST=0.0.0.0
+(or BARTENDER_METRICS_HOST for bartender.py) so that it listens on the LAN:
+
+    python metrics.py http://raspberrypi:9108/metrics
+"""
+import argparse
+import bisect
+import http.server
+import math
+import re
+import threading
+import time
+import urllib.request
+
+PORT = 9108
+# seconds; spans run from sub-millisecond renders to multi-minute queue waits
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+           10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    kind = "counter"
+
+    def __init__(self, name, help, lock):
+        self.name = name
+        self.help = help
+        self._lock = lock
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_key(labels), 0)
+
+    def lines(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(key)} {_number(value)}"
+
+
+class Histogram(object):
+    kind = "histogram"
+
+    def __init__(self, name, help, lock, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._lock = lock
+        self._values = {}     # label key -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        """a Span that observes its own duration"""
+        return Span(self, labels)
+
+    def lines(self):
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(key, [('le', _number(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_labels(key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(key)} {count}"
+
+
+class Span(object):
+    """
+    Times a `with` block into a histogram. Set `.labels` inside the block to
+    label the outcome, e.g. span.labels["outcome"] = "failed".
+    """
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = dict(labels)
+        self.start = None
+        self.seconds = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.labels.setdefault("outcome", "error")
+        self.histogram.observe(self.seconds, **self.labels)
+        return False
+
+
+class Registry(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, self._lock, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already a {metric.kind}")
+            return metric
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help="", buckets=BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def span(self, name, **labels):
+        return self.histogram(name).time(**labels)
+
+    def exposition(self):
+        """returns every metric in the Prometheus text format"""
+        out = []
+        with self._lock:
+            for name, metric in sorted(self._metrics.items()):
+                if metric.help:
+                    out.append(f"# HELP {name} {metric.help}")
+                out.append(f"# TYPE {name} {metric.kind}")
+                out.extend(metric.lines())
+        return "\n".join(out) + "\n"
+
+    def serve(self, port=PORT, host="127.0.0.1"):
+        """
+        Serves exposition() at http://host:port/metrics from a daemon thread.
+
+        returns the server; call shutdown() to stop it
+        """
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.exposition().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+span = REGISTRY.span
+serve = REGISTRY.serve
+
+
+# ── reading an exposition back ──────────────────────────────────────────────
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """returns [(name, {label: value}, value)] for every sample in `text`"""
+    samples = []
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match and not line.startswith("#"):
+            name, labels, value = match.groups()
+            samples.append((name, dict(_LABEL.findall(labels or "")), float(value)))
+    return samples
+
+
+def quantile(q, buckets):
+    """
+    Estimates quantile `q` from cumulative [(upper bound, count)] buckets by
+    interpolating inside the bucket it falls in, as Prometheus does.
+    """
+    buckets = sorted(buckets)
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return math.nan
+    rank = q * total
+    lower, below = 0.0, 0
+    for bound, cumulative in buckets:
+        if cumulative >= rank:
+            if bound == math.inf:
+                return lower
+            inside = cumulative - below
+            return lower + (bound - lower) * ((rank - below) / inside if inside else 1.0)
+        lower, below = bound, cumulative
+    return lower
+
+
+def summary(samples):
+    """returns printable lines: counters, then count/mean/p50/p95/p99 per histogram series"""
+    counters = []
+    series = {}
+    for name, labels, value in samples:
+        if name.endswith("_bucket") and "le" in labels:
+            le = labels.pop("le")
+            entry = series.setdefault((name[:-7], _key(labels)), {"buckets": []})
+            entry["buckets"].append((math.inf if le == "+Inf" else float(le), value))
+        elif name.endswith("_sum") or name.endswith("_count"):
+            base, _, field = name.rpartition("_")
+            series.setdefault((base, _key(labels)), {"buckets": []})[field] = value
+        else:
+            counters.append(f"  {name}{_labels(_key(labels))} {value:g}")
+
+    lines = []
+    if counters:
+        lines.append("counters")
+        lines.extend(counters)
+    if series:
+        lines.append(f"{'histograms':<52} {'count':>7} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for (name, key), entry in sorted(series.items()):
+        count = entry.get("count", 0)
+        if not count:
+            continue
+        mean = entry.get("sum", 0.0) / count
+        p = [quantile(q, entry["buckets"]) for q in (0.5, 0.95, 0.99)]
+        label = f"{name}{_labels(key)}"
+        lines.append(f"  {label:<50} {int(count):>7} " + " ".join(f"{v * 1e3:7.1f}ms" for v in [mean] + p))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("url", nargs="?", default=f"http://127.0.0.1:{PORT}/metrics")
+    parser.add_argument("--file", help="read a saved exposition instead of scraping")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        with urllib.request.urlopen(args.url, timeout=5) as response:
+            text = response.read().decode()
+    for line in summary(parse(text)):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
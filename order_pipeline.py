@@ -0,0 +1,113 @@
+"""
+SMS order pipeline.
+
+    intake ──▶ OrderQueue ──▶ pour worker ──▶ notifier
+
+The intake stage runs on the MailboxListener: it turns unread messages into
+orders, persists them, acknowledges them and only then marks the messages
+\\Seen, so intake never waits on a pour. The pour worker drains the queue on
+its own thread and hands finished orders to the notifier (a
+ConfirmationSender-backed callback) without waiting for SMTP.
+"""
+import threading
+import traceback
+
+from mailbox_listener import mark_seen
+from order_queue import DONE, FAILED, REJECTED
+
+WORKER_POLL = 0.5    # seconds between stop checks while the queue is empty
+
+
+class OrderPipeline(object):
+    """
+    `fetch(mail)` returns [(uid, drink_name)] for unread orders,
+    `find_drink(name)` the recipe or None, `pour(drink)` pours it, and
+    `notify(kind, order)` is called with kind "accepted", "rejected",
+    "pouring" (just before the pumps start), "ready" or "failed".
+    `admit(drink)`, if given, decides at intake whether a drink can be
+    poured (and may set aside what it needs); refused orders are recorded as
+    rejected and never reach the pumps. `release(order)`, if given, gives
+    back what admit() set aside for an order that fails before `pour` is
+    called; pour() is expected to release its own.
+    """
+
+    def __init__(self, listener, queue, fetch, find_drink, pour, notify, log=print, admit=None, release=None):
+        self.listener = listener
+        self.queue = queue
+        self.fetch = fetch
+        self.find_drink = find_drink
+        self.pour = pour
+        self.notify = notify
+        self.log = log
+        self.admit = admit
+        self.release = release
+        self._stopping = False
+        self._worker = None
+
+    def start(self):
+        """Starts the pour worker. Call run() afterwards to start intake."""
+        self._worker = threading.Thread(target=self._pour_loop, name="pour-worker", daemon=True)
+        self._worker.start()
+        return self
+
+    def run(self):
+        """Runs the intake stage on the calling thread until stop()."""
+        self.listener.listen(self.intake)
+
+    def stop(self, timeout=None):
+        """Stops intake, lets the current pour finish and stops the worker."""
+        self._stopping = True
+        self.listener.stop()
+        if self._worker:
+            self._worker.join(timeout)
+        self.queue.close()
+
+    # ── stages ──────────────────────────────────────────────────────────────
+
+    def intake(self, mail):
+        processed = []
+        for uid, drink_name in self.fetch(mail):
+            drink = self.find_drink(drink_name)
+            if drink is None:
+                self.log(f"Unknown drink requested: '{drink_name}'. Ignored.")
+            else:
+                key = self.message_key(uid)
+                if self.queue.seen(key):
+                    self.log(f"Message {key} already queued")
+                elif self.admit is None or self.admit(drink):
+                    self.notify("accepted", self.queue.add(key, drink["name"]))
+                else:
+                    self.log(f"Cannot make '{drink['name']}' right now. Rejected.")
+                    self.notify("rejected", self.queue.add(key, drink["name"], REJECTED))
+            processed.append(uid)
+        # orders are persisted before their messages are marked, so a crash in
+        # between leaves duplicates that add() ignores, never a lost order
+        mark_seen(mail, processed)
+
+    def message_key(self, uid):
+        if isinstance(uid, bytes):
+            uid = uid.decode()
+        return f"{self.listener.host}/{self.listener.mailbox}/{uid}"
+
+    def _pour_loop(self):
+        while not self._stopping:
+            order = self.queue.get(timeout=WORKER_POLL)
+            if order is None:
+                continue
+            poured = False
+            try:
+                drink = self.find_drink(order.drink.lower())
+                if drink is None:
+                    raise LookupError(f"'{order.drink}' is no longer on the menu")
+                self.notify("pouring", order)
+                poured = True
+                self.pour(drink)
+            except Exception:
+                traceback.print_exc()
+                if not poured and self.release is not None:
+                    self.release(order)
+                self.queue.complete(order, FAILED)
+                self.notify("failed", order)
+                continue
+            self.queue.complete(order, DONE)
+            self.notify("ready", order)
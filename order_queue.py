@@ -0,0 +1,166 @@
+"""
+Persistent order queue.
+
+Orders are stored in a small SQLite database so that an order accepted from
+the mailbox survives a crash or restart. Each incoming message is keyed by its
+IMAP UID, so re-reading a message that was already accepted does not create a
+second order, and an order that was mid-pour when the process died is marked
+interrupted instead of being poured again. An order that was only assigned
+to a fleet station, and never started there, goes back to the queue.
+"""
+import pathlib
+import sqlite3
+import threading
+import time
+
+QUEUED = "queued"
+ASSIGNED = "assigned"    # sent to a fleet station that has not started it
+POURING = "pouring"
+DONE = "done"
+FAILED = "failed"
+INTERRUPTED = "interrupted"
+REJECTED = "rejected"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_key TEXT UNIQUE NOT NULL,
+    drink TEXT NOT NULL,
+    state TEXT NOT NULL,
+    received REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_state ON orders (state, id);
+"""
+
+
+class Order(object):
+    def __init__(self, id, message_key, drink, state, received, updated):
+        self.id = id
+        self.message_key = message_key
+        self.drink = drink
+        self.state = state
+        self.received = received
+        self.updated = updated
+
+    def __repr__(self):
+        return f"Order(id={self.id}, drink={self.drink!r}, state={self.state!r})"
+
+
+class OrderQueue(object):
+    """
+    FIFO of orders backed by `path` (":memory:" for a throwaway queue).
+    Safe to share between the intake and pour threads. With read_only=True
+    an existing queue is opened for inspection, e.g. while the daemon is
+    running, and nothing is recovered or changed.
+    """
+
+    def __init__(self, path="orders.db", log=print, read_only=False):
+        self.log = log
+        self._cond = threading.Condition()
+        self._closed = False
+        if read_only:
+            uri = pathlib.Path(path).resolve().as_uri() + "?mode=ro"
+            self._db = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+            return
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        interrupted = self._db.execute(
+            "UPDATE orders SET state = ?, updated = ? WHERE state = ?",
+            (INTERRUPTED, time.time(), POURING)).rowcount
+        if interrupted:
+            self.log(f"{interrupted} order(s) were interrupted mid-pour and will not be re-run")
+        requeued = self._db.execute(
+            "UPDATE orders SET state = ?, updated = ? WHERE state = ?",
+            (QUEUED, time.time(), ASSIGNED)).rowcount
+        if requeued:
+            self.log(f"{requeued} order(s) assigned but never started were queued again")
+
+    def add(self, message_key, drink, state=QUEUED):
+        """
+        Appends an order for `drink` unless `message_key` was seen before.
+        Pass state=REJECTED to record an order that will not be poured.
+
+        returns the new Order, or None for a duplicate message
+        """
+        now = time.time()
+        with self._cond:
+            try:
+                cur = self._db.execute(
+                    "INSERT INTO orders (message_key, drink, state, received, updated) "
+                    "VALUES (?, ?, ?, ?, ?)", (str(message_key), drink, state, now, now))
+            except sqlite3.IntegrityError:
+                return None
+            if state == QUEUED:
+                self._cond.notify_all()
+            return Order(cur.lastrowid, str(message_key), drink, state, now, now)
+
+    def seen(self, message_key):
+        """returns True if an order was already recorded for `message_key`"""
+        with self._cond:
+            return self._db.execute("SELECT 1 FROM orders WHERE message_key = ?",
+                                    (str(message_key),)).fetchone() is not None
+
+    def get(self, timeout=None, state=POURING):
+        """
+        Takes the oldest queued order and marks it `state` (POURING, or
+        ASSIGNED when it is only being handed on to a station).
+
+        returns the Order, or None on timeout or after close()
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._closed:
+                row = self._db.execute(
+                    "SELECT * FROM orders WHERE state = ? ORDER BY id LIMIT 1", (QUEUED,)).fetchone()
+                if row:
+                    order = Order(*row)
+                    self._set_state(order, state)
+                    return order
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return None
+
+    def complete(self, order, state=DONE):
+        with self._cond:
+            self._set_state(order, state)
+
+    def begin(self, order):
+        """Marks an ASSIGNED order as pouring, once its station has started it."""
+        with self._cond:
+            self._set_state(order, POURING)
+
+    def requeue(self, order):
+        """Puts an order taken by get() back, ahead of anything newer."""
+        with self._cond:
+            self._set_state(order, QUEUED)
+            self._cond.notify_all()
+
+    def position(self, order):
+        """returns how many orders are queued, assigned or pouring ahead of `order`"""
+        with self._cond:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM orders WHERE state IN (?, ?, ?) AND id < ?",
+                (QUEUED, ASSIGNED, POURING, order.id)).fetchone()[0]
+
+    def pending(self):
+        """returns the queued orders, oldest first"""
+        with self._cond:
+            rows = self._db.execute(
+                "SELECT * FROM orders WHERE state = ? ORDER BY id", (QUEUED,)).fetchall()
+        return [Order(*row) for row in rows]
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            self._db.close()
+
+    def _set_state(self, order, state):
+        order.state = state
+        order.updated = time.time()
+        self._db.execute("UPDATE orders SET state = ?, updated = ? WHERE id = ?",
+                         (state, order.updated, order.id))
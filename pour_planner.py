@@ -0,0 +1,277 @@
+"""
+Pour planner for a queue of drinks.
+
+Poured one at a time, every drink holds the whole machine until its longest
+ingredient finishes, while the pumps it does not use sit idle. With more than
+one glass position the planner starts the next drinks' ingredients on those
+idle pumps, within the concurrency cap, so drinks overlap. With a lookahead
+it may also pour a later order first when that finishes sooner, but an order
+is never passed over more than `max_skips` times.
+
+The result is a PourPlan: absolute start/end times for every pump run, which
+validate() checks against the pump, cap and glass-position constraints and
+PourScheduler.execute() can run as-is. compare_fifo() reports the makespan
+saved against strict one-at-a-time pouring; plan_queue() does so for the
+orders waiting in an OrderQueue and records the saving in the
+pour_plan_saved_seconds histogram.
+
+    python pour_planner.py --positions 2 --lookahead 3     # the orders queued in orders.db
+    python pour_planner.py --orders 8                      # 8 made-up orders instead
+"""
+import argparse
+import heapq
+import json
+import sqlite3
+
+import metrics
+from catalog import RecipeCatalog
+from drinks import drink_list
+from flow_model import DEFAULT_FLOW_RATE, pour_jobs
+from order_queue import OrderQueue
+from pump_index import PumpIndex
+
+FLOW_RATE = DEFAULT_FLOW_RATE   # seconds per mL for uncalibrated pumps
+CHANGEOVER = 10.0               # seconds to place or swap a glass
+MAX_SKIPS = 3
+
+SAVED = metrics.histogram("pour_plan_saved_seconds",
+                          "Makespan the planner would save over FIFO on the queued orders")
+
+
+class PlannedDrink(object):
+    """One order in a plan: its glass `position` and timed pump `jobs`."""
+
+    def __init__(self, order, drink, position, jobs):
+        self.order = order
+        self.drink = drink
+        self.position = position
+        self.jobs = jobs
+        self.start = min(j.start for j in jobs)
+        self.end = max(j.end for j in jobs)
+
+    def __repr__(self):
+        return (f"PlannedDrink({self.drink['name']!r}, position={self.position}, "
+                f"start={self.start:.1f}, end={self.end:.1f})")
+
+
+class PourPlan(object):
+    def __init__(self, drinks, max_concurrent, positions, changeover):
+        self.drinks = drinks            # PlannedDrink, in pour order
+        self.max_concurrent = max_concurrent
+        self.positions = positions
+        self.changeover = changeover
+
+    @property
+    def makespan(self):
+        return max((d.end for d in self.drinks), default=0.0)
+
+    def jobs(self):
+        """every pump run in the plan, ordered by start time"""
+        return sorted((j for d in self.drinks for j in d.jobs), key=lambda j: j.start)
+
+    def timeline(self):
+        """[(start, end, pin, drink name, label)] for display or tests"""
+        return [(j.start, j.end, j.pin, d.drink["name"], j.label)
+                for d in self.drinks for j in sorted(d.jobs, key=lambda j: j.start)]
+
+
+def _peak(intervals, start, end):
+    """most of `intervals` ((start, end) pairs) running at once within [start, end)"""
+    points = [start] + [s for s, e in intervals if start < s < end]
+    return max((sum(1 for s, e in intervals if s <= t < e) for t in points), default=0)
+
+
+class PourPlanner(object):
+    """
+    Plans drinks on the pumps in `pump_configuration`. `positions` glasses can
+    be filled at once (1 reproduces the current one-at-a-time behaviour),
+    each taking `changeover` seconds to swap; at most `max_concurrent` pumps
+    run at once (None for no cap).
+    """
+
+    def __init__(self, pump_configuration, index=None, flow_rate=FLOW_RATE, max_concurrent=None,
+                 positions=1, changeover=CHANGEOVER, lookahead=1, max_skips=MAX_SKIPS):
+        if positions < 1 or lookahead < 1:
+            raise ValueError("positions and lookahead must be at least 1")
+        self.pump_configuration = pump_configuration
+        self.index = index or PumpIndex(pump_configuration)
+        self.flow_rate = flow_rate
+        self.max_concurrent = max_concurrent
+        self.positions = positions
+        self.changeover = changeover
+        self.lookahead = lookahead
+        self.max_skips = max_skips
+
+    def jobs(self, drink):
+        return pour_jobs(drink, self.pump_configuration, self.index, self.flow_rate)
+
+    def _fits(self, pin, start, end, busy):
+        overlapping = [(s, e) for s, e, p in busy if s < end and start < e]
+        if any(p == pin and s < end and start < e for s, e, p in busy):
+            return False
+        return self.max_concurrent is None or _peak(overlapping, start, end) < self.max_concurrent
+
+    def _place(self, drink, ready, busy):
+        """
+        Times the jobs of `drink` on a glass placed at `ready`, longest first,
+        each at the earliest moment its pump is free and the cap allows.
+
+        returns the jobs with start/end filled in (`busy` is left untouched)
+        """
+        placed = list(busy)
+        jobs = sorted(self.jobs(drink), key=lambda j: j.duration, reverse=True)
+        for job in jobs:
+            for start in sorted({ready} | {e for s, e, p in placed if e > ready}):
+                if self._fits(job.pin, start, start + job.duration, placed):
+                    break
+            job.start, job.end = start, start + job.duration
+            placed.append((job.start, job.end, job.pin))
+        return jobs
+
+    def plan(self, orders):
+        """
+        `orders` is a list of (order, drink) pairs in arrival order, where
+        `drink` is a recipe dict; drinks the pumps cannot make must be
+        filtered out first.
+
+        returns a PourPlan
+        """
+        pending = [[order, drink, 0] for order, drink in orders]
+        glasses = [(0.0, p) for p in range(self.positions)]   # (free at, position)
+        busy = []                                             # (start, end, pin)
+        planned = []
+        while pending:
+            ready, position = heapq.heappop(glasses)
+            # runs that ended before this glass was placed cannot collide any more
+            busy = [b for b in busy if b[1] > ready]
+            if pending[0][2] >= self.max_skips:
+                choice, jobs = 0, self._place(pending[0][1], ready, busy)
+            else:
+                choice, jobs = min(((i, self._place(entry[1], ready, busy))
+                                    for i, entry in enumerate(pending[:self.lookahead])),
+                                   key=lambda c: (max(j.end for j in c[1]), c[0]))
+            for entry in pending[:choice]:
+                entry[2] += 1
+            order, drink, _ = pending.pop(choice)
+            busy.extend((j.start, j.end, j.pin) for j in jobs)
+            done = PlannedDrink(order, drink, position, jobs)
+            planned.append(done)
+            heapq.heappush(glasses, (done.end + self.changeover, position))
+        return PourPlan(planned, self.max_concurrent, self.positions, self.changeover)
+
+
+def validate(plan):
+    """
+    Checks that no pump runs two jobs at once, the concurrency cap holds and
+    no more than `positions` glasses are in use at any moment.
+
+    raises ValueError listing every violation
+    """
+    problems = []
+    jobs = plan.jobs()
+    for i, a in enumerate(jobs):
+        for b in jobs[i + 1:]:
+            if b.start >= a.end:
+                break
+            if a.pin == b.pin:
+                problems.append(f"pin {a.pin} double-booked at {b.start:.2f}s ({a.label} / {b.label})")
+    if plan.max_concurrent is not None:
+        intervals = [(j.start, j.end) for j in jobs]
+        for j in jobs:
+            if _peak(intervals, j.start, j.start + 1e-9) > plan.max_concurrent:
+                problems.append(f"more than {plan.max_concurrent} pumps on at {j.start:.2f}s")
+    glasses = [(d.start, d.end + plan.changeover) for d in plan.drinks]
+    for d in plan.drinks:
+        if _peak(glasses, d.start, d.start + 1e-9) > plan.positions:
+            problems.append(f"more than {plan.positions} glasses in use at {d.start:.2f}s")
+    if problems:
+        raise ValueError("; ".join(problems))
+    return plan
+
+
+def compare_fifo(planner, orders):
+    """
+    Plans `orders` with `planner` and with strict FIFO, one glass at a time.
+
+    returns (fifo plan, planned, seconds saved, improvement as a fraction of FIFO)
+    """
+    fifo = PourPlanner(planner.pump_configuration, planner.index, planner.flow_rate,
+                       planner.max_concurrent, 1, planner.changeover).plan(orders)
+    planned = planner.plan(orders)
+    saved = fifo.makespan - planned.makespan
+    return fifo, planned, saved, (saved / fifo.makespan if fifo.makespan else 0.0)
+
+
+def plan_queue(planner, pending, find_drink):
+    """
+    Plans `pending` (OrderQueue.pending()) against FIFO and observes the
+    seconds saved in SAVED. Orders whose drink is unknown or cannot be made
+    on the planner's pumps are left out.
+
+    returns compare_fifo()'s result, or None with fewer than two orders to plan
+    """
+    orders = []
+    for order in pending:
+        drink = find_drink(order.drink)
+        if drink is not None and planner.index.can_make(planner.index.requirement(drink["ingredients"])):
+            orders.append((order.id, drink))
+    if len(orders) < 2:
+        return None
+    result = compare_fifo(planner, orders)
+    SAVED.observe(result[2])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders-db", default="orders.db", help="plan the orders queued here")
+    parser.add_argument("--orders", type=int, default=None, help="plan this many made-up orders instead")
+    parser.add_argument("--positions", type=int, default=2)
+    parser.add_argument("--lookahead", type=int, default=3)
+    parser.add_argument("--max-concurrent", type=int, default=None)
+    parser.add_argument("--changeover", type=float, default=CHANGEOVER)
+    parser.add_argument("--pump-config", default="pump_config.json")
+    parser.add_argument("--timeline", action="store_true", help="print every pump run")
+    args = parser.parse_args()
+
+    with open(args.pump_config) as f:
+        pump_configuration = json.load(f)
+    catalog = RecipeCatalog(drink_list)
+    index = PumpIndex(pump_configuration, catalog)
+    planner = PourPlanner(pump_configuration, index, max_concurrent=args.max_concurrent,
+                          positions=args.positions, changeover=args.changeover,
+                          lookahead=args.lookahead)
+    if args.orders is not None:
+        makeable = [d for d in catalog if index.can_make(index.requirement(d["ingredients"]))]
+        orders = [(i + 1, makeable[(i * 3) % len(makeable)]) for i in range(args.orders)]
+        result = compare_fifo(planner, orders) if orders else None
+    else:
+        try:
+            queue = OrderQueue(args.orders_db, read_only=True)
+        except sqlite3.OperationalError as e:
+            raise SystemExit(f"Cannot open {args.orders_db}: {e}")
+        try:
+            pending = queue.pending()
+        finally:
+            queue.close()
+        result = plan_queue(planner, pending, catalog.find)
+        orders = pending
+    if result is None:
+        print(f"{len(orders)} order(s) queued; fewer than two can be made on these pumps")
+        return
+    fifo, planned, saved, improvement = result
+    validate(fifo)
+    validate(planned)
+
+    print(f"{len(planned.drinks)} orders, {args.positions} glass positions, lookahead {args.lookahead}, "
+          f"cap {args.max_concurrent or 'none'}")
+    print(f"  FIFO makespan     {fifo.makespan:8.1f} s")
+    print(f"  planned makespan  {planned.makespan:8.1f} s  ({saved:.1f} s saved, {improvement * 100:.1f} %)")
+    print("  pour order        " + " ".join(f"#{d.order}" for d in planned.drinks))
+    if args.timeline:
+        for start, end, pin, name, label in planned.timeline():
+            print(f"    {start:7.1f} – {end:7.1f} s  pin {pin:>2}  {name:<6} {label}")
+
+
+if __name__ == "__main__":
+    main()
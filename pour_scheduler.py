@@ -0,0 +1,150 @@
+"""
+Single-loop pour scheduler.
+
+Every pump a drink needs is driven from one timing loop: pumps are switched on
+and off from a heap of deadlines instead of pouring ingredients one after the
+other (sum of times) or starting one thread per pump. A cap on how many pumps
+may run at once keeps the draw within what the power supply can deliver.
+"""
+import heapq
+import time
+
+from pump_timing import DeadlineTimer, TimingStats
+
+STOP_CHECK = 0.05   # seconds between checks of a run's stop event
+
+
+class PourJob:
+    """
+    One pump run: `pin` is held on for `duration` seconds, which delivers
+    `volume` mL from pump `pump` when those are known.
+    """
+
+    def __init__(self, pin, duration, label=None, pump=None, volume=None):
+        self.pin = pin
+        self.duration = duration
+        self.label = label
+        self.pump = pump
+        self.volume = volume
+        self.start = None
+        self.end = None
+        self.actual = None    # measured on-time once poured
+
+    def __repr__(self):
+        return (f"PourJob(pin={self.pin}, duration={self.duration:.2f}, "
+                f"label={self.label!r}, start={self.start}, end={self.end})")
+
+
+def plan_pours(jobs, max_concurrent=None):
+    """
+    Fills in `start`/`end` (seconds from the start of the pour) for every job.
+
+    With no cap every job starts at 0 and the drink takes max(duration). With a
+    cap the longest jobs are started first and each freed slot takes the next
+    longest job, which keeps the makespan close to optimal.
+
+    returns the jobs ordered by start time
+    """
+    if max_concurrent is not None and max_concurrent < 1:
+        raise ValueError("max_concurrent must be at least 1")
+    ordered = sorted(jobs, key=lambda j: j.duration, reverse=True)
+    slots = [0.0] * min(len(ordered), max_concurrent or len(ordered))
+    for job in ordered:
+        job.start = heapq.heappop(slots)
+        job.end = job.start + job.duration
+        heapq.heappush(slots, job.end)
+    ordered.sort(key=lambda j: j.start)
+    return ordered
+
+
+def makespan(jobs):
+    return max((j.end for j in jobs), default=0.0)
+
+
+class PourScheduler:
+    """
+    Runs planned pour jobs against `switch_on(pin)` / `switch_off(pin)`.
+
+    `clock` and `sleep` default to the real monotonic clock so the same loop
+    can be driven by a virtual clock for headless runs. Deadlines are waited
+    for by a DeadlineTimer, and every run's commanded and measured on-time is
+    recorded in `stats`.
+    """
+
+    def __init__(self, switch_on, switch_off, max_concurrent=None,
+                 clock=time.monotonic, sleep=time.sleep, timer=None, stats=None):
+        self.switch_on = switch_on
+        self.switch_off = switch_off
+        self.max_concurrent = max_concurrent
+        self.clock = clock
+        self.sleep = sleep
+        self.timer = timer or DeadlineTimer(clock, sleep)
+        self.stats = stats or TimingStats()
+
+    def run(self, jobs, on_start=None, on_finish=None, stop=None):
+        """
+        Pours `jobs` and blocks until the last pump is off.
+
+        Every pump that was switched on is switched off again even if the loop
+        is interrupted.
+
+        returns the planned jobs
+        """
+        return self.execute(plan_pours(jobs, self.max_concurrent), on_start, on_finish, stop)
+
+    def execute(self, plan, on_start=None, on_finish=None, stop=None):
+        """
+        Runs jobs whose `start`/`end` are already filled in (by plan_pours or
+        a multi-drink planner), counted from now.
+
+        Setting `stop` (a threading.Event) ends the run early: no more pumps
+        start and the running ones are switched off within STOP_CHECK
+        seconds. Those waits are not compensated, so only runs that may be
+        cut short (cleaning, priming) should pass one.
+
+        returns `plan`
+        """
+        # (deadline, 0=off/1=on, seq, job): offs sort before ons at the same
+        # instant so a freed slot is released before the next pump starts.
+        # Each off is queued when its pump actually switches on, so a late
+        # start still gets its full on-time.
+        t0 = self.clock()
+        events = [(t0 + job.start, 1, seq, job) for seq, job in enumerate(plan)]
+        heapq.heapify(events)
+
+        running = {}    # job -> time its pump switched on
+        try:
+            while events:
+                at, action, seq, job = heapq.heappop(events)
+                if action and self.max_concurrent and len(running) >= self.max_concurrent:
+                    # an earlier pump started late and still holds the slot
+                    heapq.heappush(events, (max(at, min(on + j.duration for j, on in running.items())),
+                                            action, seq, job))
+                    continue
+                if stop is None:
+                    waited = self.timer.wait_until(at)
+                else:
+                    while not stop.is_set() and self.clock() < at:
+                        self.sleep(min(at - self.clock(), STOP_CHECK))
+                    if stop.is_set():
+                        break
+                    waited = False
+                if action:
+                    self.switch_on(job.pin)
+                    switched = running[job] = self.clock()
+                    heapq.heappush(events, (switched + job.duration, 0, seq, job))
+                else:
+                    self.switch_off(job.pin)
+                    switched = self.clock()
+                    job.actual = switched - running.pop(job)
+                    self.stats.record(job.pin, job.duration, job.actual)
+                if waited:
+                    self.timer.observe(at, switched)
+                callback = on_start if action else on_finish
+                if callback:
+                    callback(job)
+        finally:
+            for job, on in running.items():
+                self.switch_off(job.pin)
+                job.actual = self.clock() - on
+        return plan
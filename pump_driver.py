@@ -0,0 +1,181 @@
+"""
+Pump driver interface.
+
+Every front end switches pumps through a PumpDriver and waits through the
+driver's clock:
+
+    GPIOPumpDriver       RPi.GPIO relays (imported only when used)
+    SimulatedPumpDriver  no hardware; keeps pin state and total on-time
+    RecordingPumpDriver  wraps another driver and logs every switch
+
+The GPIO driver runs on SystemClock (real time). Simulated drivers default to
+a VirtualClock, whose sleeps return immediately while time still advances, so
+a full order flow that takes 30+ s on the machine runs in milliseconds; pass
+clock=SystemClock() to watch it in real time instead.
+"""
+import os
+import threading
+import time
+
+# the relay board on the bartender switches a pump on when its pin is LOW;
+# every front end drives it the same way (PUMP_ACTIVE_LOW=0 for an active-high board)
+ACTIVE_LOW = os.environ.get("PUMP_ACTIVE_LOW", "1") != "0"
+
+
+class SystemClock(object):
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock(object):
+    """
+    Simulated time. sleep() advances the clock instead of blocking, so a
+    single timing loop such as PourScheduler jumps straight from one deadline
+    to the next. Sleeps from several threads add up rather than overlap.
+    """
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def now(self):
+        return self._now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            with self._lock:
+                self._now += seconds
+
+    def advance_to(self, when):
+        with self._lock:
+            self._now = max(self._now, when)
+
+
+class PumpDriver(object):
+    """
+    Switches pump pins. `active_low` is True for relay boards that turn a
+    pump on when the pin is pulled low.
+    """
+
+    def __init__(self, active_low=True, clock=None):
+        self.active_low = active_low
+        self.clock = clock or SystemClock()
+
+    def setup(self, pins):
+        """Configures `pins` as outputs with every pump off."""
+        raise NotImplementedError
+
+    def on(self, pin):
+        raise NotImplementedError
+
+    def off(self, pin):
+        raise NotImplementedError
+
+    def cleanup(self):
+        pass
+
+
+class GPIOPumpDriver(PumpDriver):
+    def __init__(self, active_low=True, clock=None):
+        PumpDriver.__init__(self, active_low, clock)
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        self._on = GPIO.LOW if active_low else GPIO.HIGH
+        self._off = GPIO.HIGH if active_low else GPIO.LOW
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+
+    def setup(self, pins):
+        for pin in pins:
+            self.GPIO.setup(pin, self.GPIO.OUT, initial=self._off)
+
+    def on(self, pin):
+        self.GPIO.output(pin, self._on)
+
+    def off(self, pin):
+        self.GPIO.output(pin, self._off)
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+
+
+class SimulatedPumpDriver(PumpDriver):
+    """Tracks which pins are on and how long each has run, in clock time."""
+
+    def __init__(self, active_low=True, clock=None):
+        PumpDriver.__init__(self, active_low, clock or VirtualClock())
+        self.running = {}        # pin -> switched-on time
+        self.on_time = {}        # pin -> total seconds on
+        self.peak = 0            # most pins on at once
+
+    def setup(self, pins):
+        for pin in pins:
+            self.on_time.setdefault(pin, 0.0)
+
+    def on(self, pin):
+        if pin not in self.running:
+            self.running[pin] = self.clock.now()
+            self.peak = max(self.peak, len(self.running))
+
+    def off(self, pin):
+        started = self.running.pop(pin, None)
+        if started is not None:
+            self.on_time[pin] = self.on_time.get(pin, 0.0) + self.clock.now() - started
+
+    def cleanup(self):
+        for pin in list(self.running):
+            self.off(pin)
+
+
+class RecordingPumpDriver(PumpDriver):
+    """
+    Passes every call on to `driver` (a SimulatedPumpDriver by default) and
+    records (time, pin, "on"/"off") in `events`.
+    """
+
+    def __init__(self, driver=None, clock=None):
+        driver = driver or SimulatedPumpDriver(clock=clock)
+        PumpDriver.__init__(self, driver.active_low, driver.clock)
+        self.driver = driver
+        self.events = []
+
+    def setup(self, pins):
+        self.driver.setup(pins)
+
+    def on(self, pin):
+        self.driver.on(pin)
+        self.events.append((self.clock.now(), pin, "on"))
+
+    def off(self, pin):
+        self.driver.off(pin)
+        self.events.append((self.clock.now(), pin, "off"))
+
+    def cleanup(self):
+        self.driver.cleanup()
+
+
+DRIVERS = {
+    "gpio": GPIOPumpDriver,
+    "simulated": SimulatedPumpDriver,
+    "recording": RecordingPumpDriver,
+}
+
+
+def make_driver(name=None, active_low=None, clock=None):
+    """
+    Builds the driver called `name`, or the one named by the PUMP_DRIVER
+    environment variable ("gpio" if unset), with the board's ACTIVE_LOW
+    polarity unless `active_low` is given.
+    """
+    name = name or os.environ.get("PUMP_DRIVER", "gpio")
+    if active_low is None:
+        active_low = ACTIVE_LOW
+    if name not in DRIVERS:
+        raise ValueError(f"Unknown pump driver '{name}' (choose from {', '.join(DRIVERS)})")
+    if name == "recording":
+        return RecordingPumpDriver(SimulatedPumpDriver(active_low, clock))
+    return DRIVERS[name](active_low, clock)
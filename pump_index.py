@@ -0,0 +1,80 @@
+"""
+Ingredient-to-pump index.
+
+Built once from a pump configuration and kept up to date one pump at a time
+as pumps are reassigned. Every ingredient gets a bit; each drink's required
+ingredients are folded into a bitmask when the drink is added, so checking
+whether a drink can be made is a single mask test instead of a scan over
+every pump for every ingredient.
+"""
+
+
+class PumpIndex(object):
+    def __init__(self, pump_configuration, drinks=()):
+        self.pump_configuration = pump_configuration
+        self._bits = {}          # ingredient -> bit
+        self._pumps = {}         # ingredient -> [pump key]
+        self._required = {}      # drink name -> ingredient mask
+        self.available = 0       # mask of ingredients with at least one pump
+        for key in sorted(pump_configuration):
+            self._attach(key, pump_configuration[key]["value"])
+        self.add_drinks(drinks)
+
+    @staticmethod
+    def _fold(name):
+        return name.casefold() if name is not None else None
+
+    def bit(self, ingredient):
+        ingredient = self._fold(ingredient)
+        bit = self._bits.get(ingredient)
+        if bit is None:
+            bit = self._bits[ingredient] = 1 << len(self._bits)
+        return bit
+
+    def requirement(self, ingredients):
+        """returns the mask of `ingredients` (any iterable of names)"""
+        mask = 0
+        for ingredient in ingredients:
+            mask |= self.bit(ingredient)
+        return mask
+
+    def add_drinks(self, drinks):
+        for drink in drinks:
+            self._required[self._fold(drink["name"])] = self.requirement(drink["ingredients"])
+
+    def pumps_for(self, ingredient):
+        """returns the keys of the pumps loaded with `ingredient`"""
+        return self._pumps.get(self._fold(ingredient), ())
+
+    def can_make(self, drink):
+        """`drink` is a drink name or a requirement mask"""
+        mask = drink if isinstance(drink, int) else self._required.get(self._fold(drink))
+        return mask is not None and not mask & ~self.available
+
+    def available_drinks(self):
+        return [name for name, mask in self._required.items() if not mask & ~self.available]
+
+    def assign(self, pump_key, value):
+        """Moves `pump_key` to `value`, updating only the two ingredients involved."""
+        pump = self.pump_configuration[pump_key]
+        self._detach(pump_key, pump["value"])
+        pump["value"] = value
+        self._attach(pump_key, value)
+
+    def _attach(self, pump_key, value):
+        if value is None:
+            return
+        pumps = self._pumps.setdefault(self._fold(value), [])
+        if pump_key not in pumps:
+            pumps.append(pump_key)
+        self.available |= self.bit(value)
+
+    def _detach(self, pump_key, value):
+        if value is None:
+            return
+        pumps = self._pumps.get(self._fold(value), [])
+        if pump_key in pumps:
+            pumps.remove(pump_key)
+        if not pumps:
+            self._pumps.pop(self._fold(value), None)
+            self.available &= ~self.bit(value)
@@ -5,10 +5,20 @@ Sequential-pump driver for a Raspberry Pi.
 • Each pump is switched by a GPIO pin that drives a relay or MOSFET.
 • The pumps have their **own** power supply; the Pi only sends the control signal.
 • Uses BCM pin numbering (the numbers printed on most wiring diagrams).
+• Run with PUMP_DRIVER=simulated to walk through the test without a Pi.
+
+`python pump_test.py calibrate [pump_1 ...]` instead measures each pump's
+flow rate and dead volume on water with a measuring cup and stores them in
+pump_config.json (see flow_model.py). The liquid's own viscosity factor is
+applied on top, so calibrating on the real liquid would count it twice.
 """
 
-import time
-import RPi.GPIO as GPIO
+import sys
+
+from config_store import ConfigStore
+from flow_model import prime_time
+from pour_scheduler import PourJob, PourScheduler
+from pump_driver import make_driver
 
 # ---------------------------------------------------------------------------
 # 1) Declare your pumps in one easy-to-read dictionary
@@ -23,43 +33,110 @@ PUMPS = {
 }
 
 RUNTIME_SECONDS = 30           # How long to run each pump
-ACTIVE_STATE     = GPIO.HIGH   # Change to GPIO.LOW if your relay is active-low
+CALIBRATION_SECONDS = 10       # Length of each timed calibration run
+CONFIG_FILE      = "pump_config.json"
+
+# ---------------------------------------------------------------------------
+# 2) Basic pump setup
+# ---------------------------------------------------------------------------
+# PUMP_DRIVER env var, "gpio" by default. Same relay polarity as the daemon
+# (pump_driver.ACTIVE_LOW, PUMP_ACTIVE_LOW=0 for an active-high board)
+pumps = make_driver()
+
 
 # ---------------------------------------------------------------------------
-# 2) Basic GPIO setup
+# 3) Calibration: two timed runs per pump into a measuring cup
 # ---------------------------------------------------------------------------
-GPIO.setmode(GPIO.BCM)         # Use BCM numbering (17, 27, …)
-GPIO.setwarnings(False)
+def ask_ml(prompt):
+    while True:
+        try:
+            return float(input(prompt))
+        except ValueError:
+            print("Please enter a number of mL.")
+
+
+def calibrate(keys):
+    store = ConfigStore(CONFIG_FILE)
+    configuration = store.load()
+    keys = keys or sorted(configuration)
+    pumps.setup(configuration[k]["pin"] for k in keys)
+    # deadline-timed runs, so every run lasts exactly CALIBRATION_SECONDS
+    scheduler = PourScheduler(pumps.on, pumps.off, clock=pumps.clock.now, sleep=pumps.clock.sleep)
 
-for pump in PUMPS.values():
-    GPIO.setup(pump["pin"], GPIO.OUT, initial=GPIO.LOW)
+    for key in keys:
+        pump = configuration[key]
+        print(f"\n[{pump['name']}] holding {pump['value']!r} (GPIO {pump['pin']})")
+        # flow_rate is for water; the viscosity factor below covers the liquid
+        input("  Put the intake in a jug of water, let the line drain as it does between pours,\n"
+              "  put an empty cup under it, press Enter…")
+        scheduler.run([PourJob(pump["pin"], CALIBRATION_SECONDS)])
+        first = ask_ml("  mL in the cup: ")
+        input("  Empty the cup and put it back (the line is primed now), press Enter…")
+        scheduler.run([PourJob(pump["pin"], CALIBRATION_SECONDS)])
+        primed = ask_ml("  mL in the cup: ")
+        if primed <= 0:
+            print("  Nothing pumped – check the wiring and tubing; calibration skipped.")
+            continue
+
+        pump["flow_rate"] = round(CALIBRATION_SECONDS / primed, 5)   # seconds per mL
+        pump["dead_volume"] = round(max(0.0, primed - first), 1)     # mL lost to an empty line
+        viscosity = input(f"  Viscosity factor for {pump['value']!r} "
+                          f"[{pump.get('viscosity', 1.0)}, Enter keeps it]: ").strip()
+        if viscosity:
+            pump["viscosity"] = float(viscosity)
+        print(f"  → {pump['flow_rate']} s/mL of water, dead volume {pump['dead_volume']} mL")
+        input(f"  Put the intake back in the {pump['value'] or 'bottle'} and a cup under the nozzle, press Enter…")
+        # pushes the water out of the line, so the next drink is not diluted
+        scheduler.run([PourJob(pump["pin"], prime_time(pump))])
+
+    # pumps may have been reassigned from the menu meanwhile; only the
+    # calibration is ours. Written atomically, so the daemon's watcher never
+    # reads half a file.
+    latest = store.load()
+    for key in keys:
+        for field in ("flow_rate", "dead_volume", "viscosity"):
+            if field in configuration[key] and key in latest:
+                latest[key][field] = configuration[key][field]
+    store.save(latest)
+    store.close()
+    print(f"\nCalibration saved to {CONFIG_FILE}.")
 
-print("Starting pump test – each pump will run for "
-      f"{RUNTIME_SECONDS} s, one at a time.\n"
-      "Press Ctrl-C to abort.\n")
 
 # ---------------------------------------------------------------------------
-# 3) Main loop: run each pump once
+# 4) Main loop: run each pump once
 # ---------------------------------------------------------------------------
-try:
+def run_test():
+    pumps.setup(pump["pin"] for pump in PUMPS.values())
+
+    print("Starting pump test – each pump will run for "
+          f"{RUNTIME_SECONDS} s, one at a time.\n"
+          "Press Ctrl-C to abort.\n")
+
     for key, pump in PUMPS.items():
         name = pump["name"]
         pin  = pump["pin"]
 
         print(f"[{name}] ON  (GPIO {pin})")
-        GPIO.output(pin, ACTIVE_STATE)     # Turn pump on
-        time.sleep(RUNTIME_SECONDS)
-        GPIO.output(pin, not ACTIVE_STATE) # Turn pump off
+        pumps.on(pin)                      # Turn pump on
+        pumps.clock.sleep(RUNTIME_SECONDS)
+        pumps.off(pin)                     # Turn pump off
         print(f"[{name}] OFF\n")
 
     print("All pumps have completed their 30-second run.")
 
+
+try:
+    if sys.argv[1:2] == ["calibrate"]:
+        calibrate(sys.argv[2:])
+    else:
+        run_test()
+
 except KeyboardInterrupt:
     print("\nUser interrupted – shutting everything down.")
 
 finally:
     # -----------------------------------------------------------------------
-    # 4) Always clean up the GPIO pins on exit
+    # 5) Always switch the pumps off and release the pins on exit
     # -----------------------------------------------------------------------
-    GPIO.cleanup()
-    print("GPIO cleanup done. Goodbye!")
+    pumps.cleanup()
+    print("Pump cleanup done. Goodbye!")
@@ -0,0 +1,99 @@
+"""
+Pump timing engine.
+
+A pump's dose is its on-time, so the switch-off has to land on time. A plain
+time.sleep(wait) wakes late by however long the OS takes to reschedule the
+process, which grows under load. The DeadlineTimer:
+
+  * waits for absolute monotonic deadlines, so errors never accumulate;
+  * sleeps until just before a deadline and covers the last `spin` seconds
+    in short sleeps, which the scheduler honours far more tightly;
+  * learns how late switches complete after their deadline (wake-up plus
+    GPIO latency) and aims that much earlier next time.
+
+Every pour's commanded and measured on-time goes into TimingStats, which
+reports dosing error percentiles and whether they stay within tolerance.
+"""
+import collections
+import statistics
+import time
+
+SPIN = 0.002          # last stretch before a deadline waited in short sleeps
+SPIN_STEP = 0.0002
+ALPHA = 0.2           # how strongly each late/early switch corrects the aim
+MAX_LAG = 0.05        # never aim more than this far ahead of a deadline
+TOLERANCE = 0.005     # acceptable on-time error in seconds (5 ms ≈ 0.01 mL)
+
+
+class DeadlineTimer(object):
+    """
+    `lag` is the learned delay between a deadline and the switch actually
+    completing; waits aim `lag` early to cancel it out.
+    """
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep, spin=SPIN, alpha=ALPHA):
+        self.clock = clock
+        self.sleep = sleep
+        self.spin = spin
+        self.alpha = alpha
+        self.lag = 0.0
+
+    def target(self, deadline):
+        """when to wake (or fire a loop timer) so the switch lands on `deadline`"""
+        return deadline - self.lag
+
+    def wait_until(self, deadline):
+        """
+        Blocks until the compensated target for `deadline`.
+
+        returns True if it had to wait at all
+        """
+        target = self.target(deadline)
+        remaining = target - self.clock()
+        if remaining <= 0:
+            return False
+        if remaining > self.spin:
+            self.sleep(remaining - self.spin)
+        while True:
+            remaining = target - self.clock()
+            if remaining <= 0:
+                return True
+            self.sleep(min(remaining, SPIN_STEP))
+
+    def observe(self, deadline, switched):
+        """feeds back that the switch aimed at `deadline` completed at `switched`"""
+        self.lag = min(MAX_LAG, max(0.0, self.lag + self.alpha * (switched - deadline)))
+
+
+class TimingStats(object):
+    """Commanded versus measured on-time of the last `limit` pump runs."""
+
+    def __init__(self, limit=10000):
+        self.samples = collections.deque(maxlen=limit)   # (pin, commanded, actual)
+
+    def record(self, pin, commanded, actual):
+        self.samples.append((pin, commanded, actual))
+
+    def errors(self, pin=None):
+        """actual minus commanded on-time, in seconds (positive means overdosed)"""
+        return [a - c for p, c, a in self.samples if pin is None or p == pin]
+
+    def percentiles(self, qs=(50, 95, 99), pin=None):
+        """{q: absolute on-time error in seconds}"""
+        errors = sorted(abs(e) for e in self.errors(pin))
+        if len(errors) < 2:
+            return {q: (errors[0] if errors else 0.0) for q in qs}
+        cuts = statistics.quantiles(errors, n=100, method="inclusive")
+        return {q: (errors[-1] if q >= 100 else cuts[q - 1]) for q in qs}
+
+    def within(self, tolerance=TOLERANCE, q=99):
+        return self.percentiles((q,))[q] <= tolerance
+
+    def summary(self):
+        errors = self.errors()
+        if not errors:
+            return "no pours timed"
+        p = self.percentiles((50, 95, 99, 100))
+        return (f"{len(errors)} pump runs, on-time error p50={p[50] * 1e3:.2f} ms "
+                f"p95={p[95] * 1e3:.2f} ms p99={p[99] * 1e3:.2f} ms max={p[100] * 1e3:.2f} ms, "
+                f"mean bias {statistics.fmean(errors) * 1e3:+.2f} ms")
@@ -0,0 +1,211 @@
+"""
+Discrete-event throughput simulator.
+
+Replays an order trace through the pour planning the machine uses
+(PumpIndex.pumps_for + plan_pours) on simulated time, one drink at a time in
+arrival order like the pour worker, and reports throughput, queue wait
+percentiles and pump utilisation. Nothing sleeps and each recipe is planned
+once, so a 24-hour trace runs in well under a second.
+
+Traces are lists of (arrival seconds, drink name). They come from a seeded
+Poisson stream, a CSV file with `time,drink` rows, or a recorded orders.db.
+Recorded traces add a third item, True for an order the machine rejected at
+the time, which stays rejected in the replay.
+
+    python simulator.py --rate 90 --hours 24 --max-concurrent 3
+    python simulator.py --trace orders.db
+"""
+import argparse
+import csv
+import json
+import random
+import sqlite3
+
+from catalog import RecipeCatalog, load_catalog
+from drinks import drink_list
+from flow_model import DEFAULT_FLOW_RATE, pour_jobs
+from order_queue import REJECTED
+from pour_scheduler import makespan, plan_pours
+from pump_index import PumpIndex
+
+FLOW_RATE = DEFAULT_FLOW_RATE   # seconds per mL for uncalibrated pumps
+CHANGEOVER = 10.0               # seconds to swap the glass between drinks
+
+
+def percentile(values, q):
+    """nearest-rank percentile of `values` (0 for an empty list)"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+
+# ── traces ──────────────────────────────────────────────────────────────────
+
+def poisson_trace(rate, duration, drinks, weights=None, seed=1):
+    """
+    Orders arriving at `rate` per hour for `duration` seconds, each one a
+    drink name picked from `drinks` (optionally by `weights`).
+    """
+    rng = random.Random(seed)
+    names = [d["name"] if isinstance(d, dict) else d for d in drinks]
+    trace = []
+    at = rng.expovariate(rate / 3600.0)
+    while at < duration:
+        trace.append((at, rng.choices(names, weights)[0]))
+        at += rng.expovariate(rate / 3600.0)
+    return trace
+
+
+def load_trace(path):
+    """
+    Reads a recorded trace: an OrderQueue database (".db") or a CSV file with
+    `time,drink` columns and an optional `state` column. Times are rebased
+    so the first order arrives at 0.
+    """
+    if path.endswith(".db"):
+        db = sqlite3.connect(path)
+        try:
+            rows = db.execute("SELECT received, drink, state FROM orders ORDER BY received").fetchall()
+        finally:
+            db.close()
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [(float(row["time"]), row["drink"], row.get("state") or "") for row in csv.DictReader(f)]
+        rows.sort()
+    if not rows:
+        return []
+    first = rows[0][0]
+    return [(at - first, name, state == REJECTED) for at, name, state in rows]
+
+
+# ── simulation ──────────────────────────────────────────────────────────────
+
+class SimulationResult(object):
+    def __init__(self, served, rejected, waits, busy, pump_time, end):
+        self.served = served            # orders poured
+        self.rejected = rejected        # unknown or unmakeable drinks
+        self.waits = waits              # seconds from arrival to pour start, per order
+        self.busy = busy                # seconds the machine spent pouring or changing glasses
+        self.pump_time = pump_time      # pump key -> seconds on
+        self.end = end                  # simulated time of the last event
+
+    def throughput(self):
+        """orders per hour over the whole simulated run"""
+        return self.served / self.end * 3600.0 if self.end else 0.0
+
+    def utilisation(self):
+        """pump key -> fraction of the run the pump was on"""
+        return {key: (t / self.end if self.end else 0.0) for key, t in self.pump_time.items()}
+
+    def summary(self):
+        lines = [f"served {self.served} orders ({self.rejected} rejected) in {self.end / 3600.0:.2f} h",
+                 f"  throughput   {self.throughput():8.1f} orders/h",
+                 f"  machine busy {self.busy / self.end * 100 if self.end else 0.0:8.1f} %",
+                 "  queue wait   " + "  ".join(f"p{q}={percentile(self.waits, q):.0f}s" for q in (50, 90, 95, 99))
+                 + f"  max={max(self.waits, default=0.0):.0f}s"]
+        for key, u in sorted(self.utilisation().items()):
+            lines.append(f"  {key:<8} {u * 100:6.1f} % on")
+        return "\n".join(lines)
+
+
+class Simulator(object):
+    """
+    Pours a trace on a machine with `pump_configuration`. Each drink is
+    planned from the pumps' calibration, with `flow_rate` s/mL for pumps
+    that have none, running at most `max_concurrent` pumps at once (None
+    for all, as makeDrink does). `changeover` seconds separate drinks.
+    """
+
+    def __init__(self, pump_configuration, catalog, flow_rate=FLOW_RATE,
+                 max_concurrent=None, changeover=CHANGEOVER):
+        self.pump_configuration = pump_configuration
+        self.catalog = catalog if isinstance(catalog, RecipeCatalog) else RecipeCatalog(catalog)
+        self.index = PumpIndex(pump_configuration, self.catalog)
+        self.flow_rate = flow_rate
+        self.max_concurrent = max_concurrent
+        self.changeover = changeover
+        self._keys = {pump["pin"]: key for key, pump in pump_configuration.items()}
+        self._plans = {}
+
+    def jobs(self, drink):
+        """the PourJobs pour_drink would run for `drink`"""
+        return pour_jobs(drink, self.pump_configuration, self.index, self.flow_rate)
+
+    def plan(self, name):
+        """returns (duration, [(pump key, seconds on)]) for drink `name`, or None"""
+        key = name.strip().casefold()
+        if key not in self._plans:
+            drink = self.catalog.find(name)
+            if drink is None or not self.index.can_make(self.index.requirement(drink["ingredients"])):
+                self._plans[key] = None
+            else:
+                jobs = plan_pours(self.jobs(drink), self.max_concurrent)
+                self._plans[key] = (makespan(jobs), [(self._keys[j.pin], j.duration) for j in jobs])
+        return self._plans[key]
+
+    def run(self, trace):
+        free = 0.0
+        waits = []
+        busy = 0.0
+        rejected = 0
+        pump_time = dict.fromkeys(self.pump_configuration, 0.0)
+        for at, name, *rejected_then in trace:
+            plan = None if any(rejected_then) else self.plan(name)
+            if plan is None:
+                rejected += 1
+                continue
+            duration, runs = plan
+            start = max(at, free)
+            waits.append(start - at)
+            free = start + duration + self.changeover
+            busy += duration + self.changeover
+            for key, seconds in runs:
+                pump_time[key] += seconds
+        end = max(free, trace[-1][0] if trace else 0.0)
+        return SimulationResult(len(waits), rejected, waits, busy, pump_time, end)
+
+
+def capacity(simulator, drinks, weights=None):
+    """orders per hour the machine sustains when it is never idle"""
+    names = [d["name"] for d in drinks]
+    cycle = [simulator.plan(n) for n in names]
+    weights = weights or [1] * len(names)
+    total = sum(w for w, p in zip(weights, cycle) if p)
+    if not total:
+        return 0.0
+    mean = sum(w * (p[0] + simulator.changeover) for w, p in zip(weights, cycle) if p) / total
+    return 3600.0 / mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--trace", help="recorded orders.db or time,drink CSV (default: Poisson stream)")
+    parser.add_argument("--rate", type=float, default=60.0, help="Poisson orders per hour")
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--flow-rate", type=float, default=FLOW_RATE, help="seconds per mL for uncalibrated pumps")
+    parser.add_argument("--max-concurrent", type=int, default=None)
+    parser.add_argument("--changeover", type=float, default=CHANGEOVER)
+    parser.add_argument("--pump-config", default="pump_config.json")
+    parser.add_argument("--catalog", help="JSON/CSV recipe file (default: drinks.py)")
+    args = parser.parse_args()
+
+    with open(args.pump_config) as f:
+        pump_configuration = json.load(f)
+    catalog = load_catalog(args.catalog) if args.catalog else RecipeCatalog(drink_list)
+    simulator = Simulator(pump_configuration, catalog, args.flow_rate,
+                          args.max_concurrent, args.changeover)
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = poisson_trace(args.rate, args.hours * 3600.0, catalog.drinks, seed=args.seed)
+
+    print(f"{len(trace)} orders, capacity {capacity(simulator, catalog.drinks):.1f} orders/h "
+          f"(flow {args.flow_rate} s/mL, cap {args.max_concurrent or 'none'}, "
+          f"changeover {args.changeover:.0f} s)")
+    print(simulator.run(trace).summary())
+
+
+if __name__ == "__main__":
+    main()
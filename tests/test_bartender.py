@@ -0,0 +1,55 @@
+"""The console bartender's asyncio pour against a recording pump driver."""
+import asyncio
+import json
+
+import pytest
+
+import bartender
+from pour_scheduler import PourJob, makespan, plan_pours
+from pump_driver import RecordingPumpDriver, SimulatedPumpDriver, SystemClock
+
+PUMPS = {f"pump_{i}": {"name": f"Pump {i}", "pin": 10 + i, "value": None} for i in range(1, 7)}
+
+
+@pytest.fixture
+def console(tmp_path, monkeypatch):
+    # the bartender reads pump_config.json and inventory.log from the working directory
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pump_config.json").write_text(json.dumps(PUMPS))
+    return bartender.Bartender(RecordingPumpDriver(SimulatedPumpDriver(clock=SystemClock())))
+
+
+def most_on_at_once(events):
+    on = peak = 0
+    for at, pin, action in events:
+        on += 1 if action == "on" else -1
+        peak = max(peak, on)
+    return peak
+
+
+def test_a_pour_never_runs_more_pumps_than_the_cap(console):
+    durations = [0.2, 0.15, 0.1, 0.1, 0.05, 0.05]
+    plan = plan_pours([PourJob(10 + i, t) for i, t in enumerate(durations, 1)], 2)
+    start = console.pumps.clock.now()
+    asyncio.run(console.pour(plan))
+
+    assert console.pumps.driver.peak == most_on_at_once(console.pumps.events) == 2
+    for job in plan:
+        assert console.pumps.driver.on_time[job.pin] == pytest.approx(job.duration, abs=0.03)
+    assert console.pumps.clock.now() - start == pytest.approx(makespan(plan), abs=0.1)
+    assert not console.pumps.driver.running
+
+
+def test_a_cancelled_pour_switches_every_pump_off(console):
+    plan = plan_pours([PourJob(11, 5.0), PourJob(12, 5.0), PourJob(13, 5.0)], 2)
+
+    async def cancel():
+        task = asyncio.create_task(console.pour(plan))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.wait([task])
+
+    asyncio.run(cancel())
+    assert not console.pumps.driver.running
+    # the third pump was still waiting for a slot and never started
+    assert console.pumps.driver.on_time[13] == 0.0
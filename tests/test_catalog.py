@@ -0,0 +1,51 @@
+"""load_catalog() and its compiled cache."""
+import json
+import os
+
+import pytest
+
+import catalog
+from catalog import load_catalog
+
+DRINKS = [{"name": "Rum Coke", "ingredients": {"rum": 50, "coke": 150}},
+          {"name": "Gin Tonic", "ingredients": {"gin": 50, "tonic": 150}}]
+
+
+@pytest.fixture
+def recipes(tmp_path, monkeypatch):
+    path = tmp_path / "drinks.json"
+    path.write_text(json.dumps(DRINKS))
+    parsed = []
+    parse_file = catalog.parse_file
+    monkeypatch.setattr(catalog, "parse_file", lambda p: parsed.append(p) or parse_file(p))
+    return str(path), parsed
+
+
+def test_the_cache_is_reused_until_the_file_changes(recipes):
+    path, parsed = recipes
+    assert load_catalog(path).find("rum coke")["name"] == "Rum Coke"
+    assert load_catalog(path).find("GIN TONIC")["name"] == "Gin Tonic"
+    assert len(parsed) == 1
+
+    with open(path, "w") as f:
+        json.dump(DRINKS[:1], f)
+    assert len(load_catalog(path)) == 1
+    assert len(parsed) == 2
+
+
+@pytest.mark.parametrize("garbage", [
+    b"",                                    # truncated to nothing
+    b"\x80\x05not a pickle at all",         # damaged
+    b"cno_such_module\nThing\n.",           # refers to code that is gone
+    b"\x80\x04K\x01.",                      # a valid pickle of the wrong shape
+], ids=["empty", "damaged", "missing-module", "wrong-shape"])
+def test_a_corrupt_cache_is_rebuilt_from_the_source(recipes, garbage):
+    path, parsed = recipes
+    with open(path + catalog.CACHE_SUFFIX, "wb") as f:
+        f.write(garbage)
+    assert [d["name"] for d in load_catalog(path)] == ["Rum Coke", "Gin Tonic"]
+    assert len(parsed) == 1
+    # the rebuilt cache is good again
+    assert os.path.getsize(path + catalog.CACHE_SUFFIX) > len(garbage)
+    load_catalog(path)
+    assert len(parsed) == 1
@@ -0,0 +1,132 @@
+"""ConfigStore: atomic writes, debounced saves and the watcher."""
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import config_store
+from config_store import ConfigStore, write_atomic
+
+PUMPS = {"pump_1": {"name": "Pump 1", "pin": 11, "value": "rum"}}
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def configuration(value):
+    return {"pump_1": {"name": "Pump 1", "pin": 11, "value": value}}
+
+
+def make_store(tmp_path, **kwargs):
+    path = tmp_path / "pump_config.json"
+    path.write_text(json.dumps(PUMPS))
+    store = ConfigStore(str(path), log=quiet, **kwargs)
+    store.load()
+    return store
+
+
+def test_write_atomic_replaces_the_file_through_a_temporary_file(tmp_path, monkeypatch):
+    path = tmp_path / "pump_config.json"
+    path.write_text("old")
+    replaced = []
+    replace = os.replace
+
+    def record(src, dst):
+        # the new text is complete on disk before it takes the original's place
+        replaced.append((os.path.dirname(src), open(src).read(), dst))
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", record)
+    write_atomic(str(path), "new")
+    assert path.read_text() == "new"
+    assert replaced == [(str(tmp_path), "new", str(path))]
+    assert os.listdir(tmp_path) == ["pump_config.json"]
+
+
+def test_a_failed_write_leaves_the_original_and_no_temporary_file(tmp_path, monkeypatch):
+    path = tmp_path / "pump_config.json"
+    path.write_text("old")
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        write_atomic(str(path), "new")
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["pump_config.json"]
+
+
+def test_a_burst_of_saves_is_written_once(tmp_path):
+    store = make_store(tmp_path, debounce=0.2)
+    try:
+        for value in ["gin", "vodka", "tonic", "coke"]:
+            store.save(configuration(value))
+            time.sleep(0.02)
+        assert store.writes == 0
+        assert wait_for(lambda: store.writes == 1)
+        time.sleep(0.3)
+        assert store.writes == 1
+        assert store.load() == configuration("coke")
+    finally:
+        store.close()
+
+
+def test_the_watcher_reports_other_writers_but_not_the_store_itself(tmp_path):
+    store = make_store(tmp_path, debounce=0.01, poll=0.02)
+    seen = []
+    store.watch(seen.append)
+    try:
+        store.save(configuration("gin"))
+        assert wait_for(lambda: store.writes == 1)
+        time.sleep(0.2)
+        assert seen == []
+
+        # another process replaces the file
+        write_atomic(store.path, json.dumps(configuration("coke")))
+        assert wait_for(lambda: seen == [configuration("coke")])
+        time.sleep(0.2)
+        assert seen == [configuration("coke")]
+    finally:
+        store.close()
+
+
+def test_saves_do_not_wait_for_a_write_in_progress(tmp_path, monkeypatch):
+    store = make_store(tmp_path, debounce=0.01)
+    writing = threading.Event()
+    release = threading.Event()
+    write = config_store.write_atomic
+
+    def slow(path, text):
+        writing.set()
+        release.wait(5)
+        write(path, text)
+
+    monkeypatch.setattr(config_store, "write_atomic", slow)
+    try:
+        store.save(configuration("gin"))
+        assert writing.wait(2)
+        # the writer thread is stuck on the disk; the lock is free and save() returns at once
+        started = time.monotonic()
+        assert store._cond.acquire(timeout=0.5)
+        store._cond.release()
+        store.save(configuration("coke"))
+        assert time.monotonic() - started < 0.5
+        release.set()
+        assert wait_for(lambda: store.writes == 2)
+        assert store.load() == configuration("coke")
+    finally:
+        release.set()
+        store.close()
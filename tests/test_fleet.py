@@ -0,0 +1,190 @@
+"""Coordinator routing to simulated stations, and recovery of assigned orders."""
+import json
+import socket
+import sqlite3
+import threading
+import time
+
+from fleet import Coordinator, simulated_station
+from order_queue import ASSIGNED, DONE, INTERRUPTED, QUEUED, OrderQueue
+
+RUM = {"pump_1": {"name": "Pump 1", "pin": 11, "value": "rum"},
+       "pump_2": {"name": "Pump 2", "pin": 12, "value": "coke"}}
+GIN = {"pump_1": {"name": "Pump 1", "pin": 11, "value": "gin"},
+       "pump_2": {"name": "Pump 2", "pin": 12, "value": "tonic"}}
+DRINKS = {"rum coke": {"name": "Rum Coke", "ingredients": {"rum": 50, "coke": 150}},
+          "gin tonic": {"name": "Gin Tonic", "ingredients": {"gin": 50, "tonic": 150}}}
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def find_drink(name):
+    return DRINKS.get(name.lower())
+
+
+def state(path, order_id):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("SELECT state FROM orders WHERE id = ?", (order_id,)).fetchone()[0]
+    finally:
+        db.close()
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class Fleet(object):
+    """A coordinator on an ephemeral port and the stations started against it."""
+
+    def __init__(self, queue):
+        self.events = []
+        self.coordinator = Coordinator(queue, find_drink, lambda kind, order: self.events.append((kind, order.id)),
+                                       port=0, log=quiet).start()
+        self.stations = []
+
+    def station(self, name, pumps, admit=None, release=None):
+        host, port = self.coordinator.address
+        station = simulated_station(name, pumps, speedup=1000.0, host=host, port=port, log=quiet,
+                                    admit=admit, release=release)
+        threading.Thread(target=station.run, daemon=True).start()
+        self.stations.append(station)
+        assert wait_for(lambda: name in self.coordinator.stations)
+        return station
+
+    def stop(self):
+        for station in self.stations:
+            station.stop()
+        self.coordinator.stop()
+
+
+def test_orders_go_to_the_station_that_holds_their_ingredients():
+    queue = OrderQueue(":memory:", log=quiet)
+    fleet = Fleet(queue)
+    try:
+        rum = fleet.station("rum", RUM)
+        gin = fleet.station("gin", GIN)
+        ids = [queue.add(f"m{i}", name).id for i, name in enumerate(["Rum Coke", "Gin Tonic", "Gin Tonic"])]
+        assert wait_for(lambda: sum(kind == "ready" for kind, _ in fleet.events) == 3)
+        assert (rum.poured, gin.poured) == (1, 2)
+        for order_id in ids:
+            assert ("pouring", order_id) in fleet.events
+        assert fleet.coordinator.can_make(DRINKS["gin tonic"])
+        assert fleet.coordinator.missing({"name": "Mojito", "ingredients": {"rum": 50, "mint": 5}}) == ["mint"]
+    finally:
+        fleet.stop()
+
+
+def test_orders_stay_queued_until_a_station_can_make_them():
+    queue = OrderQueue(":memory:", log=quiet)
+    fleet = Fleet(queue)
+    try:
+        fleet.station("rum", RUM)
+        queue.add("m1", "Gin Tonic")
+        time.sleep(0.3)
+        assert fleet.events == []
+        gin = fleet.station("gin", GIN)
+        assert wait_for(lambda: ("ready", 1) in fleet.events)
+        assert gin.poured == 1
+    finally:
+        fleet.stop()
+
+
+def test_an_order_a_station_cannot_cover_goes_to_another_station():
+    queue = OrderQueue(":memory:", log=quiet)
+    fleet = Fleet(queue)
+    try:
+        empty = fleet.station("empty", GIN, admit=lambda drink: False)
+        full = fleet.station("full", GIN)
+        # with both idle the first station connected is chosen first
+        order = queue.add("m1", "Gin Tonic")
+        assert wait_for(lambda: ("ready", order.id) in fleet.events)
+        assert (empty.refused, empty.poured, full.poured) == (1, 0, 1)
+    finally:
+        fleet.stop()
+
+
+def test_an_order_every_station_refuses_fails():
+    queue = OrderQueue(":memory:", log=quiet)
+    fleet = Fleet(queue)
+    try:
+        fleet.station("rum", RUM)
+        empty = fleet.station("empty", GIN, admit=lambda drink: False)
+        order = queue.add("m1", "Gin Tonic")
+        assert wait_for(lambda: ("failed", order.id) in fleet.events)
+        assert empty.poured == 0
+        assert ("pouring", order.id) not in fleet.events
+    finally:
+        fleet.stop()
+
+
+def test_a_station_gives_back_what_it_reserved_for_drinks_it_never_started():
+    queue = OrderQueue(":memory:", log=quiet)
+    fleet = Fleet(queue)
+    reserved = []
+    try:
+        gate = threading.Event()
+        station = fleet.station("gin", GIN, admit=lambda drink: reserved.append(drink["name"]) or True,
+                                release=lambda drink: reserved.remove(drink["name"]))
+        pour = station.pour
+        station.pour = lambda drink: gate.wait(10) and pour(drink)
+        sent = 1 + fleet.coordinator.prefetch
+        for i in range(sent + 1):
+            queue.add(f"m{i}", "Gin Tonic")
+        assert wait_for(lambda: len(reserved) == sent)
+        # the first drink is pouring; the ones behind it are dropped with the link
+        stopping = threading.Thread(target=station.stop)
+        stopping.start()
+        assert wait_for(lambda: len(reserved) == 1)
+        gate.set()
+        stopping.join()
+    finally:
+        fleet.stop()
+
+
+def test_orders_a_station_never_started_are_queued_again_after_a_crash(tmp_path):
+    path = str(tmp_path / "orders.db")
+    queue = OrderQueue(path, log=quiet)
+    fleet = Fleet(queue)
+    host, port = fleet.coordinator.address
+    # a station that takes the order and dies before starting it
+    sock = socket.create_connection((host, port))
+    try:
+        sock.sendall(json.dumps({"type": "hello", "station": "stuck", "pumps": RUM}).encode() + b"\n")
+        order = queue.add("m1", "Rum Coke")
+        message = json.loads(sock.makefile("rb").readline())
+        assert (message["type"], message["order"]) == ("pour", order.id)
+        assert state(path, order.id) == ASSIGNED
+
+        # the coordinator process dies here; the next start opens the same file
+        restarted = OrderQueue(path, log=quiet)
+        assert [o.id for o in restarted.pending()] == [order.id]
+        assert state(path, order.id) == QUEUED
+        restarted.close()
+    finally:
+        sock.close()
+        fleet.stop()
+
+
+def test_an_order_that_was_pouring_is_not_poured_again(tmp_path):
+    path = str(tmp_path / "orders.db")
+    queue = OrderQueue(path, log=quiet)
+    started = queue.add("m1", "Rum Coke")
+    queue.get(timeout=0, state=ASSIGNED)
+    queue.begin(started)
+    finished = queue.add("m2", "Rum Coke")
+    queue.get(timeout=0, state=ASSIGNED)
+    queue.complete(finished, DONE)
+    queue.close()
+
+    restarted = OrderQueue(path, log=quiet)
+    assert restarted.pending() == []
+    restarted.close()
+    assert (state(path, started.id), state(path, finished.id)) == (INTERRUPTED, DONE)
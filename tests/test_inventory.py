@@ -0,0 +1,133 @@
+"""Inventory reservations, consumption and the shared JSONL log."""
+import json
+
+import pytest
+
+from inventory import Inventory
+from pour_scheduler import PourJob
+from pump_index import PumpIndex
+
+PUMPS = {"pump_1": {"name": "Pump 1", "pin": 11, "value": "rum"},
+         "pump_2": {"name": "Pump 2", "pin": 12, "value": "coke"},
+         "pump_3": {"name": "Pump 3", "pin": 13, "value": "rum"}}
+RUM_COKE = {"name": "Rum Coke", "ingredients": {"rum": 50, "coke": 150}}
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "inventory.log")
+
+
+def inventory(path, reserve=20.0):
+    return Inventory(PumpIndex(PUMPS), path, reserve=reserve, log=quiet)
+
+
+def test_untracked_pumps_never_limit_a_drink(path):
+    stock = inventory(path)
+    assert stock.stock("rum") is None
+    assert stock.reserve_for(RUM_COKE)
+    assert stock.shortages({"name": "Mojito", "ingredients": {"mint": 5}}) == ["mint"]
+
+
+def test_reservations_count_against_stock_until_released(path):
+    stock = inventory(path)
+    stock.refill("pump_1", 100)
+    stock.refill("pump_3", 100)
+    stock.refill("pump_2", 520)
+    # 80 + 80 mL of rum above the reserve, 500 of coke
+    assert stock.stock("rum") == 160
+    assert stock.reserve_for(RUM_COKE)
+    assert stock.reserve_for(RUM_COKE)
+    assert stock.reserve_for(RUM_COKE)
+    assert stock.committed["rum"] == 150
+    assert not stock.reserve_for(RUM_COKE)                 # rum: 160 - 150 < 50, coke: 500 - 450 < 150
+    assert stock.committed["coke"] == 450                  # a refused drink reserves nothing
+    assert stock.shortages(RUM_COKE) == ["rum", "coke"]
+    stock.release(RUM_COKE)
+    assert stock.committed["coke"] == 300
+    assert stock.reserve_for(RUM_COKE)
+    for _ in range(5):
+        stock.release(RUM_COKE)
+    assert stock.committed["rum"] == stock.committed["coke"] == 0
+
+
+def test_running_out_hides_the_ingredient(path):
+    stock = inventory(path)
+    index = stock.index
+    stock.refill("pump_2", 170)
+    mask = index.requirement(RUM_COKE["ingredients"])
+    assert stock.can_make(mask)
+    assert stock.reserve_for(RUM_COKE)
+    assert not stock.can_make(mask)                        # the rest is promised
+    stock.release(RUM_COKE)
+    assert stock.can_make(mask)
+    assert stock.consume([("pump_2", 150)]) == index.bit("coke")
+    assert not stock.can_make(mask)
+
+
+def test_consume_jobs_scales_volume_by_the_time_actually_run(path):
+    stock = inventory(path)
+    stock.refill("pump_1", 500)
+    stock.refill("pump_2", 500)
+    full = PourJob(11, 10.0, "rum", "pump_1", 40.0)
+    full.actual = 10.2                                     # overran: never more than planned
+    half = PourJob(12, 8.0, "coke", "pump_2", 100.0)
+    half.actual = 4.0
+    untracked = PourJob(13, 5.0, "rum", "pump_3", 25.0)
+    untracked.actual = 5.0
+    stock.consume_jobs([full, half, untracked])
+    assert stock.levels == {"pump_1": 460.0, "pump_2": 450.0}
+
+
+def test_sync_applies_lines_another_writer_appended(path):
+    daemon = inventory(path)
+    console = inventory(path)
+    console.refill("pump_2", 300)
+    console.consume([("pump_2", 25)])
+    assert daemon.levels == {}
+    assert daemon.sync() == 0                              # coke was not out before or after
+    assert daemon.levels == {"pump_2": 275.0}
+    daemon.consume([("pump_2", 275)])
+    assert console.sync() == console.index.bit("coke")
+    assert console.levels == {"pump_2": 0.0}
+    # its own lines are not applied twice
+    assert daemon.sync() == 0
+    assert daemon.levels == {"pump_2": 0.0}
+
+
+def test_sync_leaves_a_partial_last_line_for_later(path):
+    stock = inventory(path)
+    line = json.dumps({"w": "other", "pump": "pump_2", "set": 400}) + "\n"
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line[:20])
+    stock.sync()
+    assert stock.levels == {}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line[20:])
+        f.write("not json\n")
+    stock.sync()
+    assert stock.levels == {"pump_2": 400.0}
+
+
+def test_compact_keeps_the_levels_in_one_line_per_pump(path):
+    stock = inventory(path)
+    stock.refill("pump_1", 700)
+    stock.refill("pump_2", 1000)
+    for _ in range(20):
+        stock.consume([("pump_1", 10), ("pump_2", 12.5)])
+    stock.refill("pump_3", 300)
+    stock.refill("pump_3", None)
+    stock.compact()
+    with open(path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert [(entry["pump"], entry["set"]) for entry in lines] == [("pump_1", 500.0), ("pump_2", 750.0)]
+    assert inventory(path).levels == {"pump_1": 500.0, "pump_2": 750.0}
+    # appends after compacting still reach other readers
+    other = inventory(path)
+    stock.consume([("pump_1", 100)])
+    other.sync()
+    assert other.levels["pump_1"] == 400.0
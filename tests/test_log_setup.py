@@ -0,0 +1,58 @@
+"""Queued logging: what the listener writes and what the caller pays for."""
+import io
+import json
+import logging
+
+import pytest
+
+import log_setup
+
+
+class Counted(object):
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "counted"
+
+
+@pytest.fixture
+def logs(tmp_path):
+    stream = io.StringIO()
+    events = tmp_path / "events.jsonl"
+    log_setup.configure("info", str(events), stream)
+    yield stream, events
+    log_setup.stop()
+    logging.getLogger().handlers.clear()
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def test_arguments_changed_after_the_call_are_logged_as_they_were(logs):
+    stream, events = logs
+    glasses = ["D1"]
+    logging.getLogger("bartender").info("Queue: %s", glasses)
+    glasses.append("D2")
+    log_setup.stop()
+    assert stream.getvalue() == "[INFO] Queue: ['D1']\n"
+    assert json.loads(events.read_text())["msg"] == "Queue: ['D1']"
+
+
+def test_disabled_levels_never_format_their_arguments(logs):
+    counted = Counted()
+    logging.getLogger("bartender").debug("menu %s", counted)
+    logging.getLogger("bartender").info("menu %s", counted)
+    log_setup.stop()
+    assert counted.formatted == 1
+
+
+def test_the_event_log_keeps_exceptions_and_extra_fields(logs):
+    stream, events = logs
+    try:
+        raise ValueError("bad pin")
+    except ValueError:
+        logging.getLogger("bartender").exception("Pin %s failed", 11, extra={"event": {"pin": 11}})
+    log_setup.stop()
+    entry = json.loads(events.read_text())
+    assert (entry["msg"], entry["pin"]) == ("Pin 11 failed", 11)
+    assert "ValueError: bad pin" in entry["exc"]
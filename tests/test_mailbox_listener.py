@@ -0,0 +1,187 @@
+"""MailboxListener against FakeIMAPServer: IDLE pickup and bulk fetches."""
+import imaplib
+import threading
+import time
+
+from fake_mail import FakeIMAPServer
+from mailbox_listener import MailboxListener, fetch_text_bodies, mark_seen
+
+SENDER = "phone@sms.example.com"
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def listen(server, handler, **kwargs):
+    host, port = server.address
+    listener = MailboxListener(host, "user", "pass", port=port, imap_class=imaplib.IMAP4,
+                               backoff_initial=0.05, log=quiet, **kwargs)
+    thread = threading.Thread(target=listener.listen, args=(handler,), daemon=True)
+    thread.start()
+    return listener, thread
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def unseen_bodies(mail):
+    typ, data = mail.uid("SEARCH", None, "UNSEEN")
+    bodies = fetch_text_bodies(mail, data[0].split())
+    mark_seen(mail, list(bodies))
+    return sorted(text.strip() for text in bodies.values())
+
+
+def test_mail_arriving_while_idle_wakes_the_listener():
+    with FakeIMAPServer() as server:
+        seen = []
+        got = threading.Event()
+
+        def handler(mail):
+            seen.extend(unseen_bodies(mail))
+            if seen:
+                got.set()
+
+        listener, thread = listen(server, handler)
+        try:
+            time.sleep(0.2)
+            server.deliver(SENDER, "Coffee Decision", "D1")
+            assert got.wait(2)
+            assert seen == ["D1"]
+        finally:
+            listener.stop()
+            thread.join(2)
+
+
+def test_mail_arriving_during_the_handler_is_picked_up_at_once():
+    # the server reports it in the response to the handler's own commands,
+    # not again once IDLE starts; it must not wait for the IDLE timeout
+    with FakeIMAPServer() as server:
+        server.deliver(SENDER, "Coffee Decision", "D1")
+        seen = []
+        both = threading.Event()
+
+        def handler(mail):
+            typ, data = mail.uid("SEARCH", None, "UNSEEN")
+            if not seen:
+                server.deliver(SENDER, "Coffee Decision", "D2")
+            bodies = fetch_text_bodies(mail, data[0].split())
+            mark_seen(mail, list(bodies))
+            seen.extend(text.strip() for text in bodies.values())
+            if len(seen) >= 2:
+                both.set()
+
+        listener, thread = listen(server, handler, idle_timeout=30)
+        try:
+            assert both.wait(2)
+            assert sorted(seen) == ["D1", "D2"]
+        finally:
+            listener.stop()
+            thread.join(2)
+
+
+def test_mail_after_an_expunge_during_idle_is_picked_up_at_once():
+    # an EXPUNGE seen while idling shrinks the count; otherwise the next
+    # message only brings it back to the stale count and looks like nothing new
+    with FakeIMAPServer() as server:
+        first = server.deliver(SENDER, "Coffee Decision", "D1")
+        server.deliver(SENDER, "Coffee Decision", "D2")
+        seen = []
+        runs = []
+        deliver_next = threading.Event()
+        delivered = []
+        got = threading.Event()
+
+        def handler(mail):
+            typ, data = mail.uid("SEARCH", None, "UNSEEN")
+            if deliver_next.is_set():
+                deliver_next.clear()
+                delivered.append(time.monotonic())
+                server.deliver(SENDER, "Coffee Decision", "D3")
+                # reported in this command's response, not once IDLE starts
+                mail.noop()
+            bodies = fetch_text_bodies(mail, data[0].split())
+            mark_seen(mail, list(bodies))
+            seen.extend(text.strip() for text in bodies.values())
+            runs.append(time.monotonic())
+            if "D3" in seen:
+                got.set()
+
+        listener, thread = listen(server, handler, idle_timeout=1.0)
+        try:
+            assert wait_for(lambda: sorted(seen) == ["D1", "D2"])
+            time.sleep(0.2)
+            server.expunge([first])
+            time.sleep(0.2)
+            # D3 arrives during the handler run that follows the idle timeout
+            deliver_next.set()
+            assert got.wait(3)
+            assert runs[-1] - delivered[0] < 0.5
+        finally:
+            listener.stop()
+            thread.join(2)
+
+
+def test_fake_server_reports_expunged_messages():
+    with FakeIMAPServer() as server:
+        uids = [server.deliver(SENDER, "Coffee Decision", f"D{i}") for i in range(1, 4)]
+        host, port = server.address
+        with imaplib.IMAP4(host, port) as mail:
+            mail.login("user", "pass")
+            mail.select("inbox")
+            mail.uid("STORE", str(uids[0]), "+FLAGS", "(\\Deleted)")
+            typ, expunged = mail.expunge()
+            assert expunged == [b"1"]
+            server.expunge([uids[2]])
+            typ, data = mail.noop()
+            assert mail.response("EXPUNGE")[1] == [b"2"]
+            assert unseen_bodies(mail) == ["D2"]
+            mail.logout()
+
+
+def test_listener_reconnects_after_the_connection_drops():
+    with FakeIMAPServer() as server:
+        seen = []
+        got = threading.Event()
+
+        def handler(mail):
+            seen.extend(unseen_bodies(mail))
+            if seen:
+                got.set()
+
+        listener, thread = listen(server, handler)
+        try:
+            time.sleep(0.2)
+            server.drop_connections()
+            server.deliver(SENDER, "Coffee Decision", "D3")
+            assert got.wait(3)
+            assert seen == ["D3"]
+            assert listener.connects >= 2
+        finally:
+            listener.stop()
+            thread.join(2)
+
+
+def test_delivery_does_not_block_on_a_session_that_is_not_idling():
+    with FakeIMAPServer() as server:
+        host, port = server.address
+        with imaplib.IMAP4(host, port) as mail:
+            mail.login("user", "pass")
+            mail.select("inbox")
+            delivered = threading.Event()
+
+            def deliver():
+                for i in range(2000):
+                    server.deliver(SENDER, "Coffee Decision", f"D{i % 7 + 1}")
+                delivered.set()
+
+            threading.Thread(target=deliver, daemon=True).start()
+            assert delivered.wait(30)
+            assert len(unseen_bodies(mail)) == 2000
+            mail.logout()
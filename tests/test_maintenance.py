@@ -0,0 +1,106 @@
+"""Maintenance cycles giving way to pours, and priming accounting."""
+import threading
+import time
+
+import pytest
+
+import maintenance
+from flow_model import PRIME_VOLUME, prime_time
+from maintenance import Maintenance
+from pour_scheduler import PourJob, PourScheduler
+from pump_driver import SimulatedPumpDriver, SystemClock
+
+PUMPS = {"pump_1": {"name": "Pump 1", "pin": 11, "value": "rum", "flow_rate": 0.5},
+         "pump_2": {"name": "Pump 2", "pin": 12, "value": "coke"},
+         "pump_3": {"name": "Pump 3", "pin": 13, "value": None}}
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def machine(**kwargs):
+    pumps = SimulatedPumpDriver(clock=SystemClock())
+    pumps.setup(p["pin"] for p in PUMPS.values())
+    scheduler = PourScheduler(pumps.on, pumps.off, 2)
+    return pumps, Maintenance(scheduler, dict(PUMPS), flow_rate=0.6, log=quiet, **kwargs)
+
+
+def test_cleaning_is_never_due_unless_configured():
+    pumps, upkeep = machine()
+    upkeep.poured = 1000
+    assert upkeep.due() is None
+    pumps, upkeep = machine(clean_after=3)
+    upkeep.poured = 3
+    kind, jobs = upkeep.due()
+    assert kind == "clean"
+    assert sorted(job.pump for job in jobs) == sorted(PUMPS)
+
+
+def test_a_pour_stops_a_running_cycle_at_once():
+    pumps, upkeep = machine(clean_after=1, clean_seconds=5.0)
+    upkeep.poured = 1
+    cycle = threading.Thread(target=upkeep._run, args=upkeep.due())
+    cycle.start()
+    deadline = time.monotonic() + 2
+    while not pumps.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(pumps.running) == 2
+    start = time.monotonic()
+    with upkeep.pouring():
+        waited = time.monotonic() - start
+        assert pumps.running == {}
+    cycle.join(2)
+    assert waited < 0.5
+    assert upkeep.cycles == {"prime": 0, "clean": 0, "aborted": 1}
+    # the pumps it did not finish are cleaned in the next idle window
+    assert upkeep.to_clean
+    assert upkeep.due()[0] == "clean"
+
+
+def test_changed_bottles_are_primed_when_idle(monkeypatch):
+    monkeypatch.setattr(maintenance, "POLL", 0.01)
+    pumps, upkeep = machine(idle_after=0.0)
+    upkeep.update(dict(PUMPS, pump_3=dict(PUMPS["pump_3"], value="lime", flow_rate=0.01)))
+    assert upkeep.unprimed == {"pump_3"}
+    upkeep.start()
+    try:
+        deadline = time.monotonic() + 10
+        while upkeep.unprimed and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        upkeep.stop()
+    assert upkeep.unprimed == set()
+    assert upkeep.cycles["prime"] == 1
+
+
+def test_pour_on_an_unprimed_pump_adds_its_prime_time_and_volume():
+    pumps, upkeep = machine()
+    upkeep.prime(["pump_1", "pump_2", "pump_3"])
+    assert upkeep.unprimed == {"pump_1", "pump_2"}      # pump_3 holds nothing
+    rum = PourJob(11, 10.0, "rum", "pump_1", 20.0)
+    coke = PourJob(12, 6.0, "coke", "pump_2", 10.0)
+    seconds = prime_time(PUMPS["pump_1"], 0.6)
+    with upkeep.pouring([rum, coke]):
+        assert rum.duration == pytest.approx(10.0 + seconds)
+        assert rum.volume == pytest.approx(20.0 + PRIME_VOLUME)
+        assert coke.volume == pytest.approx(10.0 + PRIME_VOLUME)
+        rum.actual, coke.actual = rum.duration - 0.001, 6.0
+    assert upkeep.unprimed == set()
+
+
+def test_a_run_cut_short_before_the_line_filled_stays_unprimed():
+    pumps, upkeep = machine()
+    upkeep.prime(["pump_1", "pump_2"])
+    rum = PourJob(11, 10.0, "rum", "pump_1", 20.0)
+    coke = PourJob(12, 6.0, "coke", "pump_2", 10.0)
+    with pytest.raises(RuntimeError):
+        with upkeep.pouring([rum, coke]):
+            rum.actual = prime_time(PUMPS["pump_1"], 0.6) + 0.5    # line full, drink cut short
+            coke.actual = 0.5                                       # stopped while filling
+            raise RuntimeError("pour failed")
+    assert upkeep.unprimed == {"pump_2"}
+    # a pump that never switched on is not primed either
+    with upkeep.pouring([PourJob(12, 6.0, "coke", "pump_2", 10.0)]):
+        pass
+    assert upkeep.unprimed == {"pump_2"}
@@ -0,0 +1,203 @@
+"""OrderPipeline against FakeIMAPServer with an on-disk queue: exactly-once intake and crash recovery."""
+import imaplib
+import sqlite3
+import threading
+import time
+
+import order_pipeline
+from fake_mail import FakeIMAPServer
+from mailbox_listener import MailboxListener, fetch_text_bodies
+from order_pipeline import OrderPipeline
+from order_queue import DONE, FAILED, INTERRUPTED, OrderQueue
+
+SENDER = "phone@sms.example.com"
+DRINKS = {"rum coke": {"name": "Rum Coke", "ingredients": {"rum": 50, "coke": 150}},
+          "gin tonic": {"name": "Gin Tonic", "ingredients": {"gin": 50, "tonic": 150}}}
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def fetch(mail):
+    mail.select("inbox")
+    typ, data = mail.uid("SEARCH", None, "UNSEEN")
+    return [(uid, text.strip().lower()) for uid, text in fetch_text_bodies(mail, data[0].split()).items()]
+
+
+def find_drink(name):
+    return DRINKS.get(name.lower())
+
+
+def states(path):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("SELECT message_key, drink, state FROM orders ORDER BY id").fetchall()
+    finally:
+        db.close()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def listener_for(server):
+    host, port = server.address
+    return MailboxListener(host, "user", "pass", port=port, imap_class=imaplib.IMAP4,
+                           backoff_initial=0.05, log=quiet)
+
+
+def connect(server):
+    host, port = server.address
+    mail = imaplib.IMAP4(host, port)
+    mail.login("user", "pass")
+    return mail
+
+
+class Recorder(object):
+    def __init__(self):
+        self.events = []
+        self.poured = []
+
+    def notify(self, kind, order):
+        self.events.append((kind, order.drink))
+
+    def pour(self, drink):
+        self.poured.append(drink["name"])
+
+
+def test_each_message_becomes_one_order_and_is_poured_once(tmp_path):
+    path = str(tmp_path / "orders.db")
+    with FakeIMAPServer() as server:
+        uids = [server.deliver(SENDER, "Coffee Decision", name) for name in ["Rum Coke", "Gin Tonic"]]
+        record = Recorder()
+        pipeline = OrderPipeline(listener_for(server), OrderQueue(path, log=quiet), fetch, find_drink,
+                                 record.pour, record.notify, log=quiet).start()
+        thread = threading.Thread(target=pipeline.run, daemon=True)
+        thread.start()
+        try:
+            assert wait_for(lambda: len(record.poured) == 2)
+            server.deliver(SENDER, "Coffee Decision", "Rum Coke")
+            assert wait_for(lambda: len(record.poured) == 3)
+            # the listener keeps waking for new mail; nothing is taken twice
+            time.sleep(0.3)
+        finally:
+            pipeline.stop(2)
+            thread.join(2)
+        assert sorted(record.poured) == ["Gin Tonic", "Rum Coke", "Rum Coke"]
+        assert [kind for kind, _ in record.events].count("accepted") == 3
+        for uid in uids:
+            assert "\\Seen" in server.flags(uid)
+    rows = states(path)
+    assert len(rows) == len({key for key, _, _ in rows}) == 3
+    assert {state for _, _, state in rows} == {DONE}
+
+
+def test_a_crash_before_the_messages_are_marked_does_not_duplicate_the_order(tmp_path, monkeypatch):
+    path = str(tmp_path / "orders.db")
+    with FakeIMAPServer() as server:
+        uid = server.deliver(SENDER, "Coffee Decision", "Rum Coke")
+
+        def crash(mail, uids):
+            raise OSError("power cut")
+
+        monkeypatch.setattr(order_pipeline, "mark_seen", crash)
+        mail = connect(server)
+        queue = OrderQueue(path, log=quiet)
+        record = Recorder()
+        try:
+            OrderPipeline(listener_for(server), queue, fetch, find_drink, record.pour, record.notify,
+                          log=quiet).intake(mail)
+        except OSError:
+            pass
+        finally:
+            mail.logout()
+            queue.close()
+        assert "\\Seen" not in server.flags(uid)
+
+        # the next start sees the same unread message
+        monkeypatch.undo()
+        mail = connect(server)
+        restarted = OrderQueue(path, log=quiet)
+        try:
+            OrderPipeline(listener_for(server), restarted, fetch, find_drink, record.pour, record.notify,
+                          log=quiet).intake(mail)
+        finally:
+            mail.logout()
+            restarted.close()
+        assert "\\Seen" in server.flags(uid)
+    assert [(drink, state) for _, drink, state in states(path)] == [("Rum Coke", "queued")]
+    assert record.events == [("accepted", "Rum Coke")]
+
+
+def test_an_order_cut_off_mid_pour_is_interrupted_and_not_poured_again(tmp_path):
+    path = str(tmp_path / "orders.db")
+    with FakeIMAPServer() as server:
+        server.deliver(SENDER, "Coffee Decision", "Rum Coke")
+        gate = threading.Event()
+        record = Recorder()
+
+        def stuck(drink):
+            record.pour(drink)
+            gate.wait(10)
+
+        queue = OrderQueue(path, log=quiet)
+        pipeline = OrderPipeline(listener_for(server), queue, fetch, find_drink, stuck, record.notify,
+                                 log=quiet).start()
+        mail = connect(server)
+        try:
+            pipeline.intake(mail)
+            assert wait_for(lambda: record.poured == ["Rum Coke"])
+
+            # the machine loses power here; the next start opens the same file
+            restarted = OrderQueue(path, log=quiet)
+            again = Recorder()
+            second = OrderPipeline(listener_for(server), restarted, fetch, find_drink, again.pour, again.notify,
+                                   log=quiet).start()
+            time.sleep(0.3)
+            second._stopping = True
+            second._worker.join(2)
+            restarted.close()
+            assert again.poured == []
+            assert [state for _, _, state in states(path)] == [INTERRUPTED]
+        finally:
+            mail.logout()
+            gate.set()
+            pipeline.stop(2)
+
+
+def test_an_order_that_fails_before_the_pour_gives_back_its_reservation(tmp_path):
+    path = str(tmp_path / "orders.db")
+    menu = dict(DRINKS)
+    reserved = []
+    released = []
+    with FakeIMAPServer() as server:
+        server.deliver(SENDER, "Coffee Decision", "Gin Tonic")
+        record = Recorder()
+
+        def admit(drink):
+            reserved.append(drink["name"])
+            return True
+
+        queue = OrderQueue(path, log=quiet)
+        pipeline = OrderPipeline(listener_for(server), queue, fetch, lambda name: menu.get(name.lower()),
+                                 record.pour, record.notify, log=quiet, admit=admit,
+                                 release=lambda order: released.append(order.drink))
+        mail = connect(server)
+        try:
+            pipeline.intake(mail)
+            # the drink leaves the menu before the worker gets to it
+            del menu["gin tonic"]
+            pipeline.start()
+            assert wait_for(lambda: ("failed", "Gin Tonic") in record.events)
+        finally:
+            mail.logout()
+            pipeline.stop(2)
+    assert reserved == released == ["Gin Tonic"]
+    assert record.poured == []
+    assert [state for _, _, state in states(path)] == [FAILED]
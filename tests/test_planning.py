@@ -0,0 +1,98 @@
+"""PourPlanner plans, timelines and the FIFO comparison."""
+import pytest
+
+from order_queue import OrderQueue
+from pour_planner import SAVED, PourPlanner, compare_fifo, plan_queue, validate
+
+PUMPS = {f"pump_{i}": {"name": f"Pump {i}", "pin": 10 + i, "value": value}
+         for i, value in enumerate(("rum", "coke", "lime", "gin", "tonic", None), 1)}
+DRINKS = [
+    {"name": "Rum Coke", "ingredients": {"rum": 50, "coke": 150}},
+    {"name": "Gin Tonic", "ingredients": {"gin": 50, "tonic": 150, "lime": 10}},
+    {"name": "Shot", "ingredients": {"rum": 40}},
+    {"name": "Lime Soda", "ingredients": {"lime": 30, "coke": 100}},
+    {"name": "Mojito", "ingredients": {"rum": 50, "mint": 10}},
+]
+MAKEABLE = DRINKS[:4]
+
+
+def plans_recorded():
+    return sum(int(line.split()[-1]) for line in SAVED.lines() if line.startswith(SAVED.name + "_count"))
+
+
+def orders(count):
+    return [(i, MAKEABLE[i % len(MAKEABLE)]) for i in range(count)]
+
+
+@pytest.mark.parametrize("positions,max_concurrent,lookahead", [(1, None, 1), (2, 3, 3), (3, 2, 2), (2, None, 4)])
+def test_plans_never_double_book_a_pump_or_exceed_the_caps(positions, max_concurrent, lookahead):
+    planner = PourPlanner(PUMPS, max_concurrent=max_concurrent, positions=positions, lookahead=lookahead)
+    plan = validate(planner.plan(orders(12)))
+    assert sorted(d.order for d in plan.drinks) == list(range(12))
+
+
+def test_timeline_lists_every_run_of_every_drink_in_order():
+    plan = PourPlanner(PUMPS, max_concurrent=2, positions=2).plan(orders(4))
+    timeline = plan.timeline()
+    assert len(timeline) == len(plan.jobs())
+    at = 0
+    for drink in plan.drinks:
+        runs = timeline[at:at + len(drink.jobs)]
+        at += len(drink.jobs)
+        assert [start for start, end, pin, name, label in runs] == sorted(start for start, *rest in runs)
+        for start, end, pin, name, label in runs:
+            assert name == drink.drink["name"]
+            assert drink.start <= start < end <= drink.end
+    assert max(end for start, end, pin, name, label in timeline) == plan.makespan
+
+
+def test_one_position_pours_in_arrival_order_with_changeover_between_drinks():
+    plan = PourPlanner(PUMPS, positions=1, changeover=10.0).plan(orders(3))
+    assert [d.order for d in plan.drinks] == [0, 1, 2]
+    for before, after in zip(plan.drinks, plan.drinks[1:]):
+        assert after.start == pytest.approx(before.end + 10.0)
+
+
+def test_validate_reports_a_double_booked_pump():
+    plan = PourPlanner(PUMPS, positions=2, changeover=0.0).plan(orders(2))
+    first, second = plan.drinks
+    rum = next(j for j in first.jobs if j.pin == PUMPS["pump_1"]["pin"])
+    clash = second.jobs[0]
+    clash.pin, clash.start, clash.end = rum.pin, rum.start, rum.end
+    with pytest.raises(ValueError, match="double-booked"):
+        validate(plan)
+
+
+def test_planning_ahead_is_never_slower_than_fifo():
+    planner = PourPlanner(PUMPS, max_concurrent=3, positions=2, lookahead=3)
+    fifo, planned, saved, improvement = compare_fifo(planner, orders(10))
+    validate(fifo)
+    validate(planned)
+    assert planned.makespan <= fifo.makespan
+    assert saved == pytest.approx(fifo.makespan - planned.makespan)
+
+
+def test_the_queued_orders_are_planned_and_the_saving_recorded(tmp_path):
+    path = str(tmp_path / "orders.db")
+    queue = OrderQueue(path, log=lambda *args: None)
+    for i, drink in enumerate(DRINKS):
+        queue.add(f"m{i}", drink["name"])
+    queue.add("m9", "Unknown Drink")
+    taken = queue.get(timeout=0)
+    queue.close()
+
+    by_name = {d["name"].lower(): d for d in DRINKS}
+    before = plans_recorded()
+    reader = OrderQueue(path, read_only=True)
+    try:
+        pending = reader.pending()
+    finally:
+        reader.close()
+    planner = PourPlanner(PUMPS, max_concurrent=3, positions=2, lookahead=2)
+    fifo, planned, saved, improvement = plan_queue(planner, pending, lambda name: by_name.get(name.lower()))
+    # the order already pouring, the unknown drink and the Mojito (no mint) are left out
+    assert [d.order for d in fifo.drinks] == [o.id for o in pending if o.drink in ("Gin Tonic", "Shot", "Lime Soda")]
+    assert taken.drink == "Rum Coke"
+    assert saved == fifo.makespan - planned.makespan > 0
+    assert plans_recorded() == before + 1
+    assert plan_queue(planner, pending[:1], lambda name: by_name.get(name.lower())) is None
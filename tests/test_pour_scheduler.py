@@ -0,0 +1,71 @@
+"""PourScheduler.execute on a virtual clock: the concurrency cap and full on-times."""
+import pytest
+
+from pour_scheduler import PourJob, PourScheduler, makespan, plan_pours
+from pump_driver import RecordingPumpDriver, SimulatedPumpDriver, VirtualClock
+
+
+def scheduler_for(pumps, max_concurrent, switch_on=None):
+    return PourScheduler(switch_on or pumps.on, pumps.off, max_concurrent,
+                         clock=pumps.clock.now, sleep=pumps.clock.sleep)
+
+
+def most_on_at_once(events):
+    on = peak = 0
+    for at, pin, action in events:
+        on += 1 if action == "on" else -1
+        peak = max(peak, on)
+    return peak
+
+
+@pytest.mark.parametrize("max_concurrent", [1, 2, 3, None])
+def test_a_plan_never_runs_more_pumps_than_the_cap(max_concurrent):
+    pumps = RecordingPumpDriver(SimulatedPumpDriver(clock=VirtualClock()))
+    jobs = [PourJob(pin, duration) for pin, duration in zip(range(11, 17), [5.0, 3.0, 2.0, 4.0, 1.0, 2.5])]
+    start = pumps.clock.now()
+    plan = scheduler_for(pumps, max_concurrent).execute(plan_pours(jobs, max_concurrent))
+
+    assert pumps.driver.peak == min(len(jobs), max_concurrent or len(jobs))
+    assert most_on_at_once(pumps.events) == pumps.driver.peak
+    for job in plan:
+        assert pumps.driver.on_time[job.pin] == pytest.approx(job.duration)
+        assert job.actual == pytest.approx(job.duration)
+    assert pumps.clock.now() - start == pytest.approx(makespan(plan))
+    assert not pumps.driver.running
+
+
+def test_a_pump_that_starts_late_still_gets_its_full_on_time():
+    clock = VirtualClock()
+    pumps = SimulatedPumpDriver(clock=clock)
+
+    def slow_on(pin):
+        # this relay takes a second to switch, so its pump starts late
+        if pin == 12:
+            clock.sleep(1.0)
+        pumps.on(pin)
+
+    long, late, last = PourJob(11, 5.0), PourJob(12, 3.0), PourJob(13, 2.0)
+    plan = plan_pours([long, late, last], 2)
+    assert (late.end, last.start) == (3.0, 3.0)
+    started = {}
+    scheduler_for(pumps, 2, slow_on).execute(plan, on_start=lambda job: started.setdefault(job.pin, clock.now()))
+
+    assert pumps.peak == 2
+    assert pumps.on_time == {11: pytest.approx(5.0), 12: pytest.approx(3.0), 13: pytest.approx(2.0)}
+    # the last job waits for the late pump's slot instead of starting on time with three on
+    assert started[13] == pytest.approx(started[12] + 3.0)
+    assert started[13] > last.start
+
+
+def test_every_pump_is_switched_off_when_a_run_fails():
+    pumps = SimulatedPumpDriver(clock=VirtualClock())
+
+    def failing(job):
+        if job.pin == 12:
+            raise RuntimeError("sensor fault")
+
+    jobs = plan_pours([PourJob(11, 4.0), PourJob(12, 1.0)])
+    with pytest.raises(RuntimeError):
+        scheduler_for(pumps, None).execute(jobs, on_finish=failing)
+    assert not pumps.running
+    assert pumps.on_time[11] == pytest.approx(1.0)
@@ -0,0 +1,60 @@
+"""Simulator replays of Poisson and recorded traces."""
+import pytest
+
+from order_queue import OrderQueue, REJECTED
+from simulator import Simulator, load_trace, poisson_trace
+
+PUMPS = {f"pump_{i}": {"name": f"Pump {i}", "pin": 10 + i, "value": value}
+         for i, value in enumerate(("rum", "coke", "lime", "gin", "tonic", None), 1)}
+DRINKS = [
+    {"name": "Rum Coke", "ingredients": {"rum": 50, "coke": 150}},
+    {"name": "Gin Tonic", "ingredients": {"gin": 50, "tonic": 150, "lime": 10}},
+    {"name": "Shot", "ingredients": {"rum": 40}},
+    {"name": "Lime Soda", "ingredients": {"lime": 30, "coke": 100}},
+    {"name": "Mojito", "ingredients": {"rum": 50, "mint": 10}},
+]
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def test_simulator_rejects_drinks_the_pumps_cannot_make():
+    simulator = Simulator(PUMPS, DRINKS, changeover=10.0)
+    assert simulator.plan("Mojito") is None
+    assert simulator.plan("no such drink") is None
+    result = simulator.run([(0.0, "Rum Coke"), (1.0, "Mojito"), (2.0, "shot")])
+    assert (result.served, result.rejected) == (2, 1)
+    duration, runs = simulator.plan("Rum Coke")
+    assert result.waits == [0.0, pytest.approx(duration + 10.0 - 2.0)]
+
+
+def test_simulator_replays_a_poisson_trace_deterministically():
+    simulator = Simulator(PUMPS, DRINKS, max_concurrent=2)
+    trace = poisson_trace(60, 3600, DRINKS, seed=3)
+    first, again = simulator.run(trace), simulator.run(poisson_trace(60, 3600, DRINKS, seed=3))
+    assert first.served + first.rejected == len(trace)
+    assert (first.served, first.waits, first.end) == (again.served, again.waits, again.end)
+    assert all(0.0 <= u <= 1.0 for u in first.utilisation().values())
+
+
+def test_recorded_trace_keeps_orders_rejected_at_the_time(tmp_path):
+    path = str(tmp_path / "orders.db")
+    queue = OrderQueue(path, log=quiet)
+    queue.add("m1", "Rum Coke")
+    queue.add("m2", "Rum Coke", REJECTED)
+    queue.add("m3", "Shot")
+    queue.close()
+
+    trace = load_trace(path)
+    assert [(name, rejected) for at, name, rejected in trace] == \
+        [("Rum Coke", False), ("Rum Coke", True), ("Shot", False)]
+    assert trace[0][0] == 0.0
+    result = Simulator(PUMPS, DRINKS).run(trace)
+    assert (result.served, result.rejected) == (2, 1)
+
+
+def test_csv_trace_with_a_state_column(tmp_path):
+    path = tmp_path / "trace.csv"
+    path.write_text("time,drink,state\n105,Shot,done\n100,Rum Coke,rejected\n", encoding="utf-8")
+    assert load_trace(str(path)) == [(0.0, "Rum Coke", True), (5.0, "Shot", False)]